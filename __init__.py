@@ -145,6 +145,14 @@ feishu_upload_image = import_module_from_path(
     "feishu_upload_image",
     os.path.join(NODE_DIR, "core", "Online-api-service", "feishu", "feishu_upload_image.py")
 )
+feishu_read_range = import_module_from_path(
+    "feishu_read_range",
+    os.path.join(NODE_DIR, "core", "Online-api-service", "feishu", "feishu_read_range.py")
+)
+feishu_batch_write = import_module_from_path(
+    "feishu_batch_write",
+    os.path.join(NODE_DIR, "core", "Online-api-service", "feishu", "feishu_batch_write.py")
+)
 
 # 导入2D动画工具模块 - LayerEdit
 create_blank_document = import_module_from_path(
@@ -208,6 +216,10 @@ export_psd = import_module_from_path(
     "export_psd",
     os.path.join(NODE_DIR, "core", "2d-animation-tools", "LayerIO", "export_psd.py")
 )
+batch_export_psd = import_module_from_path(
+    "batch_export_psd",
+    os.path.join(NODE_DIR, "core", "2d-animation-tools", "LayerIO", "batch_export_psd.py")
+)
 
 
 
@@ -239,6 +251,10 @@ FeishuReadNode = feishu_read.FeishuReadNode
 FeishuWriteNode = feishu_write.FeishuWriteNode
 FeishuReadDiffNode = feishu_read_diff.FeishuReadDiffNode
 FeishuUploadImageNode = feishu_upload_image.FeishuUploadImageNode
+FeishuReadRangeNode = feishu_read_range.FeishuReadRangeNode
+FeishuRangeRowNode = feishu_read_range.FeishuRangeRowNode
+FeishuBufferedWriteNode = feishu_batch_write.FeishuBufferedWriteNode
+FeishuFlushWritesNode = feishu_batch_write.FeishuFlushWritesNode
 
 # 2D动画工具节点 - LayerEdit
 CreateBlankDocumentNode = create_blank_document.CreateBlankDocumentNode
@@ -259,6 +275,7 @@ PreviewLayerNode = preview_layer.PreviewLayerNode
 # 2D动画工具节点 - LayerIO
 ImportPSDNode = import_psd.ImportPSDNode
 ExportPSDAdvancedNode = export_psd.ExportPSDAdvancedNode
+BatchExportPSDNode = batch_export_psd.BatchExportPSDNode
 
 # -------------------------------------------------------------------
 # 注册所有节点到 ComfyUI
@@ -280,6 +297,10 @@ NODE_CLASS_MAPPINGS = {
     "FeishuWrite": FeishuWriteNode,
     "FeishuReadDiff": FeishuReadDiffNode,
     "FeishuUploadImage": FeishuUploadImageNode,
+    "FeishuReadRange": FeishuReadRangeNode,
+    "FeishuRangeRow": FeishuRangeRowNode,
+    "FeishuBufferedWrite": FeishuBufferedWriteNode,
+    "FeishuFlushWrites": FeishuFlushWritesNode,
     # 2D动画工具节点 - LayerEdit
     "CreateBlankDocument": CreateBlankDocumentNode,
     "ObtainDocumentInformation": ObtainDocumentInformationNode,
@@ -297,6 +318,7 @@ NODE_CLASS_MAPPINGS = {
     # 2D动画工具节点 - LayerIO
     "ImportPSD": ImportPSDNode,
     "ExportPSDAdvanced": ExportPSDAdvancedNode,
+    "BatchExportPSD": BatchExportPSDNode,
 }
 NODE_DISPLAY_NAME_MAPPINGS = {
     "APIKeySelector": "API Key Selector", "BaseURLSelector": "Base URL Selector",
@@ -315,6 +337,10 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "FeishuWrite": "飞书写入数据",
     "FeishuReadDiff": "飞书读取数据差",
     "FeishuUploadImage": "飞书上传图像",
+    "FeishuReadRange": "飞书读取范围",
+    "FeishuRangeRow": "飞书范围取行",
+    "FeishuBufferedWrite": "飞书缓冲写入",
+    "FeishuFlushWrites": "飞书提交写入",
     # 2D动画工具节点显示名称 - LayerEdit
     "CreateBlankDocument": "创建空白文档",
     "ObtainDocumentInformation": "获取文档信息",
@@ -332,6 +358,7 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     # 2D动画工具节点 - LayerIO
     "ImportPSD": "导入PSD文档",
     "ExportPSDAdvanced": "导出PSD文档",
+    "BatchExportPSD": "批量导出PSD文档",
 }
 
 # 导出JavaScript文件目录，使前端扩展能被加载
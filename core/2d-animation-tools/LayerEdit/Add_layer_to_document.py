@@ -1,4 +1,17 @@
-import copy
+import os
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .document_model import add_layer
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    document_model_path = os.path.join(current_dir, "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    add_layer = document_model.add_layer
 
 
 class AddLayerToDocumentNode:
@@ -27,28 +40,9 @@ class AddLayerToDocumentNode:
         document = kwargs.get("文档")
         layer = kwargs.get("图层")
         target_layer_id = kwargs.get("目标图层ID", 0)
-        # 深拷贝文档和图层以避免修改原对象
-        updated_document = copy.deepcopy(document)
-        new_layer = copy.deepcopy(layer)
-        
-        # 获取现有图层ID列表
-        existing_ids = [l["layer_id"] for l in updated_document["layers"]]
-        
-        # 分配新的图层ID
-        if target_layer_id >= 0 and target_layer_id not in existing_ids:
-            # 使用指定的ID（如果可用）
-            assigned_id = target_layer_id
-        else:
-            # 自动分配新ID，从0开始
-            assigned_id = 0
-            while assigned_id in existing_ids:
-                assigned_id += 1
-        
-        # 设置图层ID
-        new_layer["layer_id"] = assigned_id
-        
-        # 添加图层到文档
-        updated_document["layers"].append(new_layer)
+        # 写时复制：新文档与原文档共享已有图层，图层像素数据不复制
+        # 文档维护的图层ID索引和空闲ID计数器使ID分配为O(1)
+        updated_document, new_layer, assigned_id = add_layer(document, layer, target_layer_id)
         
         print(f"Added layer '{new_layer.get('name', 'Unnamed')}' with ID {assigned_id}")
         
@@ -2,6 +2,20 @@ import uuid
 import torch
 import numpy as np
 from PIL import Image
+import os
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .document_model import index_document
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    document_model_path = os.path.join(current_dir, "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    index_document = document_model.index_document
 
 
 class CreateBlankDocumentNode:
@@ -35,4 +49,4 @@ class CreateBlankDocumentNode:
                 "description": "Blank document created by ComfyUI-AFA"
             }
         }
-        return (document,)
\ No newline at end of file
+        return (index_document(document),)
\ No newline at end of file
@@ -4,6 +4,26 @@ from PIL import Image
 import tempfile
 import os
 
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from ..LayerIO.pixel_source import pack_layer_pixels, pixel_format, trim_layer, LAYER_STORAGE_FORMATS, DEFAULT_LAYER_STORAGE
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import sys
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(os.path.dirname(current_dir), "LayerIO", "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    pack_layer_pixels = pixel_source_module.pack_layer_pixels
+    pixel_format = pixel_source_module.pixel_format
+    trim_layer = pixel_source_module.trim_layer
+    LAYER_STORAGE_FORMATS = pixel_source_module.LAYER_STORAGE_FORMATS
+    DEFAULT_LAYER_STORAGE = pixel_source_module.DEFAULT_LAYER_STORAGE
+
 
 class CreateLayerNode:
     """创建图层节点"""
@@ -23,6 +43,8 @@ class CreateLayerNode:
                 "不透明度": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
                 "可见性": ("BOOLEAN", {"default": True}),
                 "混合模式": (["正常", "正片叠底", "滤色", "叠加", "柔光", "强光", "颜色减淡", "颜色加深", "变暗", "变亮", "差值", "排除"], {"default": "正常"}),
+                "存储格式": (LAYER_STORAGE_FORMATS, {"default": DEFAULT_LAYER_STORAGE, "tooltip": "图层像素的存储格式\nuint8占用内存为float32的1/4，合成和输出图像时才转换为浮点"}),
+                "裁剪透明边缘": ("BOOLEAN", {"default": False, "tooltip": "把图层像素裁剪到不透明内容的包围盒，合成结果不变\n图层改为以锚点[0,0]定位在内容左上角，适合大面积透明的整幅画布图像"}),
             }
         }
     
@@ -43,6 +65,8 @@ class CreateLayerNode:
         opacity = kwargs.get("不透明度", 1.0)
         visible = kwargs.get("可见性", True)
         blend_mode_cn = kwargs.get("混合模式", "正常")
+        storage = kwargs.get("存储格式", DEFAULT_LAYER_STORAGE)
+        auto_trim = kwargs.get("裁剪透明边缘", False)
         
         # 混合模式中英文映射
         blend_mode_map = {
@@ -83,9 +107,9 @@ class CreateLayerNode:
         # 获取图像尺寸
         width, height = pil_image.size
         
-        # 将PIL图像转换为numpy数组，然后转换为tensor
-        image_array = np.array(pil_image.convert("RGBA")).astype(np.float32) / 255.0
-        image_tensor = torch.from_numpy(image_array)
+        # 将PIL图像转换为RGBA的uint8数组，再转换为存储格式的tensor
+        image_array = np.array(pil_image.convert("RGBA"))
+        image_tensor = pack_layer_pixels(torch.from_numpy(image_array), storage)
         
         # 创建图层对象（直接存储图像数据）
         layer = {
@@ -102,8 +126,13 @@ class CreateLayerNode:
             "blend_mode": blend_mode,
             "metadata": {
                 "created_by": "CreateLayerNode",
-                "data_type": "tensor"
+                "data_type": "tensor",
+                "pixel_format": pixel_format(storage)
             }
         }
         
+        # 裁剪透明边缘，只保存有内容的区域
+        if auto_trim:
+            trim_layer(layer)
+        
         return (layer,)
\ No newline at end of file
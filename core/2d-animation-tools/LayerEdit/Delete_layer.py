@@ -1,4 +1,17 @@
-import copy
+import os
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .document_model import remove_layer
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    document_model_path = os.path.join(current_dir, "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    remove_layer = document_model.remove_layer
 
 
 class DeleteLayerNode:
@@ -23,18 +36,10 @@ class DeleteLayerNode:
         # 参数映射
         document = kwargs.get("文档")
         layer_id = kwargs.get("图层ID")
-        # 深拷贝文档以避免修改原对象
-        updated_document = copy.deepcopy(document)
-        
-        # 查找并删除指定ID的图层
-        layers = updated_document["layers"]
-        original_count = len(layers)
-        
-        # 过滤掉指定ID的图层
-        updated_document["layers"] = [layer for layer in layers if layer["layer_id"] != layer_id]
+        # 通过图层ID索引查找并删除指定ID的图层，新文档与原文档共享其余图层（写时复制）
+        updated_document, deleted_count = remove_layer(document, layer_id)
         
         # 检查是否成功删除
-        deleted_count = original_count - len(updated_document["layers"])
         if deleted_count > 0:
             print(f"Successfully deleted {deleted_count} layer(s) with ID {layer_id}")
         else:
@@ -1,3 +1,19 @@
+import os
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .document_model import get_layer
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    document_model_path = os.path.join(current_dir, "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    get_layer = document_model.get_layer
+
+
 class GetLayerFromDocumentNode:
     """从文档获取图层节点"""
     
@@ -24,10 +40,10 @@ class GetLayerFromDocumentNode:
             
             # 如果指定了图层ID，使用ID查找
             if 图层ID >= 0:
-                # 按图层ID查找
-                for layer in document["layers"]:
-                    if layer.get("layer_id") == 图层ID:
-                        return (layer,)
+                # 通过图层ID索引查找
+                layer = get_layer(document, 图层ID)
+                if layer is not None:
+                    return (layer,)
                 print(f"未找到ID为 {图层ID} 的图层")
                 return (None,)
             
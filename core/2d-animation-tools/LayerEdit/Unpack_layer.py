@@ -2,6 +2,23 @@ import torch
 import numpy as np
 from PIL import Image
 import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from ..LayerIO.pixel_source import resolve_layer_pixels, pixels_to_float
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(os.path.dirname(current_dir), "LayerIO", "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    resolve_layer_pixels = pixel_source_module.resolve_layer_pixels
+    pixels_to_float = pixel_source_module.pixels_to_float
 
 
 class UnpackLayerNode:
@@ -53,11 +70,11 @@ class UnpackLayerNode:
         blend_mode = layer.get("blend_mode", "normal")
         metadata = str(layer.get("metadata", {}))
         
-        # 处理图像 - 优先使用image_data
-        image_data = layer.get("image_data")
+        # 处理图像 - 优先使用image_data，延迟加载的图层按pixel_source解码
+        image_data = resolve_layer_pixels(layer)
         if image_data is not None and isinstance(image_data, torch.Tensor):
-            # 直接使用tensor数据
-            image_tensor = image_data
+            # 转换为ComfyUI图像使用的float32（uint8/float16存储的图层在这里转换）
+            image_tensor = pixels_to_float(image_data)
             # 确保有batch维度
             if image_tensor.dim() == 3:
                 image_tensor = image_tensor.unsqueeze(0)
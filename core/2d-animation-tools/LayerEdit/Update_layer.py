@@ -4,7 +4,38 @@ from PIL import Image
 import os
 import tempfile
 import uuid
-import copy
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .document_model import copy_layer
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    document_model_path = os.path.join(current_dir, "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    copy_layer = document_model.copy_layer
+
+try:
+    from ..LayerIO.pixel_source import pack_layer_pixels, pixel_format, trim_layer, LAYER_STORAGE_FORMATS, DEFAULT_LAYER_STORAGE
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import sys
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(os.path.dirname(current_dir), "LayerIO", "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    pack_layer_pixels = pixel_source_module.pack_layer_pixels
+    pixel_format = pixel_source_module.pixel_format
+    trim_layer = pixel_source_module.trim_layer
+    LAYER_STORAGE_FORMATS = pixel_source_module.LAYER_STORAGE_FORMATS
+    DEFAULT_LAYER_STORAGE = pixel_source_module.DEFAULT_LAYER_STORAGE
 
 
 class UpdateLayerNode:
@@ -26,6 +57,8 @@ class UpdateLayerNode:
                 "新不透明度": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
                 "新可见性": ("BOOLEAN", {"default": True}),
                 "新混合模式": (["正常", "正片叠底", "滤色", "叠加", "柔光", "强光", "颜色减淡", "颜色加深", "变暗", "变亮", "差值", "排除"], {"default": "正常"}),
+                "存储格式": (LAYER_STORAGE_FORMATS, {"default": DEFAULT_LAYER_STORAGE, "tooltip": "新图像的存储格式\nuint8占用内存为float32的1/4，合成和输出图像时才转换为浮点"}),
+                "裁剪透明边缘": ("BOOLEAN", {"default": False, "tooltip": "把图层像素裁剪到不透明内容的包围盒，合成结果不变\n图层改为以锚点[0,0]定位在内容左上角，适合大面积透明的整幅画布图像"}),
             }
         }
     
@@ -47,6 +80,8 @@ class UpdateLayerNode:
         new_opacity = kwargs.get("新不透明度", -1.0)
         new_visible = kwargs.get("新可见性", True)
         new_blend_mode_cn = kwargs.get("新混合模式", "")
+        storage = kwargs.get("存储格式", DEFAULT_LAYER_STORAGE)
+        auto_trim = kwargs.get("裁剪透明边缘", False)
         
         # 混合模式中英文映射
         blend_mode_map = {
@@ -65,8 +100,8 @@ class UpdateLayerNode:
         }
         new_blend_mode = blend_mode_map.get(new_blend_mode_cn, "normal")
         
-        # 深拷贝原图层以避免修改原对象
-        updated_layer = copy.deepcopy(layer)
+        # 写时复制：只复制图层字典，image_data与原图层共享
+        updated_layer = copy_layer(layer)
         
         # 更新图像
         if new_image is not None:
@@ -80,9 +115,11 @@ class UpdateLayerNode:
                 alpha_channel = torch.ones((*new_image.shape[:-1], 1), dtype=new_image.dtype, device=new_image.device)
                 new_image = torch.cat([new_image, alpha_channel], dim=-1)
             
-            # 直接存储图像tensor数据
-            updated_layer["image_data"] = new_image
+            # 按存储格式保存图像tensor数据
+            updated_layer["image_data"] = pack_layer_pixels(new_image, storage)
             updated_layer["image_path"] = None  # 清除旧的文件路径
+            updated_layer.pop("pixel_source", None)  # 清除延迟加载的像素来源
+            updated_layer["metadata"] = dict(updated_layer.get("metadata") or {}, pixel_format=pixel_format(storage))
             
             # 更新尺寸
             height, width = new_image.shape[:2]
@@ -125,4 +162,8 @@ class UpdateLayerNode:
         # 更新混合模式
         updated_layer["blend_mode"] = new_blend_mode
         
+        # 裁剪新图像的透明边缘（位置和锚点更新后再裁剪，合成结果不变）
+        if auto_trim and new_image is not None:
+            trim_layer(updated_layer)
+        
         return (updated_layer,)
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+文档模型模块
+DOCUMENT / LAYER 字典的写时复制（copy-on-write）辅助函数
+
+编辑节点不修改输入的文档、图层和像素数据，而是返回新的文档/图层对象；
+未被修改的图层字典和 image_data 张量在新旧文档之间共享，不再整体深拷贝。
+因此所有节点都必须把输入的文档、图层和 image_data 当作只读对象，
+需要修改时先用这里的函数复制外层结构，再替换字段的值。
+
+文档上维护三个索引字段：
+    layer_index: 图层ID -> 图层字典，按ID查找图层为O(1)
+    next_layer_id: 最小的空闲图层ID，小于它的ID都已被占用
+    layer_index_source: 建立索引时图层列表的 (id, 长度)，图层列表被替换或增删后索引失效
+没有这些字段的旧文档、索引失效的文档会在使用时重新建立索引（O(n)）。
+添加、删除图层会复制图层列表和索引，都是O(n)的指针复制，不复制图层和像素。
+"""
+
+
+# 由图层列表派生、复制文档时重新建立的字段
+INDEX_KEYS = ("layers", "layer_index", "next_layer_id", "layer_index_source")
+
+
+def _copy_value(value):
+    """复制列表/字典等小型容器（浅拷贝），张量和图像对象保持共享"""
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, tuple):
+        return tuple(value)
+    if isinstance(value, dict):
+        return {key: _copy_value(item) for key, item in value.items()}
+    return value
+
+
+def copy_layer(layer):
+    """复制图层字典：position、anchor、metadata等容器会被复制，image_data与原图层共享"""
+    return {key: _copy_value(value) for key, value in layer.items()}
+
+
+def copy_document(document, layers=None):
+    """复制文档字典，新文档与原文档共享所有图层对象
+
+    Args:
+        document: 原文档
+        layers: 新文档的图层列表，默认复制原文档的图层列表（只复制列表本身）
+    """
+    updated_document = {}
+    for key, value in document.items():
+        if key in INDEX_KEYS:
+            continue
+        updated_document[key] = _copy_value(value)
+    if layers is None:
+        _set_index(updated_document, list(document.get("layers", [])),
+                   dict(get_layer_index(document)), get_next_layer_id(document))
+    else:
+        index_document(updated_document, layers)
+    return updated_document
+
+
+def build_layer_index(layers):
+    """建立图层ID到图层的索引，ID重复时保留列表中靠前的图层"""
+    index = {}
+    for layer in layers:
+        index.setdefault(layer.get("layer_id"), layer)
+    return index
+
+
+def _find_free_id(index, start=0):
+    """从start开始查找第一个未被占用的图层ID"""
+    while start in index:
+        start += 1
+    return start
+
+
+def _set_index(document, layers, index, next_id):
+    document["layers"] = layers
+    document["layer_index"] = index
+    document["next_layer_id"] = next_id
+    document["layer_index_source"] = (id(layers), len(layers))
+
+
+def index_document(document, layers=None):
+    """为新建的文档设置图层列表并建立索引（只用于尚未传递给其他节点的文档）"""
+    if layers is None:
+        layers = document.get("layers", [])
+    index = build_layer_index(layers)
+    _set_index(document, layers, index, _find_free_id(index))
+    return document
+
+
+def get_layer_index(document):
+    """返回文档的图层ID索引
+
+    索引只在它是为当前的图层列表对象建立、且列表长度未变时使用；
+    旧文档没有索引，或图层列表被其他代码替换、增删时重新建立。
+    """
+    layers = document.get("layers", [])
+    index = document.get("layer_index")
+    source = document.get("layer_index_source")
+    if isinstance(index, dict) and source is not None and tuple(source) == (id(layers), len(layers)):
+        return index
+    return build_layer_index(layers)
+
+
+def get_next_layer_id(document):
+    """返回文档中最小的空闲图层ID"""
+    index = get_layer_index(document)
+    next_id = document.get("next_layer_id")
+    if index is document.get("layer_index") and isinstance(next_id, int) and next_id not in index:
+        return next_id
+    return _find_free_id(index)
+
+
+def get_layer(document, layer_id):
+    """按图层ID查找图层，不存在时返回None"""
+    layer = get_layer_index(document).get(layer_id)
+    if layer is not None and layer.get("layer_id") != layer_id:
+        # 图层字典的ID被原地修改过，索引已过期
+        layer = build_layer_index(document.get("layers", [])).get(layer_id)
+    return layer
+
+
+def add_layer(document, layer, target_layer_id=-1):
+    """返回添加了图层的新文档
+
+    target_layer_id可用时使用该ID，否则分配最小的空闲ID。
+
+    Returns:
+        (新文档, 新图层, 分配的ID)
+    """
+    updated_document = copy_document(document)
+    layers = updated_document["layers"]
+    index = updated_document["layer_index"]
+    next_id = updated_document["next_layer_id"]
+
+    if target_layer_id >= 0 and target_layer_id not in index:
+        # 使用指定的ID（如果可用）
+        assigned_id = target_layer_id
+    else:
+        assigned_id = next_id
+
+    new_layer = copy_layer(layer)
+    new_layer["layer_id"] = assigned_id
+    layers.append(new_layer)
+    index[assigned_id] = new_layer
+    if assigned_id == next_id:
+        next_id = _find_free_id(index, next_id + 1)
+    _set_index(updated_document, layers, index, next_id)
+    return updated_document, new_layer, assigned_id
+
+
+def remove_layer(document, layer_id):
+    """返回删除了指定ID图层的新文档
+
+    Returns:
+        (新文档, 删除的图层数量)；图层不存在时返回原文档和0
+    """
+    if layer_id not in get_layer_index(document):
+        return document, 0
+    layers = document["layers"]
+    remaining = [layer for layer in layers if layer.get("layer_id") != layer_id]
+    updated_document = copy_document(document)
+    index = updated_document["layer_index"]
+    del index[layer_id]
+    # 删除了所有使用该ID的图层，ID重复时其他图层不受影响
+    _set_index(updated_document, remaining, index, min(updated_document["next_layer_id"], layer_id))
+    return updated_document, len(layers) - len(remaining)
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 进程池的子进程按模块名导入本模块中的任务函数，需要能在sys.path中找到本目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+# 使用相对导入避免与系统包冲突
+try:
+    from .export_psd import ExportPSDAdvancedNode
+except ImportError:
+    import importlib.util
+    export_psd_path = os.path.join(current_dir, "export_psd.py")
+    spec = importlib.util.spec_from_file_location("export_psd", export_psd_path)
+    export_psd_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(export_psd_module)
+    ExportPSDAdvancedNode = export_psd_module.ExportPSDAdvancedNode
+
+try:
+    from ..LayerUtils.compositor import apply_frame_transform
+except ImportError:
+    # 帧变换与预览文档的批量帧渲染使用相同的规则
+    import importlib.util
+    compositor_path = os.path.join(os.path.dirname(current_dir), "LayerUtils", "compositor.py")
+    spec = importlib.util.spec_from_file_location("compositor", compositor_path)
+    compositor_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(compositor_module)
+    apply_frame_transform = compositor_module.apply_frame_transform
+
+# 进程池中每个进程只接收一次的基础文档（文档 + 帧变换模式）
+_worker_document = None
+
+
+def _init_worker(document):
+    global _worker_document
+    _worker_document = document
+
+
+def _export_frame(task):
+    """导出一帧（在工作进程或线程中执行）
+
+    Returns:
+        (帧序号, 文件路径, 文件大小, 耗时秒数, 错误信息)
+    """
+    index, document, transform, output_path, options = task
+    start = time.time()
+    if document is None:
+        document = _worker_document
+    if transform:
+        # 只替换被变换的图层，像素数据与基础文档共享
+        layers = [apply_frame_transform(layer, transform.get(str(layer.get("layer_id"))))
+                  for layer in document["layers"]]
+        document = dict(document, layers=layers)
+        document.pop("layer_index", None)
+    try:
+        path, info = ExportPSDAdvancedNode().export_psd_advanced(文档=document, 输出路径=output_path, **options)
+    except Exception as e:
+        path, info = "", str(e)
+    elapsed = time.time() - start
+    if not path:
+        return index, "", 0, elapsed, info
+    return index, path, os.path.getsize(path), elapsed, ""
+
+
+class BatchExportPSDNode:
+    """批量导出PSD节点 - 每帧一个PSD文件，多个文件在线程池（或可选的进程池）中并行写入"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "文档": ("DOCUMENT", {"tooltip": "单个文档或文档列表（上游节点输出列表时每个文档导出一个文件）；输入单个文档时配合帧变换导出每一帧"}),
+                "文件名模式": ("STRING", {"default": "output/frame_{frame:04d}.psd", "tooltip": "输出路径模式，{frame}为帧号，{index}为从0开始的序号"}),
+            },
+            "optional": {
+                "帧变换": ("STRING", {"default": "", "multiline": True, "tooltip": "JSON列表，每项为一帧，格式与预览文档的帧变换相同\n例如：[{\"1\": {\"position\": [100, 50]}}, {\"1\": {\"position\": [120, 50]}}]\n输入多个文档时忽略"}),
+                "起始帧号": ("INT", {"default": 0, "min": 0, "max": 999999}),
+                "并行方式": (["线程池", "进程池"], {"default": "线程池", "tooltip": "线程池在当前进程中并行写入，压缩和写文件时释放GIL\n进程池以spawn方式启动独立的Python进程：每个进程重新导入模块并复制一份文档像素，启动慢、内存按进程数成倍增加，只适合帧数很多的导出；进程启动失败时自动改用线程池"}),
+                "并行数": ("INT", {"default": 0, "min": 0, "max": 64, "tooltip": "同时导出的文件数，0为自动（CPU核心数），1为逐个导出"}),
+                "压缩": ("BOOLEAN", {"default": True}),
+                "压缩方式": (["RLE", "ZIP", "无压缩"], {"default": "RLE"}),
+                "包含隐藏图层": ("BOOLEAN", {"default": False}),
+                "色彩模式": (["RGB", "CMYK", "灰度"], {"default": "RGB"}),
+                "位深度": ([8, 16, 32], {"default": 8}),
+                "DPI": ("INT", {"default": 300, "min": 72, "max": 600}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("文件路径列表", "导出信息")
+    FUNCTION = "batch_export_psd"
+    CATEGORY = "AFA2D/图层IO"
+    OUTPUT_NODE = True
+    # 以列表接收文档，其余输入取第一项
+    INPUT_IS_LIST = True
+
+    def batch_export_psd(self, **kwargs):
+        """批量导出PSD"""
+        try:
+            print(f"[BatchExportPSD] ========== 开始批量导出PSD ==========")
+            documents = kwargs.get("文档")
+            if isinstance(documents, dict):
+                documents = [documents]
+            kwargs = {key: self._first(value) for key, value in kwargs.items() if key != "文档"}
+            pattern = kwargs.get("文件名模式", "output/frame_{frame:04d}.psd")
+            start_frame = kwargs.get("起始帧号", 0)
+            parallel_mode = kwargs.get("并行方式", "线程池")
+            workers = int(kwargs.get("并行数", 0))
+            options = {
+                "压缩": kwargs.get("压缩", True),
+                "压缩方式": kwargs.get("压缩方式", "RLE"),
+                # 文件之间已经并行，单个文件内部不再开启压缩线程
+                "压缩线程数": 1,
+                "包含隐藏图层": kwargs.get("包含隐藏图层", False),
+                "色彩模式": kwargs.get("色彩模式", "RGB"),
+                "位深度": kwargs.get("位深度", 8),
+                "DPI": kwargs.get("DPI", 300),
+            }
+
+            # 整理每一帧的导出任务
+            if not isinstance(documents, (list, tuple)) or not all(isinstance(document, dict) for document in documents):
+                error_msg = f"错误：无效的文档输入 - 类型: {type(documents)}"
+                print(f"[BatchExportPSD] {error_msg}")
+                return ("", error_msg)
+            if len(documents) > 1:
+                base_document = None
+                frames = [(document, None) for document in documents]
+            elif documents:
+                base_document = documents[0]
+                transforms = self._parse_frame_transforms(kwargs.get("帧变换", ""))
+                frames = [(None, transform) for transform in transforms] if transforms else [(None, None)]
+            else:
+                frames = []
+            if not frames:
+                return ("", "错误：没有需要导出的帧")
+
+            tasks = []
+            for index, (document, transform) in enumerate(frames):
+                try:
+                    output_path = pattern.format(frame=start_frame + index, index=index)
+                except (KeyError, IndexError, ValueError) as e:
+                    error_msg = f"错误：文件名模式无效 '{pattern}': {e}"
+                    print(f"[BatchExportPSD] {error_msg}")
+                    return ("", error_msg)
+                if not output_path.lower().endswith('.psd'):
+                    output_path = output_path + '.psd'
+                tasks.append((index, document, transform, os.path.abspath(output_path), options))
+
+            paths = [task[3] for task in tasks]
+            if len(set(paths)) != len(paths):
+                error_msg = f"错误：文件名模式 '{pattern}' 生成了重复的路径，请在模式中使用 {{frame}} 或 {{index}}"
+                print(f"[BatchExportPSD] {error_msg}")
+                return ("", error_msg)
+
+            # 输出目录只在开始前创建一次
+            for output_dir in sorted(set(os.path.dirname(path) for path in paths)):
+                os.makedirs(output_dir, exist_ok=True)
+
+            if workers <= 0:
+                workers = os.cpu_count() or 1
+            workers = min(workers, len(tasks))
+            print(f"[BatchExportPSD] 共 {len(tasks)} 帧，{parallel_mode}并行数: {workers}")
+
+            start = time.time()
+            results = {}
+            if workers > 1 and parallel_mode == "进程池":
+                try:
+                    # ComfyUI服务进程中已有CUDA上下文和多个线程，fork会把它们复制到子进程，因此始终使用spawn
+                    executor = ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker, initargs=(base_document,)
+                    )
+                    self._run_pool(executor, tasks, workers, results)
+                except Exception as e:
+                    print(f"[BatchExportPSD] 进程池不可用，改用线程池: {e}")
+            pending = [self._with_document(task, base_document) for task in tasks if task[0] not in results]
+            if pending:
+                if workers > 1:
+                    self._run_pool(ThreadPoolExecutor(max_workers=workers), pending, workers, results)
+                else:
+                    for task in pending:
+                        results[task[0]] = _export_frame(task)
+            elapsed = time.time() - start
+
+            return self._summarize([results[task[0]] for task in tasks], elapsed, workers)
+
+        except Exception as e:
+            import traceback
+            error_msg = f"批量导出PSD时出错: {str(e)}"
+            print(f"[BatchExportPSD] 致命错误: {error_msg}")
+            print(traceback.format_exc())
+            return ("", error_msg)
+
+    @staticmethod
+    def _first(value):
+        """列表输入取第一项；帧变换直接传入帧列表（非字符串）时保持不变"""
+        if isinstance(value, list) and value and isinstance(value[0], (str, int, float, bool)):
+            return value[0]
+        return value
+
+    @staticmethod
+    def _with_document(task, base_document):
+        """线程池与主进程共享内存，直接把基础文档放进任务中"""
+        index, document, transform, output_path, options = task
+        return (index, document if document is not None else base_document, transform, output_path, options)
+
+    @staticmethod
+    def _run_pool(executor, tasks, workers, results):
+        """提交任务到执行器，同时进行的任务数不超过并行数的2倍，避免一次序列化全部文档"""
+        with executor:
+            queue = iter(tasks)
+            running = set()
+            for task in queue:
+                running.add(executor.submit(_export_frame, task))
+                if len(running) >= workers * 2:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        results[result[0]] = result
+            for future in running:
+                result = future.result()
+                results[result[0]] = result
+
+    def _parse_frame_transforms(self, frame_transforms):
+        """解析帧变换输入，返回每帧一个 {图层ID字符串: 变换字典} 的列表"""
+        if not frame_transforms:
+            return []
+        if isinstance(frame_transforms, str):
+            if not frame_transforms.strip():
+                return []
+            frame_transforms = json.loads(frame_transforms)
+        if not isinstance(frame_transforms, (list, tuple)):
+            raise ValueError("帧变换必须是列表，每项对应一帧")
+        return [{str(layer_id): transform for layer_id, transform in frame.items()} for frame in frame_transforms]
+
+    def _summarize(self, results, elapsed, workers):
+        """汇总导出结果"""
+        succeeded = [result for result in results if result[1]]
+        failed = [result for result in results if not result[1]]
+        total_size = sum(result[2] for result in succeeded)
+        frame_times = [result[3] for result in succeeded]
+
+        export_info = f"批量导出完成: {len(succeeded)}/{len(results)} 个文件\n"
+        export_info += f"并行数: {workers}\n"
+        export_info += f"总耗时: {elapsed:.2f} 秒"
+        if succeeded:
+            export_info += f"（{len(succeeded) / max(elapsed, 1e-6):.2f} 个文件/秒）\n"
+            export_info += f"单个文件耗时: 平均 {sum(frame_times) / len(frame_times):.2f} 秒，最长 {max(frame_times):.2f} 秒\n"
+            export_info += f"总大小: {total_size} 字节，平均 {total_size // len(succeeded)} 字节"
+        for index, _, _, _, error in failed:
+            export_info += f"\n第 {index} 帧导出失败: {error}"
+        print(f"[BatchExportPSD] {export_info}")
+
+        return ("\n".join(result[1] for result in succeeded), export_info)
+
+
+# 节点映射
+NODE_CLASS_MAPPINGS = {
+    "BatchExportPSDNode": BatchExportPSDNode
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "BatchExportPSDNode": "批量导出PSD文档"
+}
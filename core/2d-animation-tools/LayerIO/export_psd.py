@@ -2,6 +2,7 @@ import torch
 import numpy as np
 from PIL import Image
 import os
+import sys
 import tempfile
 
 # 尝试导入PhotoshopAPI（主要PSD写入库）
@@ -15,7 +16,7 @@ except ImportError:
 try:
     from psd_tools import PSDImage
     from psd_tools.api.layers import PixelLayer, Group
-    from psd_tools.constants import BlendMode, ColorMode
+    from psd_tools.constants import BlendMode, ColorMode, Compression
     PSD_TOOLS_AVAILABLE = True
 except ImportError:
     PSD_TOOLS_AVAILABLE = False
@@ -28,6 +29,62 @@ try:
 except ImportError:
     ASPOSE_PSD_AVAILABLE = False
 
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .pixel_source import resolve_layer_pixels
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(current_dir, "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    resolve_layer_pixels = pixel_source_module.resolve_layer_pixels
+
+try:
+    from ...image_convert import tensor_to_pil, layer_to_rgba, layer_value_range, apply_opacity
+except ImportError:
+    # 导出、预览和飞书上传共用的图像转换模块
+    import importlib.util
+    image_convert_module = sys.modules.get("afa_image_convert")
+    if image_convert_module is None:
+        image_convert_path = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "image_convert.py")
+        spec = importlib.util.spec_from_file_location("afa_image_convert", image_convert_path)
+        image_convert_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(image_convert_module)
+        sys.modules["afa_image_convert"] = image_convert_module
+    tensor_to_pil = image_convert_module.tensor_to_pil
+    layer_to_rgba = image_convert_module.layer_to_rgba
+    layer_value_range = image_convert_module.layer_value_range
+    apply_opacity = image_convert_module.apply_opacity
+
+try:
+    from .psd_writer import PSDStreamWriter
+except ImportError:
+    import importlib.util
+    psd_writer_path = os.path.join(current_dir, "psd_writer.py")
+    spec = importlib.util.spec_from_file_location("psd_writer", psd_writer_path)
+    psd_writer_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(psd_writer_module)
+    PSDStreamWriter = psd_writer_module.PSDStreamWriter
+
+try:
+    from ..LayerUtils.compositor import LayerCompositor
+except ImportError:
+    # 合并图像使用预览文档相同的浮点合成器
+    import importlib.util
+    compositor_path = os.path.join(os.path.dirname(current_dir), "LayerUtils", "compositor.py")
+    spec = importlib.util.spec_from_file_location("compositor", compositor_path)
+    compositor_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(compositor_module)
+    LayerCompositor = compositor_module.LayerCompositor
+
+# 节点的压缩方式选项到流式写入器的压缩方式
+STREAM_COMPRESSION = {"RLE": "rle", "ZIP": "zip", "无压缩": "raw"}
 
 class ExportPSDAdvancedNode:
     """高级PSD导出节点 - 支持真正的PSD文件格式导出"""
@@ -41,6 +98,14 @@ class ExportPSDAdvancedNode:
             },
             "optional": {
                 "压缩": ("BOOLEAN", {"default": True}),
+                "压缩方式": (["RLE", "ZIP", "无压缩"], {
+                    "default": "RLE",
+                    "tooltip": "图层通道的压缩方式，关闭“压缩”时等同于无压缩；RLE兼容性最好，ZIP文件更小但更慢"
+                }),
+                "压缩线程数": ("INT", {
+                    "default": 0, "min": 0, "max": 64,
+                    "tooltip": "并行压缩图层通道的线程数，0为自动（CPU核心数），1为单线程\n只对8位RGB的流式写入生效；其他色彩模式和位深度经psd-tools导出，始终单线程压缩"
+                }),
                 "包含隐藏图层": ("BOOLEAN", {"default": False}),
                 "色彩模式": (["RGB", "CMYK", "灰度"], {"default": "RGB"}),
                 "位深度": ([8, 16, 32], {"default": 8}),
@@ -59,8 +124,11 @@ class ExportPSDAdvancedNode:
         try:
             print(f"[ExportPSD] ========== 开始高级PSD导出 ==========")
             
+            # 8位RGB文件使用内置的流式写入器，不依赖第三方PSD库
+            use_stream_writer = kwargs.get("色彩模式", "RGB") == "RGB" and int(kwargs.get("位深度", 8)) == 8
+            
             # 检查可用的PSD库
-            if not any([PHOTOSHOP_API_AVAILABLE, PSD_TOOLS_AVAILABLE, ASPOSE_PSD_AVAILABLE]):
+            if not use_stream_writer and not any([PHOTOSHOP_API_AVAILABLE, PSD_TOOLS_AVAILABLE, ASPOSE_PSD_AVAILABLE]):
                 error_msg = "错误：未找到可用的PSD写入库。请安装以下任一库：\n"
                 error_msg += "1. PhotoshopAPI: pip install PhotoshopAPI\n"
                 error_msg += "2. psd-tools: pip install psd-tools\n"
@@ -72,6 +140,8 @@ class ExportPSDAdvancedNode:
             document = kwargs.get("文档")
             output_path = kwargs.get("输出路径", "output.psd")
             compression = kwargs.get("压缩", True)
+            compression_method = kwargs.get("压缩方式", "RLE") if compression else "无压缩"
+            workers = int(kwargs.get("压缩线程数", 0)) or (os.cpu_count() or 1)
             include_hidden = kwargs.get("包含隐藏图层", False)
             color_mode = kwargs.get("色彩模式", "RGB")
             bit_depth = kwargs.get("位深度", 8)
@@ -79,7 +149,7 @@ class ExportPSDAdvancedNode:
             
             print(f"[ExportPSD] 输入参数:")
             print(f"[ExportPSD]   - 输出路径: '{output_path}'")
-            print(f"[ExportPSD]   - 压缩: {compression}")
+            print(f"[ExportPSD]   - 压缩: {compression} ({compression_method}, {workers}线程)")
             print(f"[ExportPSD]   - 包含隐藏图层: {include_hidden}")
             print(f"[ExportPSD]   - 色彩模式: {color_mode}")
             print(f"[ExportPSD]   - 位深度: {bit_depth}")
@@ -126,10 +196,20 @@ class ExportPSDAdvancedNode:
             
             # 根据可用库选择导出方法，优先使用更可靠的方案
             try:
+                if use_stream_writer:
+                    print(f"[ExportPSD] 使用流式PSD写入器导出")
+                    result = self._export_with_stream_writer(document, output_path, canvas_width, canvas_height,
+                                                             include_hidden, dpi, compression_method, workers)
+                    if result[0] or not any([PHOTOSHOP_API_AVAILABLE, PSD_TOOLS_AVAILABLE, ASPOSE_PSD_AVAILABLE]):
+                        return result
+                    print(f"[ExportPSD] 流式写入失败，尝试使用其他PSD库导出")
+                
                 if PSD_TOOLS_AVAILABLE:
                     print(f"[ExportPSD] 尝试使用psd-tools导出")
+                    if workers > 1 and compression_method != "无压缩":
+                        print(f"[ExportPSD] 警告：psd-tools导出路径单线程压缩，忽略压缩线程数（{workers}）")
                     return self._export_with_psd_tools(document, output_path, canvas_width, canvas_height, 
-                                                     include_hidden, color_mode, bit_depth, dpi)
+                                                     include_hidden, color_mode, bit_depth, dpi, compression_method)
                 elif PHOTOSHOP_API_AVAILABLE:
                     print(f"[ExportPSD] 尝试使用PhotoshopAPI导出")
                     return self._export_with_photoshop_api(document, output_path, canvas_width, canvas_height, 
@@ -158,6 +238,85 @@ class ExportPSDAdvancedNode:
             print(traceback.format_exc())
             return ("", error_msg)
     
+    def _export_with_stream_writer(self, document, output_path, canvas_width, canvas_height,
+                                   include_hidden, dpi, compression_method, workers):
+        """使用内置的流式写入器导出8位RGB的PSD文件
+
+        逐个图层取出像素、压缩并写入文件，同时累加到合并图像，不保留任何中间的PIL图像或PSDImage。
+        通道压缩在线程池中与下一个图层的解码和合成并行进行。
+        """
+        try:
+            # 只导出有像素数据的图层（延迟加载的图层在写入时才解码）
+            export_layers = [
+                layer for layer in document["layers"]
+                if (include_hidden or layer.get("visible", True))
+                and (layer.get("image_data") is not None or layer.get("pixel_source"))
+            ]
+            if not export_layers:
+                return ("", "错误：文档中没有可导出的图层")
+            
+            headers = []
+            for index, layer in enumerate(export_layers):
+                layer_name = layer.get("name", "")
+                if not layer_name or layer_name.strip() == "":
+                    layer_name = f"图层{index}"
+                headers.append({
+                    "name": layer_name,
+                    "opacity": int(round(layer.get("opacity", 1.0) * 255)),
+                    "blend_mode": layer.get("blend_mode", "normal"),
+                    "visible": layer.get("visible", True),
+                })
+            
+            compositor = LayerCompositor(canvas_width, canvas_height)
+            with PSDStreamWriter(output_path, canvas_width, canvas_height,
+                                 compression=STREAM_COMPRESSION[compression_method], dpi=dpi,
+                                 workers=workers) as writer:
+                writer.write_layer_records(headers)
+                for layer, header in zip(export_layers, headers):
+                    # 延迟加载的图层解码后不放入共享缓存，写完即释放
+                    pixels = resolve_layer_pixels(layer, cache=False)
+                    rgba = self._layer_pixels_to_rgba(layer, pixels)
+                    left_pos = top_pos = 0
+                    if rgba is not None:
+                        # 根据锚点计算PSD中的左上角位置（与预览系统保持一致）
+                        position = layer.get("position", [0, 0])
+                        anchor = layer.get("anchor", [0.0, 0.0])
+                        left_pos = int(position[0] - rgba.shape[1] * anchor[0])
+                        top_pos = int(position[1] - rgba.shape[0] * anchor[1])
+                    writer.write_layer(rgba, left_pos, top_pos)
+                    if layer.get("visible", True) and pixels is not None:
+                        compositor.composite_layer(dict(layer, image_data=pixels))
+                    pixels = rgba = None
+                    print(f"[ExportPSD] 已写入图层: {header['name']}")
+                
+                merged = compositor.to_image_tensor()[0].mul_(255.0).round_().clamp_(0, 255).to(torch.uint8)
+                compositor = None
+                writer.close(merged.numpy())
+            
+            file_size = os.path.getsize(output_path)
+            print(f"[ExportPSD] PSD文件保存成功，大小: {file_size} 字节")
+            
+            export_info = f"成功导出PSD文档到: {output_path}\n"
+            export_info += f"画布尺寸: {canvas_width} x {canvas_height}\n"
+            export_info += f"导出图层数: {len(export_layers)}\n"
+            export_info += f"色彩模式: RGB\n"
+            export_info += f"位深度: 8位\n"
+            export_info += f"DPI: {dpi}\n"
+            export_info += f"导出方式: 流式写入\n"
+            export_info += f"文件大小: {file_size} 字节"
+            return (output_path, export_info)
+            
+        except Exception as e:
+            error_msg = f"流式PSD写入失败: {str(e)}"
+            print(f"[ExportPSD] {error_msg}")
+            return ("", error_msg)
+    
+    def _layer_pixels_to_rgba(self, layer, image_data):
+        """把图层像素转换为 [H, W, 4] 的uint8数组，没有像素时返回None"""
+        if not isinstance(image_data, torch.Tensor):
+            return None
+        return layer_to_rgba(layer, image_data)
+    
     def _export_with_photoshop_api(self, document, output_path, canvas_width, canvas_height, 
                                   include_hidden, color_mode, bit_depth, dpi, compression):
         """使用PhotoshopAPI导出PSD文件"""
@@ -201,12 +360,12 @@ class ExportPSDAdvancedNode:
                 if not include_hidden and not layer.get("visible", True):
                     continue
                 
-                image_data = layer.get("image_data")
+                image_data = resolve_layer_pixels(layer)
                 if image_data is None:
                     continue
                 
                 # 转换图像数据
-                pil_image = self._convert_tensor_to_pil(image_data)
+                pil_image = self._convert_tensor_to_pil(image_data, layer_value_range(layer))
                 if pil_image is None:
                     continue
                 
@@ -260,11 +419,18 @@ class ExportPSDAdvancedNode:
             return ("", error_msg)
     
     def _export_with_psd_tools(self, document, output_path, canvas_width, canvas_height, 
-                              include_hidden, color_mode, bit_depth, dpi):
+                              include_hidden, color_mode, bit_depth, dpi, compression_method="RLE"):
         """使用psd-tools导出PSD文件"""
         print(f"[ExportPSD] 使用psd-tools导出")
         
         try:
+            # 图层通道在frompil时按此方式压缩，无压缩时导出明显更快
+            psd_compression = {
+                "RLE": Compression.RLE,
+                "ZIP": Compression.ZIP,
+                "无压缩": Compression.RAW,
+            }.get(compression_method, Compression.RLE)
+
             # psd-tools使用字符串模式而不是ColorMode枚举
             color_mode_map = {
                 "RGB": "RGB",
@@ -304,12 +470,12 @@ class ExportPSDAdvancedNode:
                 if not include_hidden and not layer.get("visible", True):
                     continue
                 
-                image_data = layer.get("image_data")
+                image_data = resolve_layer_pixels(layer)
                 if image_data is None:
                     continue
                 
                 # 转换图像数据
-                pil_image = self._convert_tensor_to_pil(image_data)
+                pil_image = self._convert_tensor_to_pil(image_data, layer_value_range(layer))
                 if pil_image is None:
                     continue
                 
@@ -358,7 +524,8 @@ class ExportPSDAdvancedNode:
                         psd, 
                         temp_name,  # 使用英文临时名称
                         top_pos,    # top_offset位置参数
-                        left_pos    # left_offset位置参数
+                        left_pos,   # left_offset位置参数
+                        compression=psd_compression
                     )
                     
                     # 步骤2：立即设置中文名称（这是关键！）
@@ -395,7 +562,7 @@ class ExportPSDAdvancedNode:
                                 composite_image = canvas
                             
                             # 使用frompil创建PSD
-                            psd = PSDImage.frompil(composite_image)
+                            psd = PSDImage.frompil(composite_image, compression=psd_compression)
                             processed_layers += 1
                             print(f"[ExportPSD] Using fallback method to process layer: {layer_name}")
                     except Exception as fallback_error:
@@ -490,12 +657,12 @@ class ExportPSDAdvancedNode:
                     if not include_hidden and not layer.get("visible", True):
                         continue
                     
-                    image_data = layer.get("image_data")
+                    image_data = resolve_layer_pixels(layer)
                     if image_data is None:
                         continue
                     
                     # 转换图像数据
-                    pil_image = self._convert_tensor_to_pil(image_data)
+                    pil_image = self._convert_tensor_to_pil(image_data, layer_value_range(layer))
                     if pil_image is None:
                         continue
                     
@@ -537,7 +704,8 @@ class ExportPSDAdvancedNode:
                         safe_psd, 
                         temp_name,  # 使用英文临时名称
                         top_pos,    # top_offset位置参数
-                        left_pos    # left_offset位置参数
+                        left_pos,   # left_offset位置参数
+                        compression=psd_compression
                     )
                     
                     # 立即设置中文名称
@@ -599,12 +767,12 @@ class ExportPSDAdvancedNode:
                     if not include_hidden and not layer.get("visible", True):
                         continue
                     
-                    image_data = layer.get("image_data")
+                    image_data = resolve_layer_pixels(layer)
                     if image_data is None:
                         continue
                     
                     # 转换图像数据
-                    pil_image = self._convert_tensor_to_pil(image_data)
+                    pil_image = self._convert_tensor_to_pil(image_data, layer_value_range(layer))
                     if pil_image is None:
                         continue
                     
@@ -675,12 +843,12 @@ class ExportPSDAdvancedNode:
                 if not include_hidden and not layer.get("visible", True):
                     continue
                 
-                image_data = layer.get("image_data")
+                image_data = resolve_layer_pixels(layer)
                 if image_data is None:
                     continue
                 
                 # 转换图像数据
-                pil_image = self._convert_tensor_to_pil(image_data)
+                pil_image = self._convert_tensor_to_pil(image_data, layer_value_range(layer))
                 if pil_image is None:
                     continue
                 
@@ -691,12 +859,9 @@ class ExportPSDAdvancedNode:
                 
                 print(f"[ExportPSD] 合成图层: {layer_name}, 位置: {position}, 透明度: {opacity}")
                 
-                # 调整透明度
+                # 调整透明度（直接乘到alpha通道上）
                 if opacity < 1.0:
-                    # 创建带透明度的图像
-                    alpha = pil_image.split()[-1]
-                    alpha = alpha.point(lambda p: int(p * opacity))
-                    pil_image.putalpha(alpha)
+                    pil_image = Image.fromarray(apply_opacity(np.array(pil_image), opacity), "RGBA")
                 
                 # 合成到画布上
                 if pil_image.mode == 'RGBA' and canvas.mode == 'RGBA':
@@ -732,35 +897,14 @@ class ExportPSDAdvancedNode:
             print(f"[ExportPSD] {error_msg}")
             return ("", error_msg)
 
-    def _convert_tensor_to_pil(self, image_data):
-        """将PyTorch张量转换为PIL图像"""
+    def _convert_tensor_to_pil(self, image_data, value_range=None):
+        """将PyTorch张量转换为RGBA的PIL图像
+
+        取值范围由数据类型和图层元数据决定（uint8为0~255，浮点为0~1），不再逐图层计算max()。
+        """
         try:
             if isinstance(image_data, torch.Tensor):
-                # 转换为numpy数组
-                if image_data.max() <= 1.0:
-                    image_array = (image_data.cpu().numpy() * 255).astype(np.uint8)
-                else:
-                    image_array = image_data.cpu().numpy().astype(np.uint8)
-                
-                # 处理维度
-                if len(image_array.shape) == 4:  # [B, H, W, C]
-                    image_array = image_array[0]
-                
-                if len(image_array.shape) == 3 and image_array.shape[0] in [1, 3, 4]:  # [C, H, W]
-                    image_array = np.transpose(image_array, (1, 2, 0))
-                
-                # 处理通道数
-                if image_array.shape[2] == 3:
-                    # RGB -> RGBA
-                    alpha = np.ones((image_array.shape[0], image_array.shape[1], 1), dtype=image_array.dtype) * 255
-                    image_array = np.concatenate([image_array, alpha], axis=2)
-                elif image_array.shape[2] == 1:
-                    # 灰度 -> RGBA
-                    image_array = np.repeat(image_array, 3, axis=2)
-                    alpha = np.ones((image_array.shape[0], image_array.shape[1], 1), dtype=image_array.dtype) * 255
-                    image_array = np.concatenate([image_array, alpha], axis=2)
-                
-                return Image.fromarray(image_array, 'RGBA')
+                return tensor_to_pil(image_data, "RGBA", value_range)
             else:
                 return None
         except Exception as e:
@@ -0,0 +1,175 @@
+"""
+PSD导入磁盘缓存模块
+按文件路径、修改时间、文件大小和导入选项缓存导入结果，未修改的PSD再次导入时直接从缓存读取。
+
+每个缓存条目是一个目录：
+    document.json   文档结构（不含像素）和导入信息
+    layer_<序号>.npy 图层像素；按图层的存储格式保存，8位PSD的float32像素也以uint8保存
+缓存总大小超过上限时按最近使用时间（LRU）淘汰最旧的条目。
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import torch
+
+try:
+    import folder_paths
+    FOLDER_PATHS_AVAILABLE = True
+except ImportError:
+    FOLDER_PATHS_AVAILABLE = False
+
+# 缓存格式版本，文档结构或像素格式变化时递增使旧缓存失效
+CACHE_FORMAT_VERSION = 3
+DOCUMENT_FILE = "document.json"
+# 这些字段由 index_document 重新建立，不写入缓存
+INDEX_KEYS = ("layer_index", "next_layer_id", "layer_index_source")
+
+
+def get_cache_dir():
+    """缓存目录：优先使用ComfyUI的temp目录"""
+    if FOLDER_PATHS_AVAILABLE:
+        base_dir = folder_paths.get_temp_directory()
+    else:
+        base_dir = tempfile.gettempdir()
+    return os.path.join(base_dir, "afa_psd_import_cache")
+
+
+def file_signature(path):
+    """文件签名（路径、修改时间、大小），文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+
+def cache_key(path, options):
+    """由文件签名和影响导入结果的选项生成缓存键"""
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{CACHE_FORMAT_VERSION}|{signature}|{sorted(options.items())!r}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _entry_size(entry_dir):
+    total = 0
+    for name in os.listdir(entry_dir):
+        try:
+            total += os.path.getsize(os.path.join(entry_dir, name))
+        except OSError:
+            pass
+    return total
+
+
+def load(key):
+    """读取缓存的导入结果
+
+    Returns:
+        (文档, 导入信息)；没有缓存或缓存损坏时返回None
+    """
+    entry_dir = os.path.join(get_cache_dir(), key)
+    document_path = os.path.join(entry_dir, DOCUMENT_FILE)
+    if not os.path.exists(document_path):
+        return None
+    try:
+        with open(document_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        document = entry["document"]
+        for layer in document["layers"]:
+            pixel_file = layer.pop("pixel_file", None)
+            if pixel_file is None:
+                # 延迟加载的图层只保存像素来源
+                layer["image_data"] = None
+                continue
+            pixels = np.load(os.path.join(entry_dir, pixel_file))
+            if layer.pop("pixel_dtype", None) == "float32":
+                # 以uint8保存的float32像素还原为原来的值
+                pixels = pixels.astype(np.float32) / np.float32(255.0)
+            layer["image_data"] = torch.from_numpy(pixels)
+        # 更新访问时间，用于LRU淘汰
+        os.utime(document_path)
+        return document, entry["import_info"]
+    except Exception as e:
+        print(f"[导入缓存] 读取缓存失败，将重新导入: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+
+
+def store(key, document, import_info, uint8_pixels=False, max_bytes=None):
+    """把导入结果写入缓存
+
+    Args:
+        uint8_pixels: float32像素是否为8位量化值（x/255），是则以uint8保存，读取时还原为相同的float32值
+        max_bytes: 缓存总大小上限，写入后超出部分按LRU淘汰
+    """
+    cache_dir = get_cache_dir()
+    entry_dir = os.path.join(cache_dir, key)
+    temp_dir = os.path.join(cache_dir, f".{key}.{os.getpid()}.tmp")
+    try:
+        os.makedirs(temp_dir, exist_ok=True)
+        layers = []
+        for index, layer in enumerate(document.get("layers", [])):
+            cached_layer = {k: v for k, v in layer.items() if k != "image_data"}
+            image_data = layer.get("image_data")
+            if image_data is not None:
+                pixels = image_data.detach().cpu().numpy()
+                if uint8_pixels and pixels.dtype == np.float32:
+                    cached_layer["pixel_dtype"] = "float32"
+                    pixels = np.rint(pixels * 255.0).astype(np.uint8)
+                cached_layer["pixel_file"] = f"layer_{index}.npy"
+                np.save(os.path.join(temp_dir, cached_layer["pixel_file"]), pixels)
+            layers.append(cached_layer)
+
+        cached_document = {k: v for k, v in document.items() if k not in INDEX_KEYS}
+        cached_document["layers"] = layers
+        with open(os.path.join(temp_dir, DOCUMENT_FILE), "w", encoding="utf-8") as f:
+            json.dump({"document": cached_document, "import_info": import_info, "created": time.time()}, f, ensure_ascii=False)
+
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temp_dir, entry_dir)
+    except Exception as e:
+        print(f"[导入缓存] 写入缓存失败: {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+
+    if max_bytes is not None:
+        evict(max_bytes)
+
+
+def evict(max_bytes):
+    """按最近使用时间淘汰缓存条目，直到总大小不超过上限"""
+    cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        document_path = os.path.join(entry_dir, DOCUMENT_FILE)
+        if name.startswith(".") or not os.path.exists(document_path):
+            continue
+        size = _entry_size(entry_dir)
+        entries.append((os.path.getmtime(document_path), size, entry_dir))
+        total += size
+
+    entries.sort()
+    for _, size, entry_dir in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        print(f"[导入缓存] 淘汰缓存条目: {os.path.basename(entry_dir)}")
+
+
+def clear():
+    """删除所有缓存条目"""
+    shutil.rmtree(get_cache_dir(), ignore_errors=True)
@@ -3,6 +3,7 @@ import numpy as np
 from PIL import Image
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     from psd_tools import PSDImage
@@ -16,6 +17,50 @@ try:
 except ImportError:
     FOLDER_PATHS_AVAILABLE = False
 
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from ..LayerEdit.document_model import index_document
+except ImportError:
+    # 图层ID索引由LayerEdit中的文档模型维护
+    import importlib.util
+    document_model_path = os.path.join(os.path.dirname(current_dir), "LayerEdit", "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    index_document = document_model.index_document
+
+try:
+    from . import import_cache
+except ImportError:
+    import importlib.util
+    import_cache_path = os.path.join(current_dir, "import_cache.py")
+    spec = importlib.util.spec_from_file_location("import_cache", import_cache_path)
+    import_cache = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(import_cache)
+
+try:
+    from .pixel_source import make_psd_pixel_source, psd_leaf_layers, open_psd_reader, composite_psd_layer, pixel_format, trim_layer, LAYER_STORAGE_FORMATS, DEFAULT_LAYER_STORAGE
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import sys
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(current_dir, "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    make_psd_pixel_source = pixel_source_module.make_psd_pixel_source
+    psd_leaf_layers = pixel_source_module.psd_leaf_layers
+    open_psd_reader = pixel_source_module.open_psd_reader
+    composite_psd_layer = pixel_source_module.composite_psd_layer
+    pixel_format = pixel_source_module.pixel_format
+    trim_layer = pixel_source_module.trim_layer
+    LAYER_STORAGE_FORMATS = pixel_source_module.LAYER_STORAGE_FORMATS
+    DEFAULT_LAYER_STORAGE = pixel_source_module.DEFAULT_LAYER_STORAGE
+
 
 class ImportPSDNode:
     """从PSD文件导入文档节点"""
@@ -27,6 +72,11 @@ class ImportPSDNode:
             "optional": {
                 "PSD文件": ("STRING", {"default": "", "psd_upload": True, "hidden_input": True}),
                 "保持原始尺寸": ("BOOLEAN", {"default": True}),
+                "存储格式": (LAYER_STORAGE_FORMATS, {"default": DEFAULT_LAYER_STORAGE, "tooltip": "图层像素的存储格式\nuint8占用内存为float32的1/4，合成和输出图像时才转换为浮点"}),
+                "裁剪透明边缘": ("BOOLEAN", {"default": False, "tooltip": "把图层像素裁剪到不透明内容的包围盒，合成结果不变\n图层改为以锚点[0,0]定位在内容左上角，延迟加载的图层不裁剪"}),
+                "解码线程数": ("INT", {"default": 0, "min": 0, "max": 64, "tooltip": "并行解码图层像素的线程数\n0为自动（CPU核心数），1为逐图层顺序解码"}),
+                "导入缓存(MB)": ("INT", {"default": 2048, "min": 0, "max": 65536, "tooltip": "导入结果的磁盘缓存上限（MB），PSD文件未修改时直接从缓存读取\n0为关闭缓存"}),
+                "延迟加载像素": ("BOOLEAN", {"default": False, "tooltip": "只读取图层信息，图层像素在第一次被使用时才从PSD文件解码\n适合只需要图层列表或少数图层的工作流"}),
             }
         }
     
@@ -35,22 +85,17 @@ class ImportPSDNode:
     FUNCTION = "import_psd"
     CATEGORY = "AFA2D/图层IO"
     
-    def import_psd(self, **kwargs):
-        """从PSD文件导入文档"""
-        # 检查psd-tools是否可用
-        if not PSD_AVAILABLE:
-            error_msg = "错误：需要安装psd-tools库。请运行: pip install psd-tools"
-            return (None, error_msg)
-        
-        # 参数映射
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # PSD文件未修改（路径、修改时间、大小相同）时ComfyUI直接复用上次的输出
         psd_file = kwargs.get("PSD文件", "")
-        keep_original_size = kwargs.get("保持原始尺寸", True)
-        
-        # 处理文件路径 - 支持上传的文件名和完整路径
         if not psd_file:
-            error_msg = "错误：请选择PSD文件"
-            return (None, error_msg)
-        
+            return ""
+        return import_cache.file_signature(cls._resolve_psd_path(psd_file)) or ""
+    
+    @staticmethod
+    def _resolve_psd_path(psd_file):
+        """把上传的文件名或路径解析为PSD文件的完整路径"""
         # 如果是上传的文件名，构建完整路径
         if not os.path.isabs(psd_file):
             if FOLDER_PATHS_AVAILABLE:
@@ -66,12 +111,56 @@ class ImportPSDNode:
                 psd_path = os.path.abspath(psd_file)
         else:
             psd_path = psd_file
+        return psd_path
+    
+    @staticmethod
+    def _decode_layer_image(psd_layer, storage="float32"):
+        """解码单个PSD图层为 [H, W, 4] 的张量（按存储格式），图层没有像素时返回None
+
+        alpha不包含图层不透明度，不透明度保存在图层的 opacity 中
+        """
+        return composite_psd_layer(psd_layer, storage)
+    
+    def import_psd(self, **kwargs):
+        """从PSD文件导入文档"""
+        # 检查psd-tools是否可用
+        if not PSD_AVAILABLE:
+            error_msg = "错误：需要安装psd-tools库。请运行: pip install psd-tools"
+            return (None, error_msg)
+        
+        # 参数映射
+        psd_file = kwargs.get("PSD文件", "")
+        keep_original_size = kwargs.get("保持原始尺寸", True)
+        lazy_pixels = kwargs.get("延迟加载像素", False)
+        decode_workers = kwargs.get("解码线程数", 0) or os.cpu_count() or 1
+        cache_mb = kwargs.get("导入缓存(MB)", 2048)
+        storage = kwargs.get("存储格式", DEFAULT_LAYER_STORAGE)
+        auto_trim = kwargs.get("裁剪透明边缘", False)
+        
+        # 处理文件路径 - 支持上传的文件名和完整路径
+        if not psd_file:
+            error_msg = "错误：请选择PSD文件"
+            return (None, error_msg)
+        
+        psd_path = self._resolve_psd_path(psd_file)
         
         # 检查文件是否存在
         if not os.path.exists(psd_path):
             error_msg = f"错误：PSD文件不存在: {psd_path}"
             return (None, error_msg)
         
+        # 未修改的PSD直接从磁盘缓存读取
+        cache_key = None
+        if cache_mb > 0:
+            cache_key = import_cache.cache_key(psd_path, {"lazy_pixels": bool(lazy_pixels), "storage": storage, "auto_trim": bool(auto_trim)})
+            cached = import_cache.load(cache_key) if cache_key else None
+            if cached is not None:
+                document, import_info = cached
+                document["document_id"] = str(uuid.uuid4())
+                index_document(document)
+                print(f"✓ 从导入缓存读取PSD文件: {psd_path}（{len(document['layers'])} 个图层）")
+                return (document, import_info)
+        
         try:
             # 打开PSD文件
             print(f"🔄 开始导入PSD文件: {psd_path}")
@@ -142,6 +231,50 @@ class ImportPSDNode:
                 }
             }
             
+            # 非组图层在PSD中的序号，延迟加载时用于定位图层像素
+            psd_leaves = psd_leaf_layers(psd)
+            leaf_indices = {id(leaf): index for index, leaf in enumerate(psd_leaves)}
+            
+            # 普通像素图层直接从内存映射的通道数据解码，跳过psd-tools合成和中间的8位图像
+            reader = None
+            reader_records = None
+            if not lazy_pixels:
+                reader = open_psd_reader(psd_path)
+                if reader is not None and len(reader.leaf_layers()) == len(psd_leaves):
+                    reader_records = reader.leaf_layers()
+            
+            def decode_layer(psd_layer):
+                if reader_records is not None:
+                    record = reader_records[leaf_indices[id(psd_layer)]]
+                    if reader.can_read_directly(record):
+                        image_array = reader.read_layer_rgba(record, storage)
+                        return torch.from_numpy(image_array) if image_array is not None else None
+                return self._decode_layer_image(psd_layer, storage)
+            
+            # 并行解码所有可见的普通图层，结果按图层保存，之后仍按文档顺序分配图层ID
+            decoded_layers = {}
+            executor = None
+            if not lazy_pixels and decode_workers > 1:
+                decode_targets = []
+                
+                def collect_decode_targets(psd_layer):
+                    if not psd_layer.visible:
+                        return
+                    if hasattr(psd_layer, 'is_group') and psd_layer.is_group():
+                        for child_layer in psd_layer:
+                            collect_decode_targets(child_layer)
+                    else:
+                        decode_targets.append(psd_layer)
+                
+                for layer in psd:
+                    collect_decode_targets(layer)
+                
+                if len(decode_targets) > 1:
+                    print(f"🔄 使用 {min(decode_workers, len(decode_targets))} 个线程并行解码 {len(decode_targets)} 个图层")
+                    executor = ThreadPoolExecutor(max_workers=min(decode_workers, len(decode_targets)))
+                    for target in decode_targets:
+                        decoded_layers[id(target)] = executor.submit(decode_layer, target)
+            
             # 递归处理图层
             layer_id_counter = 0
             
@@ -164,18 +297,22 @@ class ImportPSDNode:
                 else:
                     # 处理普通图层
                     try:
-                        # 获取图层图像
-                        layer_image = psd_layer.composite()
-                        if layer_image is None:
-                            return []
-                        
-                        # 转换为RGBA格式
-                        if layer_image.mode != 'RGBA':
-                            layer_image = layer_image.convert('RGBA')
-                        
-                        # 转换为tensor
-                        image_array = np.array(layer_image).astype(np.float32) / 255.0
-                        image_tensor = torch.from_numpy(image_array)
+                        pixel_source = None
+                        if lazy_pixels:
+                            # 延迟加载：只记录像素来源，不解码图层图像
+                            if psd_layer.width <= 0 or psd_layer.height <= 0:
+                                return []
+                            image_tensor = None
+                            pixel_source = make_psd_pixel_source(psd_path, leaf_indices[id(psd_layer)], storage)
+                        else:
+                            # 获取图层图像（已并行解码的图层直接取结果）
+                            decode_future = decoded_layers.get(id(psd_layer))
+                            if decode_future is not None:
+                                image_tensor = decode_future.result()
+                            else:
+                                image_tensor = decode_layer(psd_layer)
+                            if image_tensor is None:
+                                return []
                         
                         # 获取图层属性
                         layer_name = psd_layer.name if psd_layer.name else f"图层{layer_id_counter}"
@@ -257,7 +394,8 @@ class ImportPSDNode:
                             "blend_mode": blend_mode,
                             "metadata": {
                                 "created_by": "ImportPSDNode",
-                                "data_type": "tensor",
+                                "data_type": "lazy" if lazy_pixels else "tensor",
+                                "pixel_format": pixel_format(storage),
                                 "source_layer": psd_layer.name,
                                 "original_blend_mode": psd_blend_mode,
                                 "psd_opacity": psd_layer.opacity if hasattr(psd_layer, 'opacity') else 255,
@@ -266,6 +404,12 @@ class ImportPSDNode:
                             }
                         }
                         
+                        if pixel_source is not None:
+                            layer["pixel_source"] = pixel_source
+                        elif auto_trim:
+                            # 裁剪透明边缘，只保存有内容的区域
+                            trim_layer(layer)
+                        
                         layers.append(layer)
                         layer_id_counter += 1
                         
@@ -278,12 +422,19 @@ class ImportPSDNode:
             # 处理所有图层
             all_layers = []
             print(f"\n🔄 开始处理图层...")
-            for layer in psd:
-                processed_layers = process_layer(layer)
-                all_layers.extend(processed_layers)
+            try:
+                for layer in psd:
+                    processed_layers = process_layer(layer)
+                    all_layers.extend(processed_layers)
+            finally:
+                # 先取消未开始的解码并等待进行中的解码结束，再关闭解码线程读取的内存映射
+                if executor is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                if reader is not None:
+                    reader.close()
             
-            # 将图层添加到文档
-            document["layers"] = all_layers
+            # 将图层添加到文档，并建立图层ID索引
+            index_document(document, all_layers)
             
             # 输出处理总结
             print(f"✅ 图层处理完成，共处理 {len(all_layers)} 个图层")
@@ -354,6 +505,8 @@ class ImportPSDNode:
                 if 'image_data' in layer and layer['image_data'] is not None:
                     img_shape = layer['image_data'].shape
                     import_info += f"  图像数据: {img_shape} (tensor)\n"
+                elif layer.get('pixel_source'):
+                    import_info += f"  图像数据: 延迟加载（首次使用时解码）\n"
                 
                 import_info += "\n"
             
@@ -362,6 +515,10 @@ class ImportPSDNode:
             for psd_mode, internal_mode in blend_mode_map.items():
                 import_info += f"  {psd_mode} -> {internal_mode}\n"
             
+            if cache_key:
+                import_cache.store(cache_key, document, import_info,
+                                   uint8_pixels=psd.depth == 8, max_bytes=cache_mb * 1024 * 1024)
+            
             return (document, import_info)
             
         except Exception as e:
@@ -0,0 +1,318 @@
+"""
+延迟像素加载模块
+图层可以只保存像素来源（pixel_source），在第一次需要像素时才解码
+
+pixel_source 格式：
+    {"type": "psd", "path": PSD文件路径, "leaf_index": 图层在PSD中的序号,
+     "mtime": 文件修改时间, "file_size": 文件大小, "storage": 存储格式}
+leaf_index 是图层在 psd.descendants() 中去掉图层组后的序号，与可见性无关。
+普通像素图层通过 psd_reader 以内存映射方式直接读取通道，其余图层回退到psd-tools合成。
+文件在导入后被修改时，图层的位置和尺寸已与文件不一致，解码时抛出 StalePixelSourceError。
+
+按路径加载本模块时请以 "afa_pixel_source" 注册到 sys.modules，使各节点共享同一份已解码像素缓存。
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+try:
+    from psd_tools import PSDImage
+    PSD_AVAILABLE = True
+except ImportError:
+    PSD_AVAILABLE = False
+
+try:
+    from .psd_reader import open_psd_reader
+except ImportError:
+    import importlib.util
+    psd_reader_module = sys.modules.get("afa_psd_reader")
+    if psd_reader_module is None:
+        psd_reader_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "psd_reader.py")
+        spec = importlib.util.spec_from_file_location("afa_psd_reader", psd_reader_path)
+        psd_reader_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(psd_reader_module)
+        sys.modules["afa_psd_reader"] = psd_reader_module
+    open_psd_reader = psd_reader_module.open_psd_reader
+
+# 图层像素的存储格式：uint8每像素4字节，float16为8字节，float32为16字节
+# 只有在需要ComfyUI图像或参与浮点合成时才转换为float32
+LAYER_STORAGE_FORMATS = ["uint8", "float16", "float32"]
+DEFAULT_LAYER_STORAGE = "uint8"
+
+# 已解码像素的缓存上限（字节）
+PIXEL_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# 同时保持打开的PSD文件数量
+OPEN_PSD_LIMIT = 2
+
+# 只保护缓存和打开文件的记录，解码在锁外进行，多个线程可以同时解码不同的图层
+_lock = threading.Lock()
+_pixel_cache = OrderedDict()
+_pixel_cache_bytes = 0
+_open_psds = OrderedDict()
+_open_readers = OrderedDict()
+_COMPOSITE_LOCKS = tuple(threading.Lock() for _ in range(16))
+
+
+class StalePixelSourceError(RuntimeError):
+    """像素来源指向的文件在导入后已被修改"""
+
+
+def pack_layer_pixels(image, storage=DEFAULT_LAYER_STORAGE):
+    """把图层像素转换为存储格式
+
+    Args:
+        image: uint8（0~255）或浮点（0~1）张量
+        storage: "uint8" / "float16" / "float32"
+    """
+    if storage == "uint8":
+        if image.dtype == torch.uint8:
+            return image
+        return image.float().mul(255.0).round_().clamp_(0, 255).to(torch.uint8)
+    dtype = torch.float16 if storage == "float16" else torch.float32
+    if image.dtype == torch.uint8:
+        return image.to(torch.float32).div_(255.0).to(dtype)
+    return image.to(dtype)
+
+
+def pixel_format(storage):
+    """存储格式对应的像素格式描述，写入图层 metadata["pixel_format"]，转换图像时不必再探测取值范围"""
+    return {"dtype": storage, "value_range": 255 if storage == "uint8" else 1.0}
+
+
+def pixels_to_float(image):
+    """把任意存储格式的图层像素转换为0~1范围的float32张量（ComfyUI图像）"""
+    if image.dtype == torch.uint8:
+        return image.to(torch.float32).div_(255.0)
+    if image.dtype != torch.float32:
+        return image.to(torch.float32)
+    return image
+
+
+def trim_transparent_pixels(image):
+    """裁剪掉图像四周完全透明的边缘
+
+    Returns:
+        (裁剪后的像素, (left, top))；没有可裁剪的边缘时返回原张量，完全透明时保留左上角的1x1像素
+    """
+    if image.dim() != 3 or image.shape[-1] != 4:
+        return image, (0, 0)
+    opaque = image[..., 3] > 0
+    rows = torch.nonzero(opaque.any(dim=1)).flatten()
+    cols = torch.nonzero(opaque.any(dim=0)).flatten()
+    if rows.numel() == 0:
+        return image[:1, :1].clone(), (0, 0)
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    left, right = int(cols[0]), int(cols[-1]) + 1
+    if (top, left, bottom, right) == (0, 0, image.shape[0], image.shape[1]):
+        return image, (0, 0)
+    # 复制裁剪区域，释放原来整幅图像的内存
+    return image[top:bottom, left:right].clone(), (left, top)
+
+
+def trim_layer(layer):
+    """把新建图层的像素裁剪到alpha包围盒，合成结果不变（直接修改传入的图层，只用于尚未传递给其他节点的图层）
+
+    裁剪后图层以锚点[0,0]定位在内容的左上角，原始尺寸和裁剪偏移记录在 metadata["trim"] 中。
+    """
+    image_data = layer.get("image_data")
+    position = layer.get("position")
+    if image_data is None or not isinstance(position, (list, tuple)) or len(position) < 2:
+        return layer
+    height, width = image_data.shape[0], image_data.shape[1]
+    trimmed, (left, top) = trim_transparent_pixels(image_data)
+    if trimmed is image_data:
+        return layer
+
+    # 与合成器相同的定位方式计算原图层左上角
+    anchor = layer.get("anchor", [0.0, 0.0])
+    actual_x = int(position[0] - width * anchor[0])
+    actual_y = int(position[1] - height * anchor[1])
+    layer["image_data"] = trimmed
+    layer["position"] = [actual_x + left, actual_y + top]
+    layer["anchor"] = [0.0, 0.0]
+    layer["size"] = [trimmed.shape[1], trimmed.shape[0]]
+    metadata = dict(layer.get("metadata") or {})
+    metadata["trim"] = {"offset": [left, top], "original_size": [width, height]}
+    layer["metadata"] = metadata
+    return layer
+
+
+def make_psd_pixel_source(psd_path, leaf_index, storage="float32"):
+    """创建指向PSD文件中某个图层的像素来源"""
+    stat = os.stat(psd_path)
+    return {
+        "type": "psd",
+        "path": psd_path,
+        "leaf_index": leaf_index,
+        "mtime": stat.st_mtime,
+        "file_size": stat.st_size,
+        "storage": storage,
+    }
+
+
+def psd_leaf_layers(psd):
+    """按 leaf_index 顺序返回PSD中的所有非组图层"""
+    return [layer for layer in psd.descendants() if not layer.is_group()]
+
+
+def _open_cached(opened, key, open_file):
+    """返回最近使用的已打开文件，没有时在锁外打开后再记录
+
+    被淘汰的文件不显式关闭：其他线程可能仍在解码，最后一个引用释放时由垃圾回收关闭。
+    """
+    with _lock:
+        if key in opened:
+            opened.move_to_end(key)
+            return opened[key]
+    entry = open_file()
+    with _lock:
+        # 其他线程同时打开了同一个文件时使用先记录的那个
+        entry = opened.setdefault(key, entry)
+        opened.move_to_end(key)
+        while len(opened) > OPEN_PSD_LIMIT:
+            opened.popitem(last=False)
+    return entry
+
+
+def _open_psd(psd_path, mtime):
+    """打开PSD文件，最近使用的文件保持打开以便连续解码多个图层"""
+    def open_file():
+        psd = PSDImage.open(psd_path)
+        return psd, psd_leaf_layers(psd)
+    return _open_cached(_open_psds, (psd_path, mtime), open_file)
+
+
+def _open_reader(psd_path, mtime):
+    """以内存映射方式打开PSD文件，文件格式不受支持时返回None"""
+    return _open_cached(_open_readers, (psd_path, mtime), lambda: open_psd_reader(psd_path))
+
+
+def composite_psd_layer(psd_layer, storage="float32"):
+    """用psd-tools合成单个图层（蒙版、图层样式、剪贴等），返回 [H, W, 4] 的张量，图层没有像素时返回None
+
+    composite() 会把图层不透明度乘进alpha，而图层单独保存 opacity 并在合成文档时应用，
+    这里合成时把不透明度临时设为255，结果与直接读取通道（psd_reader）一致，不透明度为0的图层也保留像素
+    """
+    record = psd_layer._record
+    # 同一图层可能被多个线程同时解码（共享打开的PSD），修改和恢复不透明度时按图层记录加锁
+    with _COMPOSITE_LOCKS[(id(record) >> 4) % len(_COMPOSITE_LOCKS)]:
+        opacity = record.opacity
+        # 直接修改图层记录，不通过 opacity 属性，避免把PSD标记为已修改
+        record.opacity = 255
+        try:
+            layer_image = psd_layer.composite()
+        finally:
+            record.opacity = opacity
+    if layer_image is None:
+        return None
+    if layer_image.mode != "RGBA":
+        layer_image = layer_image.convert("RGBA")
+    return pack_layer_pixels(torch.from_numpy(np.array(layer_image)), storage)
+
+
+def _decode_psd_layer(pixel_source):
+    """解码PSD图层为 [H, W, 4] 的张量，格式由 pixel_source 的 storage 决定（旧的像素来源为float32）"""
+    psd_path = pixel_source["path"]
+    storage = pixel_source.get("storage", "float32")
+    stat = os.stat(psd_path)
+    mtime = stat.st_mtime
+    if (pixel_source.get("mtime") is not None and mtime != pixel_source["mtime"]) or \
+            (pixel_source.get("file_size") is not None and stat.st_size != pixel_source["file_size"]):
+        # 图层的位置、尺寸和序号来自导入时的文件，继续解码会得到错位的像素
+        raise StalePixelSourceError(f"PSD文件在导入后已被修改，请重新导入: {psd_path}")
+
+    # 普通像素图层直接从文件映射读取通道，不需要解析整个PSD
+    reader = _open_reader(psd_path, mtime)
+    if reader is not None:
+        records = reader.leaf_layers()
+        leaf_index = pixel_source["leaf_index"]
+        if leaf_index < len(records) and reader.can_read_directly(records[leaf_index]):
+            image_array = reader.read_layer_rgba(records[leaf_index], storage)
+            return torch.from_numpy(image_array) if image_array is not None else None
+
+    if not PSD_AVAILABLE:
+        raise RuntimeError("需要安装psd-tools库。请运行: pip install psd-tools")
+    _, leaves = _open_psd(psd_path, mtime)
+    return composite_psd_layer(leaves[pixel_source["leaf_index"]], storage)
+
+
+_DECODERS = {
+    "psd": _decode_psd_layer,
+}
+
+
+def _pixel_source_key(pixel_source):
+    return (pixel_source.get("type"), pixel_source.get("path"), pixel_source.get("leaf_index"), pixel_source.get("mtime"), pixel_source.get("storage"))
+
+
+def load_pixel_source(pixel_source, cache=True):
+    """解码像素来源，同一来源返回缓存中的同一个张量
+
+    cache为False时不把新解码的像素放入缓存（只读一遍所有图层的场景，如PSD导出）。
+    """
+    global _pixel_cache_bytes
+    key = _pixel_source_key(pixel_source)
+    with _lock:
+        tensor = _pixel_cache.get(key)
+        if tensor is not None:
+            _pixel_cache.move_to_end(key)
+            return tensor
+
+    decoder = _DECODERS.get(pixel_source.get("type"))
+    if decoder is None:
+        raise ValueError(f"不支持的像素来源类型: {pixel_source.get('type')}")
+    tensor = decoder(pixel_source)
+    if tensor is None or not cache:
+        return tensor
+
+    size = tensor.element_size() * tensor.nelement()
+    if size > PIXEL_CACHE_BYTES:
+        return tensor
+    with _lock:
+        # 其他线程同时解码了同一个来源时返回先放入缓存的张量
+        cached = _pixel_cache.get(key)
+        if cached is not None:
+            _pixel_cache.move_to_end(key)
+            return cached
+        _pixel_cache[key] = tensor
+        _pixel_cache_bytes += size
+        while _pixel_cache_bytes > PIXEL_CACHE_BYTES:
+            _, evicted = _pixel_cache.popitem(last=False)
+            _pixel_cache_bytes -= evicted.element_size() * evicted.nelement()
+    return tensor
+
+
+def resolve_layer_pixels(layer, cache=True):
+    """返回图层的像素数据（保持存储格式）：优先使用image_data，没有时按pixel_source延迟解码
+
+    解码失败时打印错误并返回None；文件在导入后被修改时抛出 StalePixelSourceError。
+    """
+    image_data = layer.get("image_data")
+    if image_data is not None:
+        return image_data
+    pixel_source = layer.get("pixel_source")
+    if not pixel_source:
+        return None
+    try:
+        return load_pixel_source(pixel_source, cache)
+    except StalePixelSourceError:
+        raise
+    except Exception as e:
+        print(f"[延迟加载] 解码图层 '{layer.get('name', '')}' 的像素时出错: {e}")
+        return None
+
+
+def clear_pixel_cache():
+    """清空已解码像素和打开的PSD文件（正在解码的文件在解码结束后关闭）"""
+    global _pixel_cache_bytes
+    with _lock:
+        _pixel_cache.clear()
+        _open_psds.clear()
+        _open_readers.clear()
+        _pixel_cache_bytes = 0
+
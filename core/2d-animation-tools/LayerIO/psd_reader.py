@@ -0,0 +1,367 @@
+"""
+PSD内存映射读取模块
+用mmap映射PSD/PSB文件，只解析图层记录和通道数据的偏移，不把通道数据读入内存。
+channel_view / read_channel 对未压缩的通道返回文件映射上的numpy视图，RLE/ZIP压缩的通道在读取时才解压；
+read_layer_rgba 把各通道复制到新的RGBA数组中（每个通道只复制一次，不经过中间图像），
+因此内存占用只与实际读取的图层大小有关。
+映射上的视图只在 close() 之前有效，需要在关闭后继续使用的数据请先复制。
+
+只处理图层本身的像素通道；图层蒙版、图层样式、剪贴蒙版、矢量形状和调整/填充图层
+不在这里合成，调用方可通过 can_read_directly 判断后回退到psd-tools。
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    from psd_tools.compression import rle_impl
+    RLE_IMPL_AVAILABLE = True
+except ImportError:
+    RLE_IMPL_AVAILABLE = False
+
+# 颜色模式
+COLOR_MODE_GRAYSCALE = 1
+COLOR_MODE_RGB = 3
+
+# 通道压缩方式
+COMPRESSION_RAW = 0
+COMPRESSION_RLE = 1
+COMPRESSION_ZIP = 2
+COMPRESSION_ZIP_PREDICTION = 3
+
+# 图层组分隔记录（lsct/lsdk）的类型：1/2为展开/折叠的组，3为组的结束标记
+SECTION_DIVIDER_KEYS = (b"lsct", b"lsdk")
+
+# 出现这些附加信息时图层像素需要额外合成，不能直接读取通道
+EFFECT_KEYS = {b"lfx2", b"lrFX", b"lmfx", b"lfxs"}
+VECTOR_KEYS = {b"vmsk", b"vsms", b"vscg"}
+ADJUSTMENT_KEYS = {
+    b"SoCo", b"GdFl", b"PtFl", b"brit", b"levl", b"curv", b"expA", b"vibA",
+    b"hue ", b"hue2", b"blnc", b"blwh", b"phfl", b"mixr", b"clrL", b"nvrt",
+    b"post", b"thrs", b"grdm", b"selc",
+}
+
+# PSB文件中长度字段为8字节的附加信息
+PSB_LONG_KEYS = {
+    b"LMsk", b"Lr16", b"Lr32", b"Layr", b"Mt16", b"Mt32", b"Mtrn",
+    b"Alph", b"FMsk", b"lnk2", b"FEid", b"FXid", b"PxSD",
+}
+
+_DEPTH_DTYPES = {8: np.dtype(">u1"), 16: np.dtype(">u2"), 32: np.dtype(">f4")}
+_DEPTH_SCALE = {8: 255.0, 16: 65535.0, 32: 1.0}
+
+
+def _decode_packbits(data, size):
+    """PackBits解码（未安装psd-tools的加速实现时使用）"""
+    result = bytearray(size)
+    i, j, length = 0, 0, len(data)
+    while i < length and j < size:
+        header = data[i]
+        i += 1
+        if header > 128:
+            count = min(257 - header, size - j)
+            if i >= length:
+                break
+            result[j:j + count] = bytes((data[i],)) * count
+            j += count
+            i += 1
+        elif header < 128:
+            count = min(header + 1, length - i, size - j)
+            result[j:j + count] = data[i:i + count]
+            j += count
+            i += header + 1
+    return bytes(result)
+
+
+class PSDChannel:
+    """图层通道在文件中的位置"""
+
+    def __init__(self, channel_id, offset, length):
+        self.channel_id = channel_id
+        self.offset = offset      # 压缩方式字段之后的数据起点
+        self.length = length      # 不含压缩方式字段的数据长度
+        self.compression = None
+
+
+class PSDLayerRecord:
+    """图层记录：位置、通道和附加信息，不包含像素数据"""
+
+    def __init__(self):
+        self.name = ""
+        self.top = self.left = self.bottom = self.right = 0
+        self.channels = {}
+        self.blend_key = b"norm"
+        self.opacity = 255
+        self.clipping = 0
+        self.visible = True
+        self.section_type = 0
+        self.has_mask = False
+        self.keys = set()
+        self.has_clip_layers = False
+
+    @property
+    def width(self):
+        return max(0, self.right - self.left)
+
+    @property
+    def height(self):
+        return max(0, self.bottom - self.top)
+
+    def is_group_record(self):
+        """图层组的开始或结束记录"""
+        return self.section_type in (1, 2, 3)
+
+
+class PSDReader:
+    """以内存映射方式读取PSD/PSB文件的图层通道"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """关闭文件映射，之后 channel_view / read_channel 返回的视图不能再使用"""
+        if getattr(self, "_mmap", None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有numpy视图引用映射时由垃圾回收释放
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---- 解析 ----
+
+    def _read(self, fmt, offset):
+        return struct.unpack_from(fmt, self._mmap, offset)
+
+    def _parse(self):
+        signature, version, _, channels, height, width, depth, color_mode = self._read(">4sH6sHIIHH", 0)
+        if signature != b"8BPS" or version not in (1, 2):
+            raise ValueError(f"不是有效的PSD文件: {self.path}")
+        self.version = version
+        self.width, self.height = width, height
+        self.depth = depth
+        self.color_mode = color_mode
+        self.layers = []
+
+        offset = 26
+        (color_data_length,) = self._read(">I", offset)
+        offset += 4 + color_data_length
+        (resources_length,) = self._read(">I", offset)
+        offset += 4 + resources_length
+
+        length_fmt = ">Q" if version == 2 else ">I"
+        length_size = 8 if version == 2 else 4
+        (layer_mask_length,) = self._read(length_fmt, offset)
+        offset += length_size
+        if layer_mask_length == 0:
+            return
+        (layer_info_length,) = self._read(length_fmt, offset)
+        offset += length_size
+        if layer_info_length == 0:
+            # 16/32位文件的图层信息保存在Lr16/Lr32附加信息中，暂不支持
+            return
+
+        (layer_count,) = self._read(">h", offset)
+        offset += 2
+        for _ in range(abs(layer_count)):
+            record, offset = self._parse_layer_record(offset, length_fmt, length_size)
+            self.layers.append(record)
+
+        # 通道图像数据按图层记录顺序紧随其后
+        for record in self.layers:
+            for channel in record.channels.values():
+                (channel.compression,) = self._read(">H", offset)
+                channel.offset = offset + 2
+                offset += channel.length + 2
+
+        # 剪贴蒙版：clipping为1的图层剪贴到下方最近的非剪贴图层
+        base = None
+        for record in self.layers:
+            if record.is_group_record():
+                base = None
+            elif record.clipping:
+                if base is not None:
+                    base.has_clip_layers = True
+            else:
+                base = record
+
+    def _parse_layer_record(self, offset, length_fmt, length_size):
+        record = PSDLayerRecord()
+        record.top, record.left, record.bottom, record.right, channel_count = self._read(">iiiiH", offset)
+        offset += 18
+        channel_ids = []
+        for _ in range(channel_count):
+            (channel_id,) = self._read(">h", offset)
+            (length,) = self._read(length_fmt, offset + 2)
+            offset += 2 + length_size
+            channel_ids.append((channel_id, length))
+        # 通道数据长度包含2字节的压缩方式字段
+        for channel_id, length in channel_ids:
+            record.channels[channel_id] = PSDChannel(channel_id, None, max(0, length - 2))
+
+        _, record.blend_key, record.opacity, record.clipping, flags, _, extra_length = self._read(">4s4sBBBBI", offset)
+        record.visible = not (flags & 0x02)
+        offset += 16
+        extra_end = offset + extra_length
+
+        (mask_length,) = self._read(">I", offset)
+        if mask_length >= 18:
+            top, left, bottom, right, _, mask_flags = self._read(">iiiiBB", offset + 4)
+            # 蒙版被停用（flags第2位）或为空时不影响像素
+            record.has_mask = bottom > top and right > left and not (mask_flags & 0x02)
+        offset += 4 + mask_length
+        (ranges_length,) = self._read(">I", offset)
+        offset += 4 + ranges_length
+
+        name_length = self._mmap[offset]
+        record.name = bytes(self._mmap[offset + 1:offset + 1 + name_length]).decode("latin-1")
+        offset += (name_length + 1 + 3) & ~3
+
+        while offset + 12 <= extra_end:
+            signature, key = self._read(">4s4s", offset)
+            if signature not in (b"8BIM", b"8B64"):
+                break
+            if self.version == 2 and key in PSB_LONG_KEYS:
+                (length,) = self._read(">Q", offset + 8)
+                data_offset = offset + 16
+            else:
+                (length,) = self._read(">I", offset + 8)
+                data_offset = offset + 12
+            record.keys.add(key)
+            if key == b"luni":
+                (char_count,) = self._read(">I", data_offset)
+                raw = bytes(self._mmap[data_offset + 4:data_offset + 4 + char_count * 2])
+                record.name = raw.decode("utf-16-be").rstrip("\x00")
+            elif key in SECTION_DIVIDER_KEYS:
+                (record.section_type,) = self._read(">I", data_offset)
+            offset = data_offset + length
+            # 附加信息按偶数或4字节对齐
+            for align in (1, 2, 4):
+                aligned = (offset + align - 1) & ~(align - 1)
+                if aligned + 4 > extra_end or self._mmap[aligned:aligned + 4] in (b"8BIM", b"8B64"):
+                    offset = aligned
+                    break
+        return record, extra_end
+
+    # ---- 读取 ----
+
+    def leaf_layers(self):
+        """按文件顺序返回所有非组图层，顺序与 pixel_source 的 leaf_index 一致"""
+        return [record for record in self.layers if not record.is_group_record()]
+
+    def can_read_directly(self, record):
+        """图层像素是否等于其通道数据（无需蒙版、样式、剪贴等额外合成）"""
+        if self.color_mode not in (COLOR_MODE_RGB, COLOR_MODE_GRAYSCALE) or self.depth not in _DEPTH_DTYPES:
+            return False
+        if record.has_mask or record.has_clip_layers:
+            return False
+        return not (record.keys & (EFFECT_KEYS | VECTOR_KEYS | ADJUSTMENT_KEYS))
+
+    def channel_view(self, record, channel_id):
+        """通道数据（可能是压缩数据）在文件映射上的只读视图，只在 close() 之前有效"""
+        channel = record.channels[channel_id]
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=channel.length, offset=channel.offset)
+
+    def read_channel(self, record, channel_id):
+        """读取一个通道为 [H, W] 数组；未压缩的通道直接返回文件映射上的视图（只在 close() 之前有效）"""
+        channel = record.channels[channel_id]
+        height, width = record.height, record.width
+        dtype = _DEPTH_DTYPES[self.depth]
+        count = height * width
+        if count == 0:
+            return np.zeros((height, width), dtype=dtype)
+        row_bytes = width * dtype.itemsize
+
+        if channel.compression == COMPRESSION_RAW:
+            return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=channel.offset).reshape(height, width)
+
+        if channel.compression == COMPRESSION_RLE:
+            # 先是每行的压缩字节数（PSD为2字节，PSB为4字节），之后是PackBits数据；行之间的游程不跨行
+            counts_size = (4 if self.version == 2 else 2) * height
+            data = self._mmap[channel.offset + counts_size:channel.offset + channel.length]
+            decode = rle_impl.decode if RLE_IMPL_AVAILABLE else _decode_packbits
+            raw = decode(data, row_bytes * height)
+            return np.frombuffer(raw, dtype=dtype, count=count).reshape(height, width)
+
+        if channel.compression in (COMPRESSION_ZIP, COMPRESSION_ZIP_PREDICTION):
+            raw = zlib.decompress(self._mmap[channel.offset:channel.offset + channel.length])
+            if channel.compression == COMPRESSION_ZIP:
+                return np.frombuffer(raw, dtype=dtype, count=count).reshape(height, width)
+            if self.depth == 8:
+                rows = np.frombuffer(raw, dtype=np.uint8, count=count).reshape(height, width)
+                return np.cumsum(rows, axis=1, dtype=np.uint8)
+            if self.depth == 16:
+                rows = np.frombuffer(raw, dtype=">u2", count=count).reshape(height, width)
+                return np.cumsum(rows, axis=1, dtype=np.uint16)
+            # 32位：每行先按字节差分，字节按平面（高位到低位）存放
+            rows = np.frombuffer(raw, dtype=np.uint8, count=count * 4).reshape(height, width * 4)
+            planes = np.cumsum(rows, axis=1, dtype=np.uint8).reshape(height, 4, width)
+            return np.ascontiguousarray(planes.transpose(0, 2, 1)).view(">f4").reshape(height, width)
+
+        raise ValueError(f"不支持的通道压缩方式: {channel.compression}")
+
+    def read_layer_rgba(self, record, storage="float32"):
+        """读取图层为 [H, W, 4] 的新数组（不引用文件映射，关闭后仍可使用），图层为空时返回None
+
+        storage为 "float32"/"float16" 时返回0~1的浮点数组，为 "uint8" 时返回0~255的uint8数组。
+        每个通道解压后直接转换写入结果数组，不再创建中间的8位RGBA图像。
+        """
+        height, width = record.height, record.width
+        if height == 0 or width == 0:
+            return None
+        if storage == "uint8" and self.depth == 8:
+            # 8位文件直接复制通道，不经过浮点转换
+            dtype, scale, opaque = np.uint8, None, 255
+        else:
+            dtype, scale, opaque = np.float32, np.float32(_DEPTH_SCALE[self.depth]), 1.0
+        color_ids = (0, 1, 2) if self.color_mode == COLOR_MODE_RGB else (0, 0, 0)
+        rgba = np.empty((height, width, 4), dtype=dtype)
+        decoded = {}
+        for target, channel_id in enumerate(color_ids + (-1,)):
+            if channel_id not in record.channels:
+                rgba[..., target] = opaque if channel_id == -1 else 0
+                continue
+            if channel_id in decoded:
+                rgba[..., target] = rgba[..., decoded[channel_id]]
+                continue
+            if scale is None:
+                rgba[..., target] = self.read_channel(record, channel_id)
+            else:
+                np.divide(self.read_channel(record, channel_id), scale, out=rgba[..., target], dtype=np.float32)
+            decoded[channel_id] = target
+        if self.depth == 32:
+            np.clip(rgba, 0.0, 1.0, out=rgba)
+        if storage == "uint8" and dtype != np.uint8:
+            return np.rint(rgba * 255.0).astype(np.uint8)
+        if storage == "float16":
+            return rgba.astype(np.float16)
+        return rgba
+
+
+def open_psd_reader(path):
+    """打开PSD文件，文件格式不受支持时返回None"""
+    try:
+        return PSDReader(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"[PSD读取] 无法以内存映射方式读取 {os.path.basename(path)}: {e}")
+        return None
@@ -0,0 +1,302 @@
+"""
+PSD流式写入模块
+不构建完整的PSDImage，逐个图层压缩并写入通道数据，峰值内存只有一个图层的像素。
+
+文件结构要求所有图层记录写在通道数据之前，而记录中包含图层范围和压缩后的通道长度，
+因此先写入带占位值的图层记录，每写完一个图层的通道数据后回到记录位置填写实际的值。
+目前只写入8位RGB文件，图层为RGBA四个通道。
+
+workers大于1时通道压缩（每个通道一个任务）在线程池中并行进行，文件仍按图层顺序写入；
+zlib和psd-tools的RLE编码在压缩时释放GIL。同时等待压缩的图层数量有上限，内存占用保持有界。
+"""
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from psd_tools.compression import rle_impl
+    RLE_IMPL_AVAILABLE = True
+except ImportError:
+    RLE_IMPL_AVAILABLE = False
+
+# 通道压缩方式
+COMPRESSION_CODES = {"raw": 0, "rle": 1, "zip": 2}
+
+# 内部混合模式名称到PSD混合模式键
+BLEND_MODE_KEYS = {
+    "normal": b"norm",
+    "multiply": b"mul ",
+    "screen": b"scrn",
+    "overlay": b"over",
+    "soft_light": b"sLit",
+    "hard_light": b"hLit",
+    "color_dodge": b"div ",
+    "color_burn": b"idiv",
+    "darken": b"dark",
+    "lighten": b"lite",
+    "difference": b"diff",
+    "exclusion": b"smud",
+}
+
+# 图层通道：透明度、红、绿、蓝，对应RGBA数组的第3、0、1、2个通道
+LAYER_CHANNELS = ((-1, 3), (0, 0), (1, 1), (2, 2))
+
+
+def _encode_packbits(row):
+    """PackBits编码一行数据（未安装psd-tools的加速实现时使用）"""
+    result = bytearray()
+    length = len(row)
+    i = 0
+    while i < length:
+        # 重复段
+        run = 1
+        while i + run < length and run < 128 and row[i + run] == row[i]:
+            run += 1
+        if run >= 2:
+            result.append(257 - run)
+            result.append(row[i])
+            i += run
+            continue
+        # 字面段，直到出现重复或达到128字节
+        start = i
+        while i < length and i - start < 128 and not (i + 1 < length and row[i + 1] == row[i]):
+            i += 1
+        if i == start:
+            i += 1
+        result.append(i - start - 1)
+        result.extend(row[start:i])
+    return bytes(result)
+
+
+def compress_channel(channel, compression="rle", version=1):
+    """压缩一个 [H, W] 的uint8通道
+
+    Returns:
+        不含压缩方式字段的通道数据
+    """
+    if compression == "raw":
+        return np.ascontiguousarray(channel).tobytes()
+    if compression == "zip":
+        return zlib.compress(np.ascontiguousarray(channel).tobytes())
+    encode = rle_impl.encode if RLE_IMPL_AVAILABLE else _encode_packbits
+    rows = [encode(row.tobytes()) for row in channel]
+    counts = np.array([len(row) for row in rows], dtype=">u4" if version == 2 else ">u2")
+    return counts.tobytes() + b"".join(rows)
+
+
+def _pascal_name(name):
+    """图层名称的Pascal字符串（按4字节对齐），不能表示的字符由luni附加信息保存"""
+    encoded = name.encode("mac_roman", errors="replace")[:255]
+    data = bytes((len(encoded),)) + encoded
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _unicode_name_block(name):
+    """luni附加信息：UTF-16图层名称"""
+    data = struct.pack(">I", len(name)) + name.encode("utf-16-be")
+    data += b"\x00" * (-len(data) % 4)
+    return b"8BIM" + b"luni" + struct.pack(">I", len(data)) + data
+
+
+def _resolution_resource(dpi):
+    """图像资源1005（ResolutionInfo）"""
+    fixed = int(dpi * 65536)
+    data = struct.pack(">IHHIHH", fixed, 1, 1, fixed, 1, 1)
+    return b"8BIM" + struct.pack(">H", 1005) + b"\x00\x00" + struct.pack(">I", len(data)) + data
+
+
+class PSDStreamWriter:
+    """逐图层写入PSD文件
+
+    用法：
+        writer = PSDStreamWriter(path, width, height)
+        writer.write_layer_records([{"name": ..., "opacity": 0-255, "blend_mode": ..., "visible": ...}, ...])
+        for 每个图层:
+            writer.write_layer(rgba_uint8, left, top)
+        writer.close(merged_rgb)
+
+    写入过程中使用临时文件，close成功后才替换目标文件。
+    """
+
+    def __init__(self, path, width, height, compression="rle", dpi=72, workers=1):
+        if compression not in COMPRESSION_CODES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.compression = compression
+        # 并行压缩：同时最多有 workers * 2 个图层在等待写入
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 and compression != "raw" else None
+        self._max_pending = max(1, workers * 2)
+        self._pending = deque()
+        # 超过30000像素时使用PSB格式
+        self.version = 2 if max(width, height) > 30000 else 1
+        self._length_format = ">Q" if self.version == 2 else ">I"
+        self._temp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._temp_path, "wb")
+        self._record_offsets = []
+        self._next_layer = 0
+        self._write_header(dpi)
+
+    def _write_header(self, dpi):
+        f = self._file
+        f.write(struct.pack(">4sH6sHIIHH", b"8BPS", self.version, b"\x00" * 6, 3, self.height, self.width, 8, 3))
+        f.write(struct.pack(">I", 0))  # 颜色模式数据
+        resources = _resolution_resource(dpi)
+        f.write(struct.pack(">I", len(resources)) + resources)
+
+    def write_layer_records(self, layers):
+        """写入全部图层记录，图层范围和通道长度先写占位值"""
+        f = self._file
+        self._layer_mask_offset = f.tell()
+        f.write(struct.pack(self._length_format, 0))  # 图层和蒙版信息长度（占位）
+        self._layer_info_offset = f.tell()
+        f.write(struct.pack(self._length_format, 0))  # 图层信息长度（占位）
+        f.write(struct.pack(">h", len(layers)))
+
+        length_placeholder = struct.pack(self._length_format, 0)
+        for layer in layers:
+            self._record_offsets.append(f.tell())
+            f.write(struct.pack(">iiiiH", 0, 0, 0, 0, len(LAYER_CHANNELS)))
+            for channel_id, _ in LAYER_CHANNELS:
+                f.write(struct.pack(">h", channel_id) + length_placeholder)
+
+            name = layer.get("name", "") or ""
+            flags = 0 if layer.get("visible", True) else 0x02
+            blend_key = BLEND_MODE_KEYS.get(layer.get("blend_mode", "normal"), b"norm")
+            extra = struct.pack(">II", 0, 0) + _pascal_name(name) + _unicode_name_block(name)
+            opacity = max(0, min(255, int(layer.get("opacity", 255))))
+            f.write(struct.pack(">4s4sBBBBI", b"8BIM", blend_key, opacity, 0, flags, 0, len(extra)))
+            f.write(extra)
+
+    def write_layer(self, rgba, left, top):
+        """写入下一个图层的通道数据，rgba为 [H, W, 4] 的uint8数组（可以为None表示空图层）
+
+        并行压缩时只提交压缩任务，图层按顺序在压缩完成后写入。
+        """
+        record_offset = self._record_offsets[self._next_layer]
+        self._next_layer += 1
+
+        if rgba is None or rgba.shape[0] == 0 or rgba.shape[1] == 0:
+            height = width = 0
+            channel_data = [b""] * len(LAYER_CHANNELS)
+            code = COMPRESSION_CODES["raw"]
+        else:
+            height, width = rgba.shape[:2]
+            code = COMPRESSION_CODES[self.compression]
+            if self._executor is not None:
+                channel_data = [self._executor.submit(compress_channel, rgba[..., index], self.compression, self.version)
+                                for _, index in LAYER_CHANNELS]
+            else:
+                channel_data = [compress_channel(rgba[..., index], self.compression, self.version)
+                                for _, index in LAYER_CHANNELS]
+
+        self._pending.append((record_offset, (top, left, top + height, left + width), code, channel_data))
+        while len(self._pending) >= self._max_pending or (self._executor is None and self._pending):
+            self._write_pending()
+
+    def _write_pending(self):
+        """写入最早提交的图层，并回填图层范围和通道长度"""
+        f = self._file
+        record_offset, bounds, code, channel_data = self._pending.popleft()
+        lengths = []
+        for data in channel_data:
+            if not isinstance(data, bytes):
+                data = data.result()
+            f.write(struct.pack(">H", code))
+            f.write(data)
+            lengths.append(len(data) + 2)
+        end = f.tell()
+
+        f.seek(record_offset)
+        f.write(struct.pack(">iiii", *bounds))
+        length_size = struct.calcsize(self._length_format)
+        for index, length in enumerate(lengths):
+            f.seek(record_offset + 18 + index * (2 + length_size) + 2)
+            f.write(struct.pack(self._length_format, length))
+        f.seek(end)
+
+    def close(self, merged_rgb=None):
+        """写入合并图像并完成文件
+
+        Args:
+            merged_rgb: [H, W, 3] 的uint8合并图像，None时写入白色
+        """
+        if self._next_layer != len(self._record_offsets):
+            raise RuntimeError(f"图层数据不完整: {self._next_layer}/{len(self._record_offsets)}")
+        while self._pending:
+            self._write_pending()
+        f = self._file
+
+        if self._record_offsets:
+            # 图层信息长度按4字节对齐
+            layer_info_end = f.tell()
+            length_size = struct.calcsize(self._length_format)
+            padding = -(layer_info_end - self._layer_info_offset - length_size) % 4
+            f.write(b"\x00" * padding)
+            layer_info_end += padding
+            f.write(struct.pack(">I", 0))  # 全局图层蒙版信息
+            end = f.tell()
+            f.seek(self._layer_info_offset)
+            f.write(struct.pack(self._length_format, layer_info_end - self._layer_info_offset - length_size))
+            f.seek(self._layer_mask_offset)
+            f.write(struct.pack(self._length_format, end - self._layer_mask_offset - length_size))
+            f.seek(end)
+        else:
+            f.write(struct.pack(self._length_format, 0))
+
+        # 合并图像：所有通道共用一个压缩方式，RLE时先写全部通道的行长度
+        if merged_rgb is None:
+            merged_rgb = np.full((self.height, self.width, 3), 255, dtype=np.uint8)
+        code = COMPRESSION_CODES[self.compression]
+        if self.compression == "zip":
+            # 合并图像不支持ZIP压缩
+            code = COMPRESSION_CODES["rle"]
+        f.write(struct.pack(">H", code))
+        if code == COMPRESSION_CODES["rle"]:
+            # 每个通道的数据由行长度和行数据组成，合并图像要求先写出全部通道的行长度
+            row_bytes = 4 if self.version == 2 else 2
+            if self._executor is not None:
+                channels = list(self._executor.map(
+                    lambda index: compress_channel(merged_rgb[..., index], "rle", self.version), range(3)))
+            else:
+                channels = [compress_channel(merged_rgb[..., index], "rle", self.version) for index in range(3)]
+            for data in channels:
+                f.write(data[:self.height * row_bytes])
+            for data in channels:
+                f.write(data[self.height * row_bytes:])
+        else:
+            for index in range(3):
+                f.write(np.ascontiguousarray(merged_rgb[..., index]).tobytes())
+
+        f.close()
+        self._file = None
+        self._shutdown()
+        os.replace(self._temp_path, self.path)
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self._pending.clear()
+        self._shutdown()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.abort()
@@ -3,6 +3,7 @@ import numpy as np
 from PIL import Image, ImageDraw
 import os
 import sys
+import json
 
 # 添加混合模式模块路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +22,43 @@ except ImportError:
     spec.loader.exec_module(blend_modes_module)
     BlendModes = blend_modes_module.BlendModes
 
+try:
+    from ..LayerEdit.document_model import get_layer
+except ImportError:
+    # 图层ID索引由LayerEdit中的文档模型维护
+    import importlib.util
+    document_model_path = os.path.join(os.path.dirname(current_dir), "LayerEdit", "document_model.py")
+    spec = importlib.util.spec_from_file_location("document_model", document_model_path)
+    document_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(document_model)
+    get_layer = document_model.get_layer
+
+try:
+    from .composite_cache import composite_cache, buffer_nbytes
+except ImportError:
+    import importlib.util
+    composite_cache_path = os.path.join(current_dir, "composite_cache.py")
+    spec = importlib.util.spec_from_file_location("composite_cache", composite_cache_path)
+    composite_cache_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(composite_cache_module)
+    composite_cache = composite_cache_module.composite_cache
+    buffer_nbytes = composite_cache_module.buffer_nbytes
+
+try:
+    from .compositor import LayerCompositor, TiledLayerCompositor, FrameBatchCompositor, get_layer_source, get_layer_placement, get_layer_region
+except ImportError:
+    import importlib.util
+    compositor_path = os.path.join(current_dir, "compositor.py")
+    spec = importlib.util.spec_from_file_location("compositor", compositor_path)
+    compositor_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(compositor_module)
+    LayerCompositor = compositor_module.LayerCompositor
+    TiledLayerCompositor = compositor_module.TiledLayerCompositor
+    FrameBatchCompositor = compositor_module.FrameBatchCompositor
+    get_layer_source = compositor_module.get_layer_source
+    get_layer_placement = compositor_module.get_layer_placement
+    get_layer_region = compositor_module.get_layer_region
+
 
 class PreviewDocumentNode:
     """预览文档节点"""
@@ -34,6 +72,11 @@ class PreviewDocumentNode:
             "optional": {
                 "目标图层ID": ("INT", {"default": 0, "min": -1, "max": 999}),
                 "显示所有图层": ("BOOLEAN", {"default": True}),
+                "合成精度": (["uint8", "float32", "float16"], {"default": "uint8", "tooltip": "uint8为逐层8位合成（原有方式）\nfloat32/float16在浮点缓冲区中合成整个图层栈，消除逐层量化的色带；半透明底层的混合结果与uint8略有不同"}),
+                "混合后端": (["numpy", "torch"], {"default": "numpy"}),
+                "合成缓存(MB)": ("INT", {"default": 0, "min": 0, "max": 65536, "tooltip": "缓存图层栈的中间合成结果，修改某个图层时只重新混合它及上方的图层\n每个快照占 宽×高×16 字节（float32），4K画布约130MB，最多保存约10个快照\n默认0为关闭，设置为0时释放已缓存的结果"}),
+                "线程数": ("INT", {"default": 1, "min": 0, "max": 256, "tooltip": "分块并行合成使用的线程数\n1为逐图层单线程合成，0为自动（CPU核心数）\ntorch后端自身已多线程，始终单线程合成"}),
+                "帧变换": ("STRING", {"default": "", "multiline": True, "tooltip": "批量渲染动画帧，JSON列表，每项为一帧\n例如：[{\"1\": {\"position\": [100, 50], \"opacity\": 0.5}}, {\"1\": {\"position\": [120, 50]}}]\n键为图层ID，未列出的图层使用文档中的值；留空时只渲染一帧"}),
             }
         }
     
@@ -48,31 +91,73 @@ class PreviewDocumentNode:
         document = kwargs.get("文档")
         target_layer_id = kwargs.get("目标图层ID", 0)
         show_all_layers = kwargs.get("显示所有图层", True)
+        precision = kwargs.get("合成精度", "uint8")
+        backend = kwargs.get("混合后端", "numpy")
+        cache_mb = kwargs.get("合成缓存(MB)", 0)
+        workers = kwargs.get("线程数", 1)
+        if backend == "torch":
+            # torch内核自身使用多线程，再分块并行会超额占用CPU
+            workers = 1
+        frame_transforms = self._parse_frame_transforms(kwargs.get("帧变换", ""))
         
         canvas_width, canvas_height = document["canvas_size"]
         layers = document["layers"]
         
-        # 创建画布
-        canvas = Image.new("RGBA", (canvas_width, canvas_height), (255, 255, 255, 0))
-        
-        # 渲染图层
+        # 确定需要渲染的图层
+        render_layers = []
         if show_all_layers:
             # 预览所有可见图层，按图层ID从小到大排序渲染（ID小的在下层，ID大的在上层）
             sorted_layers = sorted(layers, key=lambda x: x.get("layer_id", 0))
-            
-            for layer in sorted_layers:
-                if layer.get("visible", True):
-                    canvas = self._render_layer_with_blend(canvas, layer)
+            render_layers = [layer for layer in sorted_layers if layer.get("visible", True)]
         elif target_layer_id >= 0:
-            # 预览指定图层
-            target_layer = None
-            for layer in layers:
-                if layer.get("layer_id") == target_layer_id:
-                    target_layer = layer
-                    break
+            # 预览指定图层（通过图层ID索引查找）
+            target_layer = get_layer(document, target_layer_id)
             
             if target_layer and target_layer.get("visible", True):
-                canvas = self._render_layer_with_blend(canvas, target_layer)
+                render_layers = [target_layer]
+        
+        if frame_transforms:
+            # 批量渲染多帧：图层像素只解码一次，沿批次维度混合，返回 [N, H, W, 3]
+            dtype = np.float16 if precision == "float16" else np.float32
+            compositor = FrameBatchCompositor(
+                canvas_width, canvas_height, len(frame_transforms), dtype=dtype, backend=backend
+            )
+            # 批量模式下按每帧的visible决定可见性，因此从全部图层中选择
+            if show_all_layers:
+                batch_layers = sorted(layers, key=lambda x: x.get("layer_id", 0))
+            else:
+                target_layer = get_layer(document, target_layer_id)
+                batch_layers = [target_layer] if target_layer is not None else []
+            for layer in batch_layers:
+                layer_key = str(layer.get("layer_id"))
+                compositor.composite_layer(
+                    layer, [frame.get(layer_key) for frame in frame_transforms]
+                )
+            return (compositor.to_image_tensor(),)
+        
+        if precision != "uint8":
+            # 整个图层栈在同一个浮点缓冲区中合成，最后只转换一次
+            if workers == 1:
+                compositor = LayerCompositor(canvas_width, canvas_height, dtype=np.dtype(precision), backend=backend)
+            else:
+                # 画布切块后在线程池中并行合成
+                compositor = TiledLayerCompositor(
+                    canvas_width, canvas_height, dtype=np.dtype(precision), backend=backend, workers=workers
+                )
+            if cache_mb > 0:
+                # 同一文档（ID不随编辑改变）的同一种预览比较上一次的键
+                scope = (document.get("document_id"), show_all_layers, None if show_all_layers else target_layer_id)
+                self._composite_with_cache(compositor, render_layers, cache_mb * 1024 * 1024, scope)
+            else:
+                # 关闭缓存时释放已缓存的快照
+                composite_cache.set_budget(0)
+                compositor.composite_layers(render_layers)
+            return (compositor.to_image_tensor(),)
+        
+        # 8位模式：逐层在PIL画布上合成
+        canvas = Image.new("RGBA", (canvas_width, canvas_height), (255, 255, 255, 0))
+        for layer in render_layers:
+            canvas = self._render_layer_with_blend(canvas, layer)
         
         # 转换为RGB（移除alpha通道）
         if canvas.mode == "RGBA":
@@ -86,6 +171,49 @@ class PreviewDocumentNode:
         
         return (canvas_tensor,)
     
+    def _composite_with_cache(self, compositor, render_layers, cache_bytes, scope=None):
+        """借助合成缓存合成图层栈，只重新混合最长已缓存前缀之上的图层"""
+        composite_cache.set_budget(cache_bytes)
+        context = (compositor.canvas_size, str(compositor.dtype), compositor.backend, compositor.premultiplied)
+        keys = composite_cache.prefix_keys(render_layers, context)
+        
+        start, cached_buffer = composite_cache.lookup(keys)
+        if cached_buffer is not None:
+            compositor.buffer = cached_buffer
+        
+        # 需要保存快照的位置：被修改图层的下方、若干等距检查点、最终结果
+        # 检查点数量受内存预算限制，为最终结果和被修改图层下方的快照预留空间
+        changed = composite_cache.stable_prefix(keys, (scope, context))
+        checkpoints = min(8, cache_bytes // max(1, buffer_nbytes(compositor.buffer)) - 2)
+        stride = -(-len(render_layers) // checkpoints) if checkpoints > 0 else len(render_layers) + 1
+        snapshots = [
+            index for index in range(start + 1, len(render_layers))
+            if index == changed or index % stride == 0
+        ]
+        for begin, end in zip([start] + snapshots, snapshots + [len(render_layers)]):
+            compositor.composite_layers(render_layers[begin:end])
+            composite_cache.store(keys[end], compositor.buffer)
+    
+    def _parse_frame_transforms(self, frame_transforms):
+        """解析帧变换输入，返回每帧一个 {图层ID字符串: 变换字典} 的列表"""
+        if not frame_transforms:
+            return []
+        if isinstance(frame_transforms, str):
+            if not frame_transforms.strip():
+                return []
+            try:
+                frame_transforms = json.loads(frame_transforms)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"帧变换不是有效的JSON: {e}")
+        if not isinstance(frame_transforms, (list, tuple)):
+            raise ValueError("帧变换必须是列表，每项对应一帧")
+        frames = []
+        for frame in frame_transforms:
+            if not isinstance(frame, dict):
+                raise ValueError(f"帧变换的每一帧必须是字典: {frame}")
+            frames.append({str(layer_id): transform for layer_id, transform in frame.items()})
+        return frames
+    
     def _check_document_structure(self, document, diagnostic_report):
         """检查文档结构的完整性"""
         diagnostic_report.append("=== 文档结构检查 ===")
@@ -176,142 +304,59 @@ class PreviewDocumentNode:
             return canvas
     
     def _render_layer_with_blend(self, canvas, layer):
-        """渲染单个图层到画布上，支持混合模式"""
+        """渲染单个图层到画布上，支持混合模式
+
+        只处理图层与画布相交的矩形区域，画布其余部分保持不变，
+        单个图层的开销与图层面积成正比而不是画布面积。
+        """
         # 检查图层可见性
         if not layer.get("visible", True):
             return canvas
-            
-        # 优先使用image_data，如果没有则尝试image_path（向后兼容）
-        image_data = layer.get("image_data")
         
-        if image_data is not None:
-            # 直接使用tensor数据
-            if isinstance(image_data, torch.Tensor):
-                # 移除batch维度（如果存在）
-                if len(image_data.shape) == 4:
-                    image_data = image_data.squeeze(0)
-                
-                # 转换为numpy数组
-                image_array = image_data.cpu().numpy()
-                
-                # 确保值在0-1范围内，然后转换为0-255
-                image_array = np.clip(image_array, 0, 1)
-                image_array = (image_array * 255).astype(np.uint8)
-                
-                # 根据通道数处理
-                if image_array.shape[2] == 4:
-                    # RGBA
-                    layer_image = Image.fromarray(image_array, 'RGBA')
-                elif image_array.shape[2] == 3:
-                    # RGB转换为RGBA
-                    rgba_array = np.zeros((image_array.shape[0], image_array.shape[1], 4), dtype=np.uint8)
-                    rgba_array[:, :, :3] = image_array
-                    rgba_array[:, :, 3] = 255  # 设置alpha为不透明
-                    layer_image = Image.fromarray(rgba_array, 'RGBA')
-                elif image_array.shape[2] == 1:
-                    # 灰度转换为RGBA
-                    rgba_array = np.zeros((image_array.shape[0], image_array.shape[1], 4), dtype=np.uint8)
-                    rgba_array[:, :, :3] = np.repeat(image_array, 3, axis=2)
-                    rgba_array[:, :, 3] = 255  # 设置alpha为不透明
-                    layer_image = Image.fromarray(rgba_array, 'RGBA')
-                else:
-                    raise ValueError(f"不支持的图像通道数: {image_array.shape[2]}")
-            else:
-                layer_image = image_data
-        else:
-            # 向后兼容：尝试从文件路径加载
-            image_path = layer.get("image_path")
-            if not image_path or not os.path.exists(image_path):
-                return canvas
-            try:
-                layer_image = Image.open(image_path).convert("RGBA")
-            except Exception:
-                return canvas
+        source = get_layer_source(layer)
+        if source is None:
+            return canvas
+        layer_source, layer_width, layer_height = source
 
         try:
-            # 获取位置信息（支持多种格式）
-            if "position" in layer:
-                position = layer.get("position", [0, 0])
-                if isinstance(position, dict):
-                    x = position.get("x", 0)
-                    y = position.get("y", 0)
-                elif isinstance(position, (list, tuple)) and len(position) >= 2:
-                    x, y = position[0], position[1]
-                else:
-                    x, y = 0, 0
-            else:
-                # 兼容旧格式
-                x = layer.get("x", 0)
-                y = layer.get("y", 0)
-            
-            # 获取锚点信息并计算实际位置
-            anchor = layer.get("anchor", [0.0, 0.0])
-            anchor_x, anchor_y = anchor[0], anchor[1]
-            
-            # 获取图层尺寸
-            layer_width, layer_height = layer_image.size
-            
-            # 根据锚点计算实际粘贴位置
-            # 锚点 [0,0] 是左上角，[0.5,0.5] 是中心，[1,1] 是右下角
-            actual_x = int(x - layer_width * anchor_x)
-            actual_y = int(y - layer_height * anchor_y)
+            # 计算图层在画布上的相交区域
+            placement = get_layer_placement(layer, layer_width, layer_height, canvas.size)
+            if placement is None:
+                return canvas
+            (dst_left, dst_top, dst_right, dst_bottom), source_box = placement
             
             # 获取混合模式和透明度
-            blend_mode = layer.get("blend_mode", "normal")
+            blend_mode = BlendModes.MODE_MAPPING.get(layer.get("blend_mode", "normal"), "normal")
             opacity = layer.get("opacity", 1.0)
             
-            # 创建一个与画布同样大小的临时图层
-            temp_layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
+            # 只取出相交区域内的图层像素
+            layer_region = get_layer_region(layer_source, source_box)
             
-            # 将图层图像粘贴到临时图层的正确位置
-            if (actual_x < canvas.size[0] and actual_y < canvas.size[1] and 
-                actual_x + layer_width > 0 and actual_y + layer_height > 0):
-                temp_layer.paste(layer_image, (actual_x, actual_y), layer_image)
-            
-            # 应用混合模式
-            if blend_mode != "normal" and blend_mode != "正常":
+            if blend_mode == "normal" and opacity >= 1.0:
+                # 普通混合模式：直接在画布的相交区域上做alpha合成
+                region_image = Image.fromarray((layer_region * 255).astype(np.uint8), "RGBA")
+                canvas.alpha_composite(region_image, dest=(dst_left, dst_top))
+            else:
                 try:
-                    # 转换为numpy数组进行混合
-                    canvas_array = np.array(canvas).astype(np.float32) / 255.0
-                    temp_array = np.array(temp_layer).astype(np.float32) / 255.0
-                    
-                    # 中英文混合模式映射
-                    blend_mode_map = {
-                        "正常": "normal",
-                        "叠加": "overlay", 
-                        "柔光": "soft_light",
-                        "强光": "hard_light",
-                        "颜色减淡": "color_dodge",
-                        "颜色加深": "color_burn",
-                        "变暗": "darken",
-                        "变亮": "lighten",
-                        "差值": "difference",
-                        "排除": "exclusion",
-                        "正片叠底": "multiply",
-                        "滤色": "screen"
-                    }
-                    
-                    # 获取英文混合模式名称
-                    english_blend_mode = blend_mode_map.get(blend_mode, blend_mode)
-                    
-                    # 应用混合模式
-                    blended_array = BlendModes.apply_blend_mode(
-                        canvas_array, temp_array, english_blend_mode, opacity
+                    # 只把画布的相交区域转换为浮点数组进行混合
+                    canvas_region = np.asarray(
+                        canvas.crop((dst_left, dst_top, dst_right, dst_bottom)), dtype=np.float32
+                    ) / 255.0
+                    BlendModes.apply_blend_mode(
+                        canvas_region, layer_region, blend_mode, opacity, out=canvas_region, backend="numpy"
                     )
                     
-                    # 转换回PIL图像
-                    blended_array = np.clip(blended_array * 255, 0, 255).astype(np.uint8)
-                    canvas = Image.fromarray(blended_array, "RGBA")
+                    # 把混合结果写回画布的对应区域
+                    blended_region = np.clip(canvas_region * 255, 0, 255).astype(np.uint8)
+                    canvas.paste(Image.fromarray(blended_region, "RGBA"), (dst_left, dst_top))
                     
                 except Exception:
                     # 回退到普通渲染
-                    canvas = Image.alpha_composite(canvas, temp_layer)
-            else:
-                # 普通混合模式
-                canvas = Image.alpha_composite(canvas, temp_layer)
+                    region_image = Image.fromarray((layer_region * 255).astype(np.uint8), "RGBA")
+                    canvas.alpha_composite(region_image, dest=(dst_left, dst_top))
             
         except Exception:
             # 出错时回退到普通渲染
             pass
         
-        return canvas
\ No newline at end of file
+        return canvas
@@ -22,6 +22,34 @@ except ImportError:
     BlendModes = blend_modes_module.BlendModes
 
 
+try:
+    from ..LayerIO.pixel_source import resolve_layer_pixels
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(os.path.dirname(current_dir), "LayerIO", "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    resolve_layer_pixels = pixel_source_module.resolve_layer_pixels
+
+try:
+    from ...image_convert import tensor_to_pil, layer_value_range
+except ImportError:
+    import importlib.util
+    image_convert_module = sys.modules.get("afa_image_convert")
+    if image_convert_module is None:
+        image_convert_path = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "image_convert.py")
+        spec = importlib.util.spec_from_file_location("afa_image_convert", image_convert_path)
+        image_convert_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(image_convert_module)
+        sys.modules["afa_image_convert"] = image_convert_module
+    tensor_to_pil = image_convert_module.tensor_to_pil
+    layer_value_range = image_convert_module.layer_value_range
+
 class PreviewLayerNode:
     """预览图层节点"""
     
@@ -80,14 +108,13 @@ class PreviewLayerNode:
             image_tensor = torch.from_numpy(image_array)[None,]
             return (image_tensor,)
         
-        # 优先使用image_data，如果没有则尝试image_path（向后兼容）
-        image_data = layer.get("image_data")
+        # 优先使用image_data（延迟加载的图层按pixel_source解码），如果没有则尝试image_path（向后兼容）
+        image_data = resolve_layer_pixels(layer)
         if image_data is not None:
             # 直接使用tensor数据
             if isinstance(image_data, torch.Tensor):
-                # 转换tensor为PIL图像
-                image_array = (image_data.cpu().numpy() * 255).astype(np.uint8)
-                layer_image = Image.fromarray(image_array, "RGBA")
+                # 转换tensor为PIL图像（uint8存储的图层直接使用）
+                layer_image = tensor_to_pil(image_data, "RGBA", layer_value_range(layer))
             else:
                 # 创建空白图像
                 blank_image = Image.new("RGB", (64, 64), (128, 128, 128))
@@ -16,9 +16,53 @@ except ImportError:
 class BlendModes:
     """混合模式实现类"""
     
+    # 中英文混合模式映射
+    MODE_MAPPING = {
+        "正常": "normal",
+        "正片叠底": "multiply", 
+        "滤色": "screen",
+        "叠加": "overlay",
+        "柔光": "soft_light",
+        "强光": "hard_light", 
+        "颜色减淡": "color_dodge",
+        "颜色加深": "color_burn",
+        "变暗": "darken",
+        "变亮": "lighten",
+        "差值": "difference",
+        "排除": "exclusion",
+        # 英文名称
+        "normal": "normal",
+        "multiply": "multiply",
+        "screen": "screen", 
+        "overlay": "overlay",
+        "soft_light": "soft_light",
+        "hard_light": "hard_light",
+        "color_dodge": "color_dodge",
+        "color_burn": "color_burn",
+        "darken": "darken",
+        "lighten": "lighten",
+        "difference": "difference",
+        "exclusion": "exclusion"
+    }
+    
+    # 融合内核按行分块处理，每块的行数决定临时缓冲区的大小
+    TILE_ROWS = 256
+    
+    # 默认混合后端："numpy" 或 "torch"
+    backend = "numpy"
+    
+    @staticmethod
+    def set_backend(backend):
+        """设置默认混合后端"""
+        if backend not in ("numpy", "torch"):
+            raise ValueError(f"不支持的混合后端: {backend}")
+        if backend == "torch" and not HAS_TORCH:
+            raise ValueError("torch混合后端需要安装PyTorch")
+        BlendModes.backend = backend
+    
     @staticmethod
     def _ensure_numpy(image):
-        """确保输入是numpy数组格式"""
+        """确保输入是numpy数组格式（float32输入不复制）"""
         if isinstance(image, Image.Image):
             return np.array(image, dtype=np.float32) / 255.0
         elif HAS_TORCH and hasattr(image, 'dim'):  # torch.Tensor
@@ -26,383 +70,611 @@ class BlendModes:
                 image = image.squeeze(0)
             if image.dim() == 3 and image.shape[0] in [1, 3, 4]:  # CHW
                 image = image.permute(1, 2, 0)
-            return image.cpu().numpy().astype(np.float32)
+            return np.asarray(image.cpu().numpy(), dtype=np.float32)
         elif isinstance(image, np.ndarray):
             if image.dtype == np.uint8:
                 return image.astype(np.float32) / 255.0
-            return image.astype(np.float32)
+            return np.asarray(image, dtype=np.float32)
         else:
             raise ValueError(f"不支持的图像格式: {type(image)}")
     
+    @staticmethod
+    def _ensure_tensor(image, normalize_layout=True):
+        """确保输入是float32的torch张量（已是float32张量时不复制）
+
+        normalize_layout为False时张量按 [..., H, W, C] 原样使用，不做BHWC/CHW推断
+        """
+        if isinstance(image, torch.Tensor):
+            if normalize_layout and image.dim() == 4:  # BHWC
+                image = image.squeeze(0)
+            if normalize_layout and image.dim() == 3 and image.shape[0] in [1, 3, 4]:  # CHW
+                image = image.permute(1, 2, 0)
+            if image.dtype == torch.uint8:
+                return image.to(torch.float32) / 255.0
+            return image.to(torch.float32)
+        return torch.from_numpy(BlendModes._ensure_numpy(image))
+    
     @staticmethod
     def _clamp(array):
         """将数值限制在0-1范围内"""
         return np.clip(array, 0.0, 1.0)
     
     @staticmethod
-    def normal(base, overlay, opacity=1.0):
-        """正常混合模式"""
+    def _blend_rgb(mode, base_rgb, overlay_rgb, result, scratch):
+        """将混合模式函数 B(base, overlay) 的结果直接写入result
+
+        result与scratch是形状相同的预分配缓冲区，所有运算都使用ufunc的out参数完成，
+        不产生整幅画布大小的临时数组。
+        """
+        b, o = base_rgb, overlay_rgb
+        if mode == "multiply":
+            np.multiply(b, o, out=result)
+        elif mode == "screen":
+            # 1 - (1 - b) * (1 - o) = b + o - b * o
+            np.multiply(b, o, out=scratch)
+            np.add(b, o, out=result)
+            result -= scratch
+        elif mode in ("overlay", "hard_light"):
+            # 叠加以base判断、强光以overlay判断：< 0.5 使用 2*b*o，否则使用 1 - 2*(1-b)*(1-o)
+            np.multiply(b, o, out=scratch)
+            np.add(b, o, out=result)
+            result -= scratch
+            result *= 2.0
+            result -= 1.0
+            scratch *= 2.0
+            np.copyto(result, scratch, where=(b if mode == "overlay" else o) < 0.5)
+        elif mode == "soft_light":
+            # o < 0.5: b + (2o-1) * b * (1-b)；否则: b + (2o-1) * (sqrt(b) - b)
+            np.sqrt(b, out=result)
+            result -= b
+            np.subtract(1.0, b, out=scratch)
+            scratch *= b
+            np.copyto(result, scratch, where=o < 0.5)
+            np.multiply(o, 2.0, out=scratch)
+            scratch -= 1.0
+            result *= scratch
+            result += b
+        elif mode == "color_dodge":
+            # base / (1 - overlay)，overlay <= 0 时为0，overlay >= 1 时为1
+            np.subtract(1.0, o, out=scratch)
+            result.fill(1.0)
+            np.divide(b, scratch, out=result, where=scratch > 0.0)
+            np.minimum(result, 1.0, out=result)
+            np.copyto(result, 0.0, where=o <= 0.0)
+        elif mode == "color_burn":
+            # 1 - (1 - base) / overlay，overlay <= 0 时为0，overlay >= 1 时为base
+            np.subtract(1.0, b, out=scratch)
+            result.fill(0.0)
+            np.divide(scratch, o, out=result, where=o > 0.0)
+            np.subtract(1.0, result, out=result)
+            np.maximum(result, 0.0, out=result)
+            np.copyto(result, b, where=o >= 1.0)
+            np.copyto(result, 0.0, where=o <= 0.0)
+        elif mode == "darken":
+            np.minimum(b, o, out=result)
+        elif mode == "lighten":
+            np.maximum(b, o, out=result)
+        elif mode == "difference":
+            np.subtract(b, o, out=result)
+            np.abs(result, out=result)
+        elif mode == "exclusion":
+            # b + o - 2 * b * o
+            np.multiply(b, o, out=scratch)
+            scratch *= 2.0
+            np.add(b, o, out=result)
+            result -= scratch
+        else:
+            np.copyto(result, o)
+
+    @staticmethod
+    def composite_into(base, overlay, mode="normal", opacity=1.0, out=None, tile_rows=None):
+        """融合混合内核：一次遍历完成混合模式计算与alpha合成
+
+        Args:
+            base: 底层图像，形状为 [..., H, W, C]
+            overlay: 上层图像，前导维度需能与base广播
+            mode: 英文混合模式名称
+            opacity: 不透明度，标量或可广播到 [..., 1, 1, 1] 的数组
+            out: 预分配的输出数组，可以就是base本身（原地合成）
+            tile_rows: 每次处理的行数，默认使用 TILE_ROWS
+
+        Returns:
+            合成结果（即out），数值范围0-1
+        """
         base = BlendModes._ensure_numpy(base)
         overlay = BlendModes._ensure_numpy(overlay)
-        
-        # 确保两个图像有相同的通道数
-        if base.shape[-1] == 3 and overlay.shape[-1] == 4:
-            # 如果base是RGB，overlay是RGBA，给base添加alpha通道
-            alpha = np.ones((*base.shape[:2], 1), dtype=np.float32)
-            base = np.concatenate([base, alpha], axis=-1)
-        elif base.shape[-1] == 4 and overlay.shape[-1] == 3:
-            # 如果base是RGBA，overlay是RGB，给overlay添加alpha通道
-            alpha = np.ones((*overlay.shape[:2], 1), dtype=np.float32)
-            overlay = np.concatenate([overlay, alpha], axis=-1)
-        
-        # 应用透明度
-        if overlay.shape[-1] == 4:
-            overlay_alpha = overlay[..., 3:4] * opacity
-            result = base[..., :3] * (1 - overlay_alpha) + overlay[..., :3] * overlay_alpha
-            if base.shape[-1] == 4:
-                result_alpha = base[..., 3:4] + overlay_alpha * (1 - base[..., 3:4])
-                result = np.concatenate([result, result_alpha], axis=-1)
+
+        if base.ndim < 3 or overlay.ndim < 3:
+            raise ValueError(f"图像需要包含通道维度: base {base.shape}, overlay {overlay.shape}")
+        if base.shape[-3:-1] != overlay.shape[-3:-1]:
+            raise ValueError(f"图像尺寸不一致: base {base.shape}, overlay {overlay.shape}")
+
+        base_channels = 3 if base.shape[-1] >= 3 else base.shape[-1]
+        overlay_channels = 3 if overlay.shape[-1] >= 3 else overlay.shape[-1]
+        base_has_alpha = base.shape[-1] == 4
+        overlay_has_alpha = overlay.shape[-1] == 4
+        color_channels = max(base_channels, overlay_channels)
+        out_channels = color_channels + (1 if base_has_alpha or overlay_has_alpha else 0)
+        out_shape = np.broadcast_shapes(base.shape[:-1], overlay.shape[:-1]) + (out_channels,)
+
+        if out is None:
+            out = np.empty(out_shape, dtype=np.float32)
+        elif out.shape != out_shape:
+            raise ValueError(f"输出缓冲区形状不匹配: 期望 {out_shape}, 实际 {out.shape}")
+
+        height, width = out_shape[-3], out_shape[-2]
+        rows = max(1, min(tile_rows or BlendModes.TILE_ROWS, height))
+        lead = out_shape[:-3]
+
+        # 按行分块复用的临时缓冲区，大小与块而非画布成正比
+        result_buf = np.empty(lead + (rows, width, color_channels), dtype=np.float32)
+        scratch_buf = np.empty_like(result_buf)
+        alpha_buf = np.empty(lead + (rows, width, 1), dtype=np.float32)
+        weight_buf = np.empty_like(alpha_buf)
+
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            n = bottom - top
+            b = base[..., top:bottom, :, :]
+            o = overlay[..., top:bottom, :, :]
+            b_rgb = b[..., :base_channels]
+            o_rgb = o[..., :overlay_channels]
+            result = result_buf[..., :n, :, :]
+            scratch = scratch_buf[..., :n, :, :]
+            final_alpha = alpha_buf[..., :n, :, :]
+
+            # 上层有效alpha = 上层alpha * 不透明度
+            if overlay_has_alpha:
+                np.multiply(o[..., 3:4], opacity, out=final_alpha)
+            else:
+                final_alpha[...] = opacity
+
+            BlendModes._blend_rgb(mode, b_rgb, o_rgb, result, scratch)
+
+            out_band = out[..., top:bottom, :, :]
+            if base_has_alpha:
+                base_alpha = b[..., 3:4]
+                weight = weight_buf[..., :n, :, :]
+                # 底层半透明处混合结果向上层颜色回退: cs' = cs + ab * (B - cs)
+                result -= o_rgb
+                result *= base_alpha
+                result += o_rgb
+                # 底层权重 ab * (1 - fa)，输出alpha = fa + ab * (1 - fa)
+                np.subtract(1.0, final_alpha, out=weight)
+                weight *= base_alpha
+                result *= final_alpha
+                np.multiply(b_rgb, weight, out=scratch)
+                result += scratch
+                weight += final_alpha
+                np.divide(result, weight, out=result, where=weight > 0.0)
+                np.copyto(result, b_rgb, where=weight <= 0.0)
+                np.copyto(out_band[..., :color_channels], result)
+                np.copyto(out_band[..., color_channels:], weight)
+            else:
+                # 底层不透明: base * (1 - fa) + B * fa
+                result -= b_rgb
+                result *= final_alpha
+                result += b_rgb
+                np.copyto(out_band[..., :color_channels], result)
+                if out_channels > color_channels:
+                    out_band[..., color_channels:] = 1.0
+
+            np.clip(out_band, 0.0, 1.0, out=out_band)
+
+        return out
+
+    @staticmethod
+    def _blend_rgb_torch(mode, base_rgb, overlay_rgb, result, scratch):
+        """_blend_rgb的torch实现，全部使用原地运算写入result"""
+        b, o = base_rgb, overlay_rgb
+        if mode == "multiply":
+            result.copy_(b).mul_(o)
+        elif mode == "screen":
+            # b + o - b * o
+            scratch.copy_(b).mul_(o)
+            result.copy_(b).add_(o).sub_(scratch)
+        elif mode in ("overlay", "hard_light"):
+            scratch.copy_(b).mul_(o)
+            result.copy_(b).add_(o).sub_(scratch).mul_(2.0).sub_(1.0)
+            scratch.mul_(2.0)
+            # 在mask处用 2*b*o 替换: result += mask * (scratch - result)
+            scratch.sub_(result).mul_((b if mode == "overlay" else o) < 0.5)
+            result.add_(scratch)
+        elif mode == "soft_light":
+            result.copy_(b).sqrt_().sub_(b)
+            scratch.copy_(b).neg_().add_(1.0).mul_(b)
+            scratch.sub_(result).mul_(o < 0.5)
+            result.add_(scratch)
+            scratch.copy_(o).mul_(2.0).sub_(1.0)
+            result.mul_(scratch).add_(b)
+        elif mode == "color_dodge":
+            scratch.copy_(o).neg_().add_(1.0)
+            result.copy_(b).div_(scratch)
+            result.masked_fill_(scratch <= 0.0, 1.0)
+            result.clamp_(max=1.0)
+            result.masked_fill_(o <= 0.0, 0.0)
+        elif mode == "color_burn":
+            scratch.copy_(b).neg_().add_(1.0)
+            result.copy_(scratch).div_(o).neg_().add_(1.0).clamp_(min=0.0)
+            scratch.copy_(b).sub_(result).mul_(o >= 1.0)
+            result.add_(scratch)
+            result.masked_fill_(o <= 0.0, 0.0)
+        elif mode == "darken":
+            result.copy_(b)
+            torch.minimum(result, o, out=result)
+        elif mode == "lighten":
+            result.copy_(b)
+            torch.maximum(result, o, out=result)
+        elif mode == "difference":
+            result.copy_(b).sub_(o).abs_()
+        elif mode == "exclusion":
+            scratch.copy_(b).mul_(o).mul_(2.0)
+            result.copy_(b).add_(o).sub_(scratch)
         else:
-            result = base * (1 - opacity) + overlay * opacity
-        
-        return BlendModes._clamp(result)
+            result.copy_(o)
+
+    @staticmethod
+    def composite_into_torch(base, overlay, mode="normal", opacity=1.0, out=None, tile_rows=None):
+        """composite_into的torch实现，直接在图层张量上计算
+
+        参数和返回值与composite_into相同，out为torch张量；张量所在设备上的多线程内核负责计算，
+        不经过numpy或PIL转换，在仅有CPU的机器上同样可用。
+        """
+        if not HAS_TORCH:
+            raise ValueError("torch混合后端需要安装PyTorch")
+        base = BlendModes._ensure_tensor(base, normalize_layout=False)
+        overlay = BlendModes._ensure_tensor(overlay, normalize_layout=False).to(base.device)
+        if not isinstance(opacity, (int, float)):
+            opacity = torch.as_tensor(opacity, dtype=torch.float32, device=base.device)
+
+        if base.dim() < 3 or overlay.dim() < 3:
+            raise ValueError(f"图像需要包含通道维度: base {tuple(base.shape)}, overlay {tuple(overlay.shape)}")
+        if base.shape[-3:-1] != overlay.shape[-3:-1]:
+            raise ValueError(f"图像尺寸不一致: base {tuple(base.shape)}, overlay {tuple(overlay.shape)}")
+
+        base_channels = 3 if base.shape[-1] >= 3 else base.shape[-1]
+        overlay_channels = 3 if overlay.shape[-1] >= 3 else overlay.shape[-1]
+        base_has_alpha = base.shape[-1] == 4
+        overlay_has_alpha = overlay.shape[-1] == 4
+        color_channels = max(base_channels, overlay_channels)
+        out_channels = color_channels + (1 if base_has_alpha or overlay_has_alpha else 0)
+        out_shape = tuple(torch.broadcast_shapes(base.shape[:-1], overlay.shape[:-1])) + (out_channels,)
+
+        if out is None:
+            out = torch.empty(out_shape, dtype=torch.float32, device=base.device)
+        elif tuple(out.shape) != out_shape:
+            raise ValueError(f"输出缓冲区形状不匹配: 期望 {out_shape}, 实际 {tuple(out.shape)}")
+
+        height, width = out_shape[-3], out_shape[-2]
+        rows = max(1, min(tile_rows or BlendModes.TILE_ROWS, height))
+        lead = out_shape[:-3]
+
+        result_buf = torch.empty(lead + (rows, width, color_channels), dtype=torch.float32, device=base.device)
+        scratch_buf = torch.empty_like(result_buf)
+        alpha_buf = torch.empty(lead + (rows, width, 1), dtype=torch.float32, device=base.device)
+        weight_buf = torch.empty_like(alpha_buf)
+
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            n = bottom - top
+            b = base[..., top:bottom, :, :]
+            o = overlay[..., top:bottom, :, :]
+            b_rgb = b[..., :base_channels]
+            o_rgb = o[..., :overlay_channels]
+            result = result_buf[..., :n, :, :]
+            scratch = scratch_buf[..., :n, :, :]
+            final_alpha = alpha_buf[..., :n, :, :]
+
+            if overlay_has_alpha:
+                final_alpha.copy_(o[..., 3:4]).mul_(opacity)
+            elif isinstance(opacity, torch.Tensor):
+                final_alpha.copy_(opacity)
+            else:
+                final_alpha.fill_(opacity)
+
+            BlendModes._blend_rgb_torch(mode, b_rgb, o_rgb, result, scratch)
+
+            out_band = out[..., top:bottom, :, :]
+            if base_has_alpha:
+                base_alpha = b[..., 3:4]
+                weight = weight_buf[..., :n, :, :]
+                result.sub_(o_rgb).mul_(base_alpha).add_(o_rgb)
+                weight.copy_(final_alpha).neg_().add_(1.0).mul_(base_alpha)
+                result.mul_(final_alpha)
+                scratch.copy_(b_rgb).mul_(weight)
+                result.add_(scratch)
+                weight.add_(final_alpha)
+                visible = weight > 0.0
+                result.div_(torch.where(visible, weight, torch.ones_like(weight)))
+                scratch.copy_(b_rgb).sub_(result).mul_(~visible)
+                result.add_(scratch)
+                out_band[..., :color_channels].copy_(result)
+                out_band[..., color_channels:].copy_(weight)
+            else:
+                result.sub_(b_rgb).mul_(final_alpha).add_(b_rgb)
+                out_band[..., :color_channels].copy_(result)
+                if out_channels > color_channels:
+                    out_band[..., color_channels:].fill_(1.0)
+
+            out_band.clamp_(0.0, 1.0)
+
+        return out
+
+    @staticmethod
+    def composite_premultiplied_into(base, overlay, mode="normal", opacity=1.0, out=None, tile_rows=None):
+        """预乘alpha融合内核
+
+        base、overlay与out都是预乘alpha的RGBA数组 [..., H, W, 4]。不透明度直接缩放上层的四个通道，
+        普通模式只需一次 out = src + base * (1 - src_alpha)；multiply/screen无需反预乘，
+        其余模式只在计算混合函数时临时反预乘。
+
+        Args:
+            base: 底层图像（预乘alpha）
+            overlay: 上层图像（预乘alpha），前导维度需能与base广播
+            mode: 英文混合模式名称
+            opacity: 不透明度，标量或可广播到 [..., 1, 1, 1] 的数组
+            out: 预分配的输出数组，可以就是base本身（原地合成）
+            tile_rows: 每次处理的行数，默认使用 TILE_ROWS
+
+        Returns:
+            合成结果（即out），数值范围0-1
+        """
+        base = np.asarray(base, dtype=np.float32)
+        overlay = np.asarray(overlay, dtype=np.float32)
+
+        if base.shape[-1] != 4 or overlay.shape[-1] != 4:
+            raise ValueError(f"预乘alpha合成需要RGBA图像: base {base.shape}, overlay {overlay.shape}")
+        if base.shape[-3:-1] != overlay.shape[-3:-1]:
+            raise ValueError(f"图像尺寸不一致: base {base.shape}, overlay {overlay.shape}")
+
+        out_shape = np.broadcast_shapes(base.shape, overlay.shape)
+        if out is None:
+            out = np.empty(out_shape, dtype=np.float32)
+        elif out.shape != out_shape:
+            raise ValueError(f"输出缓冲区形状不匹配: 期望 {out_shape}, 实际 {out.shape}")
+
+        height, width = out_shape[-3], out_shape[-2]
+        rows = max(1, min(tile_rows or BlendModes.TILE_ROWS, height))
+        lead = out_shape[:-3]
+        scale_source = not isinstance(opacity, (int, float)) or opacity != 1.0
+
+        source_buf = np.empty(lead + (rows, width, 4), dtype=np.float32) if scale_source else None
+        weight_buf = np.empty(lead + (rows, width, 1), dtype=np.float32)
+        if mode != "normal":
+            result_buf = np.empty(lead + (rows, width, 3), dtype=np.float32)
+            scratch_buf = np.empty_like(result_buf)
+            alpha_buf = np.empty_like(weight_buf)
+            if mode not in ("multiply", "screen"):
+                base_rgb_buf = np.empty_like(result_buf)
+                overlay_rgb_buf = np.empty_like(result_buf)
+
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            n = bottom - top
+            b = base[..., top:bottom, :, :]
+            src = overlay[..., top:bottom, :, :]
+            if scale_source:
+                src = np.multiply(src, opacity, out=source_buf[..., :n, :, :])
+            src_alpha = src[..., 3:4]
+            base_alpha = b[..., 3:4]
+            out_band = out[..., top:bottom, :, :]
+
+            # weight = 1 - src_alpha
+            weight = np.subtract(1.0, src_alpha, out=weight_buf[..., :n, :, :])
+
+            if mode == "normal":
+                # out = src + base * (1 - src_alpha)，四个通道一次完成
+                np.multiply(b, weight, out=out_band)
+                out_band += src
+            else:
+                result = result_buf[..., :n, :, :]
+                scratch = scratch_buf[..., :n, :, :]
+                alpha = alpha_buf[..., :n, :, :]
+                src_rgb = src[..., :3]
+                base_rgb = b[..., :3]
+
+                # result = src_alpha * base_alpha * B(base, overlay)
+                if mode == "multiply":
+                    np.multiply(src_rgb, base_rgb, out=result)
+                elif mode == "screen":
+                    # sa * Cb + ba * Cs - Cs * Cb
+                    np.multiply(base_rgb, src_alpha, out=result)
+                    np.multiply(src_rgb, base_alpha, out=scratch)
+                    result += scratch
+                    np.multiply(src_rgb, base_rgb, out=scratch)
+                    result -= scratch
+                else:
+                    # 反预乘后计算混合函数，alpha为0的像素颜色取0
+                    cb = base_rgb_buf[..., :n, :, :]
+                    cs = overlay_rgb_buf[..., :n, :, :]
+                    cb.fill(0.0)
+                    cs.fill(0.0)
+                    np.divide(base_rgb, base_alpha, out=cb, where=np.broadcast_to(base_alpha > 0.0, cb.shape))
+                    np.divide(src_rgb, src_alpha, out=cs, where=np.broadcast_to(src_alpha > 0.0, cs.shape))
+                    np.clip(cb, 0.0, 1.0, out=cb)
+                    np.clip(cs, 0.0, 1.0, out=cs)
+                    BlendModes._blend_rgb(mode, cb, cs, result, scratch)
+                    result *= src_alpha
+                    result *= base_alpha
+
+                # result += Cb * (1 - sa) + Cs * (1 - ba)
+                np.multiply(base_rgb, weight, out=scratch)
+                result += scratch
+                np.subtract(1.0, base_alpha, out=alpha)
+                np.multiply(src_rgb, alpha, out=scratch)
+                result += scratch
+
+                # alpha = sa + ba * (1 - sa)
+                np.multiply(base_alpha, weight, out=alpha)
+                alpha += src_alpha
+
+                out_band[..., :3] = result
+                out_band[..., 3:4] = alpha
+
+            np.clip(out_band, 0.0, 1.0, out=out_band)
+
+        return out
+
+    @staticmethod
+    def composite_premultiplied_into_torch(base, overlay, mode="normal", opacity=1.0, out=None, tile_rows=None):
+        """composite_premultiplied_into的torch实现"""
+        if not HAS_TORCH:
+            raise ValueError("torch混合后端需要安装PyTorch")
+        base = BlendModes._ensure_tensor(base, normalize_layout=False)
+        overlay = BlendModes._ensure_tensor(overlay, normalize_layout=False).to(base.device)
+        if not isinstance(opacity, (int, float)):
+            opacity = torch.as_tensor(opacity, dtype=torch.float32, device=base.device)
+
+        if base.shape[-1] != 4 or overlay.shape[-1] != 4:
+            raise ValueError(f"预乘alpha合成需要RGBA图像: base {tuple(base.shape)}, overlay {tuple(overlay.shape)}")
+        if base.shape[-3:-1] != overlay.shape[-3:-1]:
+            raise ValueError(f"图像尺寸不一致: base {tuple(base.shape)}, overlay {tuple(overlay.shape)}")
+
+        out_shape = tuple(torch.broadcast_shapes(base.shape, overlay.shape))
+        if out is None:
+            out = torch.empty(out_shape, dtype=torch.float32, device=base.device)
+        elif tuple(out.shape) != out_shape:
+            raise ValueError(f"输出缓冲区形状不匹配: 期望 {out_shape}, 实际 {tuple(out.shape)}")
+
+        height, width = out_shape[-3], out_shape[-2]
+        rows = max(1, min(tile_rows or BlendModes.TILE_ROWS, height))
+        lead = out_shape[:-3]
+        scale_source = not isinstance(opacity, (int, float)) or opacity != 1.0
+
+        source_buf = torch.empty(lead + (rows, width, 4), dtype=torch.float32, device=base.device) if scale_source else None
+        weight_buf = torch.empty(lead + (rows, width, 1), dtype=torch.float32, device=base.device)
+        result_buf = torch.empty(lead + (rows, width, 3), dtype=torch.float32, device=base.device)
+        scratch_buf = torch.empty_like(result_buf)
+        alpha_buf = torch.empty_like(weight_buf)
+
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            n = bottom - top
+            b = base[..., top:bottom, :, :]
+            src = overlay[..., top:bottom, :, :]
+            if scale_source:
+                src = torch.mul(src.expand_as(source_buf[..., :n, :, :]), opacity, out=source_buf[..., :n, :, :])
+            src_alpha = src[..., 3:4]
+            base_alpha = b[..., 3:4]
+            out_band = out[..., top:bottom, :, :]
+
+            weight = weight_buf[..., :n, :, :]
+            weight.copy_(src_alpha).neg_().add_(1.0)
+
+            if mode == "normal":
+                # out = src + base * (1 - src_alpha)，四个通道一次完成
+                torch.mul(b, weight, out=out_band)
+                out_band.add_(src)
+            else:
+                result = result_buf[..., :n, :, :]
+                scratch = scratch_buf[..., :n, :, :]
+                alpha = alpha_buf[..., :n, :, :]
+                src_rgb = src[..., :3]
+                base_rgb = b[..., :3]
+
+                if mode == "multiply":
+                    result.copy_(src_rgb).mul_(base_rgb)
+                elif mode == "screen":
+                    result.copy_(base_rgb).mul_(src_alpha)
+                    scratch.copy_(src_rgb).mul_(base_alpha)
+                    result.add_(scratch)
+                    scratch.copy_(src_rgb).mul_(base_rgb)
+                    result.sub_(scratch)
+                else:
+                    # 反预乘后计算混合函数，alpha为0的像素颜色取0
+                    cb = base_rgb / torch.where(base_alpha > 0.0, base_alpha, torch.ones_like(base_alpha))
+                    cs = src_rgb / torch.where(src_alpha > 0.0, src_alpha, torch.ones_like(src_alpha))
+                    cb = cb.clamp_(0.0, 1.0).expand_as(result)
+                    cs = cs.clamp_(0.0, 1.0).expand_as(result)
+                    BlendModes._blend_rgb_torch(mode, cb, cs, result, scratch)
+                    result.mul_(src_alpha).mul_(base_alpha)
+
+                scratch.copy_(base_rgb).mul_(weight)
+                result.add_(scratch)
+                alpha.copy_(base_alpha).neg_().add_(1.0)
+                scratch.copy_(src_rgb).mul_(alpha)
+                result.add_(scratch)
+
+                alpha.copy_(base_alpha).mul_(weight).add_(src_alpha)
+
+                out_band[..., :3].copy_(result)
+                out_band[..., 3:4].copy_(alpha)
+
+            out_band.clamp_(0.0, 1.0)
+
+        return out
+
+
+    @staticmethod
+    def normal(base, overlay, opacity=1.0):
+        """正常混合模式"""
+        return BlendModes.composite_into(base, overlay, "normal", opacity)
     
     @staticmethod
     def multiply(base, overlay, opacity=1.0):
         """正片叠底混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        # 处理RGB通道
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = base_rgb * overlay_rgb
-        
-        # 处理alpha通道
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            # 应用混合模式和透明度
-            final_alpha = overlay_alpha * opacity
-            # 正确的混合：在有alpha的区域使用混合结果，在没有alpha的区域保持原始
-            blended_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([blended_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "multiply", opacity)
     
     @staticmethod
     def screen(base, overlay, opacity=1.0):
         """滤色混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = 1 - (1 - base_rgb) * (1 - overlay_rgb)
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "screen", opacity)
     
     @staticmethod
     def overlay(base, overlay, opacity=1.0):
         """叠加混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        # 叠加算法：如果base < 0.5，使用multiply*2，否则使用1-2*(1-base)*(1-overlay)
-        mask = base_rgb < 0.5
-        result_rgb = np.where(mask, 
-                             2 * base_rgb * overlay_rgb,
-                             1 - 2 * (1 - base_rgb) * (1 - overlay_rgb))
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "overlay", opacity)
     
     @staticmethod
     def soft_light(base, overlay, opacity=1.0):
         """柔光混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        # 柔光算法
-        mask = overlay_rgb < 0.5
-        result_rgb = np.where(mask,
-                             base_rgb - (1 - 2 * overlay_rgb) * base_rgb * (1 - base_rgb),
-                             base_rgb + (2 * overlay_rgb - 1) * (np.sqrt(base_rgb) - base_rgb))
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "soft_light", opacity)
     
     @staticmethod
     def hard_light(base, overlay, opacity=1.0):
         """强光混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        # 强光算法：如果overlay < 0.5，使用multiply*2，否则使用screen
-        mask = overlay_rgb < 0.5
-        result_rgb = np.where(mask,
-                             2 * base_rgb * overlay_rgb,
-                             1 - 2 * (1 - base_rgb) * (1 - overlay_rgb))
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "hard_light", opacity)
     
     @staticmethod
     def color_dodge(base, overlay, opacity=1.0):
         """颜色减淡混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        # 颜色减淡算法：base / (1 - overlay)，正确处理边界情况
-        result_rgb = np.where(overlay_rgb <= 0.0, 0.0,
-                             np.where(overlay_rgb >= 1.0, 1.0,
-                                     np.minimum(1.0, base_rgb / (1.0 - overlay_rgb))))
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "color_dodge", opacity)
     
     @staticmethod
     def color_burn(base, overlay, opacity=1.0):
         """颜色加深混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        # 颜色加深算法：1 - (1 - base) / overlay，正确处理除零情况
-        result_rgb = np.where(overlay_rgb <= 0.0, 0.0,
-                             np.where(overlay_rgb >= 1.0, base_rgb,
-                                     np.maximum(0.0, 1.0 - (1.0 - base_rgb) / overlay_rgb)))
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "color_burn", opacity)
     
     @staticmethod
     def darken(base, overlay, opacity=1.0):
         """变暗混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = np.minimum(base_rgb, overlay_rgb)
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "darken", opacity)
     
     @staticmethod
     def lighten(base, overlay, opacity=1.0):
         """变亮混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = np.maximum(base_rgb, overlay_rgb)
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "lighten", opacity)
     
     @staticmethod
     def difference(base, overlay, opacity=1.0):
         """差值混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = np.abs(base_rgb - overlay_rgb)
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "difference", opacity)
     
     @staticmethod
     def exclusion(base, overlay, opacity=1.0):
         """排除混合模式"""
-        base = BlendModes._ensure_numpy(base)
-        overlay = BlendModes._ensure_numpy(overlay)
-        
-        base_rgb = base[..., :3] if base.shape[-1] >= 3 else base
-        overlay_rgb = overlay[..., :3] if overlay.shape[-1] >= 3 else overlay
-        
-        result_rgb = base_rgb + overlay_rgb - 2 * base_rgb * overlay_rgb
-        
-        if base.shape[-1] == 4 or overlay.shape[-1] == 4:
-            base_alpha = base[..., 3:4] if base.shape[-1] == 4 else np.ones((*base.shape[:2], 1))
-            overlay_alpha = overlay[..., 3:4] if overlay.shape[-1] == 4 else np.ones((*overlay.shape[:2], 1))
-            
-            final_alpha = overlay_alpha * opacity
-            result_rgb = base_rgb * (1 - final_alpha) + result_rgb * final_alpha
-            result_alpha = base_alpha + final_alpha * (1 - base_alpha)
-            result = np.concatenate([result_rgb, result_alpha], axis=-1)
-        else:
-            result = base_rgb * (1 - opacity) + result_rgb * opacity
-        
-        return BlendModes._clamp(result)
+        return BlendModes.composite_into(base, overlay, "exclusion", opacity)
     
     @staticmethod
-    def apply_blend_mode(base, overlay, mode, opacity=1.0):
-        """应用指定的混合模式"""
-        # 中英文混合模式映射
-        mode_mapping = {
-            "正常": "normal",
-            "正片叠底": "multiply", 
-            "滤色": "screen",
-            "叠加": "overlay",
-            "柔光": "soft_light",
-            "强光": "hard_light", 
-            "颜色减淡": "color_dodge",
-            "颜色加深": "color_burn",
-            "变暗": "darken",
-            "变亮": "lighten",
-            "差值": "difference",
-            "排除": "exclusion",
-            # 英文名称
-            "normal": "normal",
-            "multiply": "multiply",
-            "screen": "screen", 
-            "overlay": "overlay",
-            "soft_light": "soft_light",
-            "hard_light": "hard_light",
-            "color_dodge": "color_dodge",
-            "color_burn": "color_burn",
-            "darken": "darken",
-            "lighten": "lighten",
-            "difference": "difference",
-            "exclusion": "exclusion"
-        }
-        
+    def apply_blend_mode(base, overlay, mode, opacity=1.0, out=None, backend=None):
+        """应用指定的混合模式，传入out时结果直接写入该预分配数组
+
+        backend为 "numpy" 或 "torch"，未指定时使用 BlendModes.backend
+        """
         # 获取英文模式名
-        english_mode = mode_mapping.get(mode, "normal")
-        
-        # 调用对应的混合模式函数
-        blend_functions = {
-            "normal": BlendModes.normal,
-            "multiply": BlendModes.multiply,
-            "screen": BlendModes.screen,
-            "overlay": BlendModes.overlay,
-            "soft_light": BlendModes.soft_light,
-            "hard_light": BlendModes.hard_light,
-            "color_dodge": BlendModes.color_dodge,
-            "color_burn": BlendModes.color_burn,
-            "darken": BlendModes.darken,
-            "lighten": BlendModes.lighten,
-            "difference": BlendModes.difference,
-            "exclusion": BlendModes.exclusion
-        }
-        
-        blend_func = blend_functions.get(english_mode, BlendModes.normal)
-        return blend_func(base, overlay, opacity)
\ No newline at end of file
+        english_mode = BlendModes.MODE_MAPPING.get(mode, "normal")
+        if (backend or BlendModes.backend) == "torch":
+            return BlendModes.composite_into_torch(
+                BlendModes._ensure_tensor(base), BlendModes._ensure_tensor(overlay), english_mode, opacity, out=out
+            )
+        return BlendModes.composite_into(base, overlay, english_mode, opacity, out=out)
\ No newline at end of file
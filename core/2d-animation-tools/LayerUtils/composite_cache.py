@@ -0,0 +1,236 @@
+"""
+合成缓存模块
+按图层栈前缀缓存中间合成结果，修改某个图层时只需重新混合该图层及其上方的图层
+"""
+
+import os
+import hashlib
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# 尝试导入torch，如果失败则使用numpy替代
+try:
+    import torch
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+
+# 像素指纹缓存：张量不能作为字典键（__eq__逐元素比较），因此按id保存，对象释放时通过弱引用回调移除
+_fingerprints = {}
+# 图像对象的序号：id可能在对象释放后被复用，序号在进程内唯一
+_serials = itertools.count(1)
+
+# 为True时按像素内容计算指纹，内容相同的不同张量（例如重新导入的文档）也能命中缓存；
+# 需要对每个新图层的全部像素做一次哈希，4K文档首次预览要读取数百MB，因此默认关闭
+HASH_CONTENTS = False
+
+# 每个文档最多记录多少个渲染上下文的上一次键
+MAX_LAST_KEYS = 64
+
+
+def _get_cached_fingerprint(image, version):
+    cached = _fingerprints.get(id(image))
+    if cached is not None and cached[0]() is image and cached[1] == version:
+        return cached[2]
+    return None
+
+
+def _set_cached_fingerprint(image, version, fingerprint, serial):
+    key = id(image)
+    _fingerprints[key] = (weakref.ref(image, lambda _, key=key: _fingerprints.pop(key, None)),
+                          version, fingerprint, serial)
+
+
+def _tensor_version(image):
+    """张量的版本标识，原地修改后发生变化
+
+    torch.inference_mode() 中创建的张量（ComfyUI执行节点时的默认模式）不记录版本计数，
+    读取 _version 会抛出RuntimeError；这类张量改用存储地址和形状标识，
+    节点按约定不原地修改输入张量，替换像素时会得到新的张量对象
+    """
+    if image.is_inference():
+        return ("inference", image.data_ptr(), tuple(image.shape), image.stride(), image.dtype)
+    return image._version
+
+
+def _content_digest(image):
+    """图像像素内容的哈希"""
+    if HAS_TORCH and isinstance(image, torch.Tensor):
+        data = image.detach().cpu().contiguous()
+        if data.dtype == torch.bfloat16:
+            data = data.float()
+        digest = hashlib.blake2b(data.numpy(), digest_size=16)
+        digest.update(f"{tuple(image.shape)}{image.dtype}".encode())
+        return digest.hexdigest()
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}{image.size}".encode())
+    return digest.hexdigest()
+
+
+def image_fingerprint(image):
+    """图层图像的指纹
+
+    默认按对象标识（进程内唯一的序号）、张量版本和形状生成，不读取像素；
+    ComfyUI缓存的节点输出和写时复制文档共享的图层在多次执行之间是同一个对象，因此可以命中。
+    HASH_CONTENTS为True时改为按像素内容计算。
+    """
+    if HAS_TORCH and isinstance(image, torch.Tensor):
+        version = _tensor_version(image)
+        shape = f"{tuple(image.shape)}{image.dtype}{image.device}"
+    elif hasattr(image, "tobytes") and hasattr(image, "mode"):  # PIL.Image
+        # PIL图像按约定不原地修改
+        version = None
+        shape = f"{image.mode}{image.size}"
+    else:
+        return repr(image)
+
+    cached = _get_cached_fingerprint(image, version)
+    if cached is not None:
+        return cached
+    previous = _fingerprints.get(id(image))
+    # 同一对象原地修改后沿用序号，只更新版本
+    serial = previous[3] if previous is not None and previous[0]() is image else next(_serials)
+    if HASH_CONTENTS:
+        fingerprint = _content_digest(image)
+    else:
+        fingerprint = f"object:{serial}:{version}:{shape}"
+    _set_cached_fingerprint(image, version, fingerprint, serial)
+    return fingerprint
+
+
+def layer_cache_key(layer):
+    """生成单个图层影响合成结果的全部属性的键"""
+    image_data = layer.get("image_data")
+    if image_data is not None:
+        pixels = image_fingerprint(image_data)
+    elif layer.get("pixel_source"):
+        # 延迟加载的图层：像素来源（文件路径、图层序号、修改时间）本身就能标识像素内容
+        pixels = repr(sorted(layer["pixel_source"].items()))
+    else:
+        image_path = layer.get("image_path")
+        try:
+            stat = os.stat(image_path)
+            pixels = (image_path, stat.st_mtime_ns, stat.st_size)
+        except (OSError, TypeError):
+            pixels = None
+    return repr((
+        layer.get("layer_id"),
+        pixels,
+        layer.get("position"),
+        layer.get("x"),
+        layer.get("y"),
+        layer.get("anchor"),
+        layer.get("opacity", 1.0),
+        layer.get("blend_mode", "normal"),
+        layer.get("visible", True),
+    ))
+
+
+def buffer_nbytes(buffer):
+    """numpy数组或torch张量占用的字节数"""
+    if isinstance(buffer, np.ndarray):
+        return buffer.nbytes
+    return buffer.element_size() * buffer.nelement()
+
+
+def _copy(buffer):
+    if isinstance(buffer, np.ndarray):
+        return buffer.copy()
+    return buffer.clone()
+
+
+class CompositeCache:
+    """图层栈前缀合成缓存
+
+    键为图层栈前缀的链式哈希：keys[i] 对应合成完前i个图层之后的缓冲区。
+    按最近最少使用（LRU）淘汰，缓存总大小不超过内存预算（默认为0，即不缓存）。
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        # 渲染范围（文档ID、预览的图层、画布等） -> 上一次渲染的键
+        self._last_keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prefix_keys(layers, context):
+        """计算图层栈每个前缀的键，返回长度为 len(layers) + 1 的列表"""
+        digest = hashlib.blake2b(repr(context).encode(), digest_size=16)
+        keys = [digest.hexdigest()]
+        for layer in layers:
+            digest = digest.copy()
+            digest.update(layer_cache_key(layer).encode())
+            keys.append(digest.hexdigest())
+        return keys
+
+    def set_budget(self, max_bytes):
+        """调整内存预算，超出部分立即淘汰"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def lookup(self, keys):
+        """查找最长的已缓存前缀
+
+        Returns:
+            (前缀长度, 缓冲区副本)；没有命中时返回 (0, None)
+        """
+        with self._lock:
+            for index in range(len(keys) - 1, -1, -1):
+                buffer = self._entries.get(keys[index])
+                if buffer is not None:
+                    self._entries.move_to_end(keys[index])
+                    return index, _copy(buffer)
+        return 0, None
+
+    def stable_prefix(self, keys, scope=None):
+        """与同一渲染范围上一次渲染的键比较，返回第一个被修改的图层的下标，并记录本次的键
+
+        该位置的快照就是被修改图层下方的合成结果，保存后再次修改同一图层时可以直接命中。
+        scope 区分不同的文档和预览节点，交替预览多个文档时互不覆盖。
+        """
+        with self._lock:
+            last_keys = self._last_keys.pop(scope, [])
+            self._last_keys[scope] = list(keys)
+            while len(self._last_keys) > MAX_LAST_KEYS:
+                self._last_keys.popitem(last=False)
+        length = 0
+        for key, last_key in zip(keys, last_keys):
+            if key != last_key:
+                break
+            length += 1
+        return max(0, length - 1)
+
+    def store(self, key, buffer):
+        """保存缓冲区快照"""
+        size = buffer_nbytes(buffer)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = _copy(buffer)
+            self.current_bytes += size
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_keys.clear()
+            self.current_bytes = 0
+
+    def _evict(self):
+        while self._entries and self.current_bytes > self.max_bytes:
+            _, buffer = self._entries.popitem(last=False)
+            self.current_bytes -= buffer_nbytes(buffer)
+
+
+# 进程内共享的合成缓存
+composite_cache = CompositeCache()
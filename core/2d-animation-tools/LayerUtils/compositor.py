@@ -0,0 +1,455 @@
+"""
+图层合成模块
+在单个浮点累加缓冲区上合成整个图层栈
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# 尝试导入torch，如果失败则使用numpy替代
+try:
+    import torch
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+
+# 使用相对导入避免与系统包冲突
+current_dir = os.path.dirname(os.path.abspath(__file__))
+try:
+    from .blend_modes import BlendModes
+except ImportError:
+    # 如果相对导入失败，尝试直接导入本地模块
+    import importlib.util
+    blend_modes_path = os.path.join(current_dir, "blend_modes.py")
+    spec = importlib.util.spec_from_file_location("blend_modes", blend_modes_path)
+    blend_modes_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(blend_modes_module)
+    BlendModes = blend_modes_module.BlendModes
+
+try:
+    from ..LayerIO.pixel_source import resolve_layer_pixels
+except ImportError:
+    # 以固定名称注册到sys.modules，各节点共享同一份已解码像素缓存
+    import importlib.util
+    pixel_source_module = sys.modules.get("afa_pixel_source")
+    if pixel_source_module is None:
+        pixel_source_path = os.path.join(os.path.dirname(current_dir), "LayerIO", "pixel_source.py")
+        spec = importlib.util.spec_from_file_location("afa_pixel_source", pixel_source_path)
+        pixel_source_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(pixel_source_module)
+        sys.modules["afa_pixel_source"] = pixel_source_module
+    resolve_layer_pixels = pixel_source_module.resolve_layer_pixels
+
+
+def get_layer_source(layer):
+    """取出图层的像素来源
+
+    Returns:
+        (像素来源, 宽度, 高度)，像素来源为HWC张量或RGBA的PIL图像；图层没有像素时返回None
+    """
+    # 优先使用image_data（延迟加载的图层按pixel_source解码），如果没有则尝试image_path（向后兼容）
+    image_data = resolve_layer_pixels(layer)
+
+    if image_data is not None:
+        if HAS_TORCH and isinstance(image_data, torch.Tensor):
+            # 移除batch维度（如果存在），像素在裁剪到相交区域后再转换
+            if len(image_data.shape) == 4:
+                image_data = image_data.squeeze(0)
+            if image_data.shape[2] not in (1, 3, 4):
+                raise ValueError(f"不支持的图像通道数: {image_data.shape[2]}")
+            return image_data, image_data.shape[1], image_data.shape[0]
+        layer_image = image_data.convert("RGBA")
+        return layer_image, layer_image.size[0], layer_image.size[1]
+
+    # 向后兼容：尝试从文件路径加载
+    image_path = layer.get("image_path")
+    if not image_path or not os.path.exists(image_path):
+        return None
+    try:
+        layer_image = Image.open(image_path).convert("RGBA")
+    except Exception:
+        return None
+    return layer_image, layer_image.size[0], layer_image.size[1]
+
+
+def get_layer_placement(layer, layer_width, layer_height, canvas_size):
+    """计算图层与画布的相交区域
+
+    Returns:
+        (画布上的区域, 图层内的区域)，两者均为 (left, top, right, bottom)；
+        图层完全在画布外时返回None
+    """
+    # 获取位置信息（支持多种格式）
+    if "position" in layer:
+        position = layer.get("position", [0, 0])
+        if isinstance(position, dict):
+            x = position.get("x", 0)
+            y = position.get("y", 0)
+        elif isinstance(position, (list, tuple)) and len(position) >= 2:
+            x, y = position[0], position[1]
+        else:
+            x, y = 0, 0
+    else:
+        # 兼容旧格式
+        x = layer.get("x", 0)
+        y = layer.get("y", 0)
+
+    # 获取锚点信息并计算实际位置
+    # 锚点 [0,0] 是左上角，[0.5,0.5] 是中心，[1,1] 是右下角
+    anchor = layer.get("anchor", [0.0, 0.0])
+    anchor_x, anchor_y = anchor[0], anchor[1]
+    actual_x = int(x - layer_width * anchor_x)
+    actual_y = int(y - layer_height * anchor_y)
+
+    # 裁剪到画布范围内
+    canvas_width, canvas_height = canvas_size
+    left = max(actual_x, 0)
+    top = max(actual_y, 0)
+    right = min(actual_x + layer_width, canvas_width)
+    bottom = min(actual_y + layer_height, canvas_height)
+    if left >= right or top >= bottom:
+        return None
+
+    source_box = (left - actual_x, top - actual_y, right - actual_x, bottom - actual_y)
+    return (left, top, right, bottom), source_box
+
+
+def get_layer_region(layer_source, source_box, premultiplied=False):
+    """取出图层指定区域的像素，返回0-1范围的float32 RGBA数组
+
+    uint8/float16存储的图层只在裁剪出的区域上转换为float32。
+    premultiplied为True时返回预乘alpha的像素，预乘直接在转换产生的新数组上完成，不增加额外的拷贝。
+    """
+    left, top, right, bottom = source_box
+    if HAS_TORCH and isinstance(layer_source, torch.Tensor):
+        region = layer_source[top:bottom, left:right].cpu().numpy()
+        if region.dtype == np.uint8:
+            region = np.divide(region, np.float32(255.0), dtype=np.float32)
+        else:
+            region = np.clip(region, 0, 1).astype(np.float32, copy=False)
+        if region.shape[2] == 4:
+            if premultiplied:
+                region[..., :3] *= region[..., 3:4]
+            return region
+        # RGB或灰度转换为RGBA，alpha设置为不透明（预乘后颜色不变）
+        rgba = np.ones((region.shape[0], region.shape[1], 4), dtype=np.float32)
+        rgba[..., :3] = region
+        return rgba
+    region = layer_source.crop(source_box)
+    region = np.asarray(region, dtype=np.float32) / 255.0
+    if premultiplied:
+        region[..., :3] *= region[..., 3:4]
+    return region
+
+
+def get_layer_region_tensor(layer_source, source_box, device=None, premultiplied=False):
+    """取出图层指定区域的像素，返回0-1范围的float32 RGBA张量（张量图层不经过numpy转换）"""
+    left, top, right, bottom = source_box
+    if isinstance(layer_source, torch.Tensor):
+        region = layer_source[top:bottom, left:right]
+        if region.dtype == torch.uint8:
+            region = region.to(device=device, dtype=torch.float32).div_(255.0)
+        else:
+            region = region.to(device=device, dtype=torch.float32).clamp(0, 1)
+        if region.shape[2] == 4:
+            if premultiplied:
+                region[..., :3].mul_(region[..., 3:4])
+            return region
+        # RGB或灰度转换为RGBA，alpha设置为不透明（预乘后颜色不变）
+        rgba = torch.ones((region.shape[0], region.shape[1], 4), dtype=torch.float32, device=region.device)
+        rgba[..., :3] = region
+        return rgba
+    return torch.from_numpy(get_layer_region(layer_source, source_box, premultiplied)).to(device)
+
+
+class LayerCompositor:
+    """浮点图层合成器
+
+    整个图层栈共用一个RGBA浮点累加缓冲区，每个图层只在相交区域内原地混合，
+    全部图层合成完成后才转换一次为ComfyUI图像，避免逐层8位量化带来的色带。
+    backend为 "torch" 时缓冲区是torch张量，图层张量直接参与混合，不再转换为numpy数组。
+    premultiplied为True（默认）时缓冲区和图层像素都使用预乘alpha，图层在取出像素时预乘一次，
+    混合走BlendModes的预乘快速路径；为False时使用straight alpha。
+    """
+
+    def __init__(self, canvas_width, canvas_height, dtype=np.float32, backend="numpy", premultiplied=True):
+        self.canvas_size = (canvas_width, canvas_height)
+        self.dtype = np.dtype(dtype)
+        self.backend = backend if backend == "torch" and HAS_TORCH else "numpy"
+        self.premultiplied = premultiplied
+        self.buffer = self._allocate_buffer((canvas_height, canvas_width, 4))
+
+    def _allocate_buffer(self, shape):
+        """按后端和精度分配全零的RGBA累加缓冲区"""
+        if self.backend == "torch":
+            torch_dtype = torch.float16 if self.dtype == np.float16 else torch.float32
+            return torch.zeros(shape, dtype=torch_dtype)
+        return np.zeros(shape, dtype=self.dtype)
+
+    def composite_layer(self, layer):
+        """把单个图层混合到累加缓冲区上"""
+        if not layer.get("visible", True):
+            return
+
+        try:
+            source = get_layer_source(layer)
+            if source is None:
+                return
+            layer_source, layer_width, layer_height = source
+
+            placement = get_layer_placement(layer, layer_width, layer_height, self.canvas_size)
+            if placement is None:
+                return
+            (left, top, right, bottom), source_box = placement
+
+            blend_mode = BlendModes.MODE_MAPPING.get(layer.get("blend_mode", "normal"), "normal")
+            opacity = layer.get("opacity", 1.0)
+
+            layer_region = self._get_region(layer_source, source_box)
+            target = self.buffer[top:bottom, left:right]
+            self._blend_region(target, layer_region, blend_mode, opacity)
+        except Exception as e:
+            print(f"[预览文档] 合成图层 '{layer.get('name', '')}' 时出错: {e}")
+
+    def composite_layers(self, layers):
+        """按顺序把多个图层混合到累加缓冲区上"""
+        for layer in layers:
+            self.composite_layer(layer)
+
+    def _get_region(self, layer_source, source_box):
+        """按后端和alpha格式取出图层区域像素"""
+        if self.backend == "torch":
+            return get_layer_region_tensor(layer_source, source_box, self.buffer.device, self.premultiplied)
+        return get_layer_region(layer_source, source_box, self.premultiplied)
+
+    def _blend_region(self, target, layer_region, blend_mode, opacity):
+        """在缓冲区的视图target上原地混合图层像素"""
+        if self.backend == "torch":
+            kernel = BlendModes.composite_premultiplied_into_torch if self.premultiplied \
+                else BlendModes.composite_into_torch
+            if target.dtype == torch.float32:
+                kernel(target, layer_region, blend_mode, opacity, out=target)
+            else:
+                region = target.float()
+                kernel(region, layer_region, blend_mode, opacity, out=region)
+                target.copy_(region)
+            return
+        kernel = BlendModes.composite_premultiplied_into if self.premultiplied else BlendModes.composite_into
+        if self.dtype == np.float32:
+            kernel(target, layer_region, blend_mode, opacity, out=target)
+        else:
+            # 半精度缓冲区只用于存储，混合计算在float32中进行
+            region = target.astype(np.float32)
+            kernel(region, layer_region, blend_mode, opacity, out=region)
+            target[...] = region
+
+    def to_image_tensor(self):
+        """把累加结果合成到白色背景上，转换为 [B, H, W, 3] 的ComfyUI图像张量"""
+        if self.backend == "torch":
+            buffer = self.buffer.float()
+            alpha = buffer[..., 3:4]
+            image = buffer[..., :3].clone() if self.premultiplied else buffer[..., :3] * alpha
+            image.add_(1.0).sub_(alpha)
+            image = image.cpu()
+        else:
+            alpha = self.buffer[..., 3:4]
+            image = np.empty(self.buffer.shape[:-1] + (3,), dtype=np.float32)
+            # 预乘: rgb + 白色 * (1 - alpha)；straight: rgb * alpha + 白色 * (1 - alpha)
+            if self.premultiplied:
+                image[...] = self.buffer[..., :3]
+            else:
+                np.multiply(self.buffer[..., :3], alpha, out=image)
+            image += 1.0
+            image -= alpha
+            image = torch.from_numpy(image)
+        if image.dim() == 3:
+            image = image[None,]
+        return image
+
+
+class TiledLayerCompositor(LayerCompositor):
+    """分块并行图层合成器
+
+    把画布切成 tile_size x tile_size 的块，每个块在线程池中独立合成整个图层栈。
+    混合计算由numpy/torch内核完成并释放GIL，各块写入缓冲区中互不重叠的区域，因此可以并行；
+    没有任何图层覆盖的块直接跳过。
+    """
+
+    def __init__(self, canvas_width, canvas_height, dtype=np.float32, backend="numpy", premultiplied=True,
+                 tile_size=256, workers=None):
+        super().__init__(canvas_width, canvas_height, dtype=dtype, backend=backend, premultiplied=premultiplied)
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count() or 1
+
+    def composite_layer(self, layer):
+        self.composite_layers([layer])
+
+    def composite_layers(self, layers):
+        """在所有块上并行合成图层栈"""
+        prepared = []
+        for layer in layers:
+            item = self._prepare_layer(layer)
+            if item is not None:
+                prepared.append(item)
+        if not prepared:
+            return
+
+        # 收集每个块需要合成的图层，跳过没有图层覆盖的块
+        canvas_width, canvas_height = self.canvas_size
+        tiles = []
+        for tile_top in range(0, canvas_height, self.tile_size):
+            tile_bottom = min(tile_top + self.tile_size, canvas_height)
+            for tile_left in range(0, canvas_width, self.tile_size):
+                tile_right = min(tile_left + self.tile_size, canvas_width)
+                tile_layers = [
+                    item for item in prepared
+                    if item[1][0] < tile_right and item[1][2] > tile_left
+                    and item[1][1] < tile_bottom and item[1][3] > tile_top
+                ]
+                if tile_layers:
+                    tiles.append(((tile_left, tile_top, tile_right, tile_bottom), tile_layers))
+
+        if self.workers <= 1 or len(tiles) <= 1:
+            for tile_box, tile_layers in tiles:
+                self._composite_tile(tile_box, tile_layers)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(tiles))) as executor:
+            for _ in executor.map(lambda tile: self._composite_tile(*tile), tiles):
+                pass
+
+    def _prepare_layer(self, layer):
+        """取出图层的像素来源和画布区域，返回 (图层, 画布区域, 像素, 混合模式, 不透明度)"""
+        if not layer.get("visible", True):
+            return None
+        try:
+            source = get_layer_source(layer)
+            if source is None:
+                return None
+            layer_source, layer_width, layer_height = source
+            placement = get_layer_placement(layer, layer_width, layer_height, self.canvas_size)
+            if placement is None:
+                return None
+            box, (src_left, src_top, _, _) = placement
+            if not (HAS_TORCH and isinstance(layer_source, torch.Tensor)):
+                # PIL图像先整体解码一次，各块只做切片
+                layer_source = get_layer_region(layer_source, (0, 0, layer_width, layer_height), self.premultiplied)
+            blend_mode = BlendModes.MODE_MAPPING.get(layer.get("blend_mode", "normal"), "normal")
+            opacity = layer.get("opacity", 1.0)
+            # 像素来源在画布坐标系中的原点
+            origin = (box[0] - src_left, box[1] - src_top)
+            return layer, box, (layer_source, origin), blend_mode, opacity
+        except Exception as e:
+            print(f"[预览文档] 合成图层 '{layer.get('name', '')}' 时出错: {e}")
+            return None
+
+    def _composite_tile(self, tile_box, tile_layers):
+        """在单个块内按顺序合成图层"""
+        tile_left, tile_top, tile_right, tile_bottom = tile_box
+        for layer, box, (layer_source, (origin_x, origin_y)), blend_mode, opacity in tile_layers:
+            try:
+                left, top = max(box[0], tile_left), max(box[1], tile_top)
+                right, bottom = min(box[2], tile_right), min(box[3], tile_bottom)
+                source_box = (left - origin_x, top - origin_y, right - origin_x, bottom - origin_y)
+                if isinstance(layer_source, np.ndarray):
+                    # 已解码的像素直接切片
+                    layer_region = layer_source[source_box[1]:source_box[3], source_box[0]:source_box[2]]
+                    if self.backend == "torch":
+                        layer_region = torch.from_numpy(layer_region).to(self.buffer.device)
+                else:
+                    layer_region = self._get_region(layer_source, source_box)
+                target = self.buffer[top:bottom, left:right]
+                self._blend_region(target, layer_region, blend_mode, opacity)
+            except Exception as e:
+                print(f"[预览文档] 合成图层 '{layer.get('name', '')}' 时出错: {e}")
+
+
+def apply_frame_transform(layer, transform):
+    """返回应用了单帧变换（position / opacity / visible / anchor）的图层浅拷贝，预览文档和批量导出PSD共用"""
+    if not transform:
+        return layer
+    frame_layer = dict(layer)
+    for key in ("position", "opacity", "visible", "anchor"):
+        if key in transform:
+            frame_layer[key] = transform[key]
+    return frame_layer
+
+
+class FrameBatchCompositor(LayerCompositor):
+    """多帧批量合成器
+
+    同一文档的N帧共用一个 [N, H, W, 4] 的累加缓冲区，每帧只有图层位置、不透明度等变换不同。
+    每个图层的像素只解码一次，落在相同区域的帧合并为一个批次，
+    不透明度作为 (k, 1, 1, 1) 数组沿批次维度一次完成混合。
+    """
+
+    def __init__(self, canvas_width, canvas_height, frame_count, dtype=np.float32, backend="numpy", premultiplied=True):
+        self.canvas_size = (canvas_width, canvas_height)
+        self.dtype = np.dtype(dtype)
+        self.backend = backend if backend == "torch" and HAS_TORCH else "numpy"
+        self.premultiplied = premultiplied
+        self.frame_count = frame_count
+        self.buffer = self._allocate_buffer((frame_count, canvas_height, canvas_width, 4))
+
+    def composite_layer(self, layer, frame_transforms=None):
+        """把单个图层按每帧的变换混合到所有帧上
+
+        Args:
+            layer: 图层字典
+            frame_transforms: 长度为帧数的列表，每项为该帧对图层的变换字典或None
+        """
+        frame_transforms = frame_transforms or [None] * self.frame_count
+
+        try:
+            source = get_layer_source(layer)
+            if source is None:
+                return
+            layer_source, layer_width, layer_height = source
+
+            # 按相交区域把帧分组，同组的帧一次批量混合
+            groups = {}
+            for frame_index, transform in enumerate(frame_transforms):
+                frame_layer = apply_frame_transform(layer, transform)
+                if not frame_layer.get("visible", True):
+                    continue
+                opacity = float(frame_layer.get("opacity", 1.0))
+                if opacity <= 0.0:
+                    continue
+                placement = get_layer_placement(frame_layer, layer_width, layer_height, self.canvas_size)
+                if placement is None:
+                    continue
+                frames, opacities = groups.setdefault(placement, ([], []))
+                frames.append(frame_index)
+                opacities.append(opacity)
+            if not groups:
+                return
+
+            blend_mode = BlendModes.MODE_MAPPING.get(layer.get("blend_mode", "normal"), "normal")
+
+            # 图层像素只解码一次，各帧共用
+            layer_pixels = self._get_region(layer_source, (0, 0, layer_width, layer_height))
+
+            for ((left, top, right, bottom), source_box), (frames, opacities) in groups.items():
+                src_left, src_top, src_right, src_bottom = source_box
+                layer_region = layer_pixels[src_top:src_bottom, src_left:src_right]
+                if self.backend == "torch":
+                    opacity = torch.tensor(opacities, dtype=torch.float32, device=self.buffer.device)
+                else:
+                    opacity = np.asarray(opacities, dtype=np.float32)
+                opacity = opacity.reshape(-1, 1, 1, 1)
+
+                first, last = frames[0], frames[-1]
+                if last - first + 1 == len(frames):
+                    # 连续的帧直接在缓冲区视图上原地混合
+                    target = self.buffer[first:last + 1, top:bottom, left:right]
+                    self._blend_region(target, layer_region, blend_mode, opacity)
+                else:
+                    index = torch.tensor(frames) if self.backend == "torch" else np.asarray(frames)
+                    target = self.buffer[index, top:bottom, left:right]
+                    self._blend_region(target, layer_region, blend_mode, opacity)
+                    self.buffer[index, top:bottom, left:right] = target
+        except Exception as e:
+            print(f"[预览文档] 批量合成图层 '{layer.get('name', '')}' 时出错: {e}")
@@ -7,6 +7,10 @@
 - 飞书写入数据节点：向表格中写入数据
 - 飞书读取数据差节点：计算表格中两个位置的数据差值
 - 飞书上传图像节点：将图像上传到表格中
+- 飞书读取范围节点：一次请求读取一整块单元格（如 A1:F500）
+- 飞书范围取行节点：从读取范围的结果中按行号取出一行
+- 飞书缓冲写入节点：写入先放入队列，合并相邻单元格后批量提交
+- 飞书提交写入节点：立即提交队列中的全部写入
 
 使用前需要在飞书开放平台创建应用并获取相应的权限。
 """
@@ -16,11 +20,17 @@ from .feishu_read import FeishuReadNode
 from .feishu_write import FeishuWriteNode
 from .feishu_read_diff import FeishuReadDiffNode
 from .feishu_upload_image import FeishuUploadImageNode
+from .feishu_read_range import FeishuReadRangeNode, FeishuRangeRowNode
+from .feishu_batch_write import FeishuBufferedWriteNode, FeishuFlushWritesNode
 
 __all__ = [
     "FeishuConfigNode",
     "FeishuReadNode", 
     "FeishuWriteNode",
     "FeishuReadDiffNode",
-    "FeishuUploadImageNode"
+    "FeishuUploadImageNode",
+    "FeishuReadRangeNode",
+    "FeishuRangeRowNode",
+    "FeishuBufferedWriteNode",
+    "FeishuFlushWritesNode"
 ]
\ No newline at end of file
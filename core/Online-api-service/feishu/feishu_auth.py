@@ -0,0 +1,136 @@
+"""
+飞书访问令牌缓存模块
+所有飞书节点共用的 tenant_access_token 缓存，按 app_id 保存，进程内线程安全。
+
+飞书返回的令牌有效期由 expire 字段给出（通常为7200秒），
+在到期前 TOKEN_REFRESH_MARGIN 秒内主动刷新，其余时间直接使用缓存的令牌，节点执行时不再请求令牌接口。
+令牌在到期前被吊销或应用密钥被重置时，接口会返回令牌无效；feishu_client 收到这样的响应后
+调用本模块的 refresh_stale_token，使该应用缓存的令牌失效并强制刷新，再用新令牌重试一次。
+
+按路径加载本模块时请以 "afa_feishu_auth" 注册到 sys.modules，使各节点共享同一份缓存。
+"""
+
+import os
+import sys
+import time
+import threading
+
+try:
+    from . import feishu_client
+except ImportError:
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+TOKEN_URL = "/auth/v3/tenant_access_token/internal"
+# 到期前多少秒开始刷新令牌
+TOKEN_REFRESH_MARGIN = 300
+
+_lock = threading.Lock()
+# app_id -> {"app_secret", "token", "expires_at", "stale_token"}
+_tokens = {}
+# app_id -> 刷新锁，同一个应用同时只有一个线程请求令牌
+_refresh_locks = {}
+
+
+def _request_token(app_id, app_secret):
+    """请求新的令牌
+
+    Returns:
+        (令牌, 有效秒数) 或 (错误信息, None)
+    """
+    try:
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        data = {"app_id": app_id, "app_secret": app_secret}
+        # 重复请求令牌没有副作用，5xx时也可以重试
+        response = feishu_client.post(TOKEN_URL, headers=headers, json=data, idempotent=True)
+        if response.status_code != 200:
+            return f"Error: 获取访问令牌失败 (状态码: {response.status_code}), 响应: {response.text}", None
+
+        result = response.json()
+        if result.get("code") != 0:
+            return f"Error: 获取访问令牌失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}", None
+        return result.get("tenant_access_token"), int(result.get("expire", 0))
+    except Exception as e:
+        return f"Error: 获取访问令牌异常: {str(e)}", None
+
+
+def get_tenant_access_token(app_id, app_secret, force_refresh=False):
+    """获取 tenant_access_token，有效期内直接返回缓存
+
+    Returns:
+        令牌字符串；失败时返回以 "Error:" 开头的错误信息
+    """
+    now = time.time()
+    with _lock:
+        entry = _tokens.get(app_id)
+        if (not force_refresh and entry is not None and entry["app_secret"] == app_secret
+                and entry["expires_at"] - TOKEN_REFRESH_MARGIN > now):
+            return entry["token"]
+        refresh_lock = _refresh_locks.setdefault(app_id, threading.Lock())
+
+    with refresh_lock:
+        # 等待期间其他线程可能已经刷新
+        with _lock:
+            entry = _tokens.get(app_id)
+            if (not force_refresh and entry is not None and entry["app_secret"] == app_secret
+                    and entry["expires_at"] - TOKEN_REFRESH_MARGIN > time.time()):
+                return entry["token"]
+
+        print(f"[飞书令牌] 正在获取访问令牌，app_id: {app_id[:10]}...")
+        token, expire = _request_token(app_id, app_secret)
+        if expire is None:
+            print(f"[飞书令牌] {token}")
+            return token
+
+        with _lock:
+            _tokens[app_id] = {"app_secret": app_secret, "token": token, "expires_at": time.time() + expire}
+        print(f"[飞书令牌] 访问令牌获取成功，有效期 {expire} 秒")
+        return token
+
+
+def invalidate_token(app_id=None):
+    """使缓存的令牌失效（例如接口返回令牌无效时），app_id为None时清空全部"""
+    with _lock:
+        if app_id is None:
+            _tokens.clear()
+        else:
+            _tokens.pop(app_id, None)
+
+
+def refresh_stale_token(token):
+    """接口返回令牌无效时调用：使该令牌所属应用的缓存失效并强制刷新
+
+    其他线程已经换掉该令牌时直接返回缓存中的新令牌，不重复请求。
+
+    Returns:
+        新令牌；不是本模块发放的令牌或刷新失败时返回None
+    """
+    with _lock:
+        for app_id, entry in _tokens.items():
+            if token in (entry["token"], entry.get("stale_token")):
+                break
+        else:
+            return None
+        if token != entry["token"]:
+            return entry["token"]
+        app_secret = entry["app_secret"]
+
+    print(f"[飞书令牌] 访问令牌无效，重新获取，app_id: {app_id[:10]}...")
+    invalidate_token(app_id)
+    new_token = get_tenant_access_token(app_id, app_secret, force_refresh=True)
+    if new_token.startswith("Error:"):
+        return None
+    with _lock:
+        entry = _tokens.get(app_id)
+        if entry is not None and entry["token"] == new_token:
+            entry["stale_token"] = token
+    return new_token
+
+
+feishu_client.set_token_refresher(refresh_stale_token)
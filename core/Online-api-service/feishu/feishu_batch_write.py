@@ -0,0 +1,165 @@
+import os
+import json
+import time
+
+# 所有飞书节点共用的写入队列
+try:
+    from . import feishu_write_buffer
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_write_buffer = sys.modules.get("afa_feishu_write_buffer")
+    if feishu_write_buffer is None:
+        feishu_write_buffer_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_write_buffer.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_write_buffer", feishu_write_buffer_path)
+        feishu_write_buffer = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_write_buffer)
+        sys.modules["afa_feishu_write_buffer"] = feishu_write_buffer
+
+
+def _parse_config(feishu_config):
+    """解析飞书配置，返回 (配置字典, 错误信息)"""
+    if feishu_config.startswith("Error:"):
+        return None, feishu_config
+    try:
+        config = json.loads(feishu_config)
+    except json.JSONDecodeError:
+        return None, "Error: 飞书配置格式错误"
+    if not all(config.get(key) for key in ("app_id", "app_secret", "sheet_id", "spreadsheet_token")):
+        return None, "Error: 飞书配置信息不完整"
+    return config, None
+
+
+# -------------------------------------------------------------------
+# 飞书缓冲写入节点
+# -------------------------------------------------------------------
+class FeishuBufferedWriteNode:
+    @classmethod
+    def IS_CHANGED(s, **kwargs):
+        return time.time()
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "feishu_config": ("STRING", {"forceInput": True}),
+                "row": ("INT", {"default": 1, "min": 1, "max": 10000}),
+                "column": ("INT", {"default": 1, "min": 1, "max": 1000}),
+                "data": ("STRING", {"default": "", "multiline": True}),
+            },
+            "optional": {
+                "cells": ("STRING", {"default": "", "multiline": True, "tooltip": "JSON列表，每项为 [行号, 列号, 值]；填写后忽略 row / column / data\n例如：[[2, 3, \"完成\"], [3, 3, \"完成\"]]"}),
+                "flush_now": ("BOOLEAN", {"default": False, "tooltip": "放入队列后立即提交该表格的全部写入"}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("write_result",)
+    FUNCTION = "queue_write"
+    CATEGORY = "AFA/飞书表格"
+
+    def queue_write(self, feishu_config, row, column, data, cells="", flush_now=False):
+        """
+        把写入放入表格的队列，由队列合并相邻单元格后批量提交
+
+        Args:
+            feishu_config: 飞书配置字符串（JSON格式）
+            row: 行号（从1开始）
+            column: 列号（从1开始）
+            data: 要写入的数据
+            cells: 多个单元格的写入（JSON列表，每项为 [行号, 列号, 值]）
+            flush_now: 是否立即提交
+
+        Returns:
+            写入操作结果字符串
+        """
+        try:
+            config, error = _parse_config(feishu_config)
+            if error:
+                return (error,)
+            sheet_id = config["sheet_id"]
+
+            if cells and cells.strip():
+                items = json.loads(cells)
+                if not isinstance(items, list):
+                    return ("Error: cells必须是JSON列表，每项为 [行号, 列号, 值]",)
+                writes = []
+                for item in items:
+                    if not isinstance(item, (list, tuple)) or len(item) != 3:
+                        return (f"Error: 无效的单元格写入 {item}，格式应为 [行号, 列号, 值]",)
+                    item_row, item_column, value = int(item[0]), int(item[1]), item[2]
+                    if item_row < 1 or item_column < 1:
+                        return (f"Error: 行号和列号必须从1开始: {item}",)
+                    writes.append((sheet_id, item_row, item_column, value))
+            else:
+                writes = [(sheet_id, row, column, data)]
+
+            pending, flush_result = feishu_write_buffer.add_writes(
+                config["app_id"], config["app_secret"], config["spreadsheet_token"], writes
+            )
+            if flush_now and flush_result is None:
+                flush_result = feishu_write_buffer.flush(config["spreadsheet_token"])
+
+            result = f"已加入写入队列 {len(writes)} 个单元格"
+            if flush_result is None:
+                result += f"，待提交 {pending} 个单元格"
+            elif flush_result.startswith("Error:"):
+                result = flush_result
+            else:
+                result += f"；{flush_result}"
+            print(f"[飞书缓冲写入] {result}")
+            return (result,)
+
+        except json.JSONDecodeError:
+            return ("Error: cells格式错误，应为JSON列表",)
+        except Exception as e:
+            error_msg = f"Error: 缓冲写入飞书数据失败: {str(e)}"
+            print(f"[飞书缓冲写入] {error_msg}")
+            return (error_msg,)
+
+
+# -------------------------------------------------------------------
+# 飞书提交写入节点
+# -------------------------------------------------------------------
+class FeishuFlushWritesNode:
+    @classmethod
+    def IS_CHANGED(s, **kwargs):
+        return time.time()
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "feishu_config": ("STRING", {"forceInput": True}),
+            },
+            "optional": {
+                "write_result": ("STRING", {"forceInput": True, "tooltip": "连接缓冲写入节点的输出，保证在写入之后提交"}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("flush_result",)
+    FUNCTION = "flush_writes"
+    CATEGORY = "AFA/飞书表格"
+    OUTPUT_NODE = True
+
+    def flush_writes(self, feishu_config, write_result=""):
+        """
+        立即提交表格队列中的全部写入
+
+        Args:
+            feishu_config: 飞书配置字符串（JSON格式）
+            write_result: 缓冲写入节点的输出（只用于确定执行顺序）
+
+        Returns:
+            提交结果字符串
+        """
+        try:
+            config, error = _parse_config(feishu_config)
+            if error:
+                return (error,)
+            return (feishu_write_buffer.flush(config["spreadsheet_token"]),)
+        except Exception as e:
+            error_msg = f"Error: 提交飞书写入失败: {str(e)}"
+            print(f"[飞书缓冲写入] {error_msg}")
+            return (error_msg,)
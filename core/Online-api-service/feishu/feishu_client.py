@@ -0,0 +1,168 @@
+"""
+飞书HTTP客户端模块
+所有飞书节点共用一个带连接池的 requests.Session，复用到 open.feishu.cn 的TCP/TLS连接。
+
+请求默认带有连接/读取超时；遇到 429 和 5xx 时按退避时间重试：
+    429 优先使用响应头 Retry-After / x-ogw-ratelimit-reset 给出的等待时间
+    5xx、读取超时和连接建立后被断开（Connection aborted / RemoteDisconnected）时服务端可能已经处理了请求，
+    只对幂等请求（GET / PUT / DELETE，或调用时指定 idempotent=True）重试，避免重复上传图片等资源；
+    连接超时、连接被拒绝、DNS解析失败时请求尚未发出，所有请求都会重试
+
+接口返回访问令牌无效（HTTP 401 或令牌相关的错误码）时，通过 feishu_auth 注册的刷新函数
+使缓存的令牌失效并强制刷新，换用新令牌重新发送一次请求。
+
+按路径加载本模块时请以 "afa_feishu_client" 注册到 sys.modules，使各节点共享同一个连接池。
+"""
+
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+BASE_URL = "https://open.feishu.cn/open-apis"
+# (连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 30)
+# 连接池大小：同时保持的连接数
+POOL_SIZE = 16
+# 最多重试次数（不含第一次请求）
+MAX_RETRIES = 3
+# 指数退避的初始等待时间和最长等待时间（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+# 飞书网关的限流响应头：距离限流窗口重置的秒数
+RATE_LIMIT_RESET_HEADERS = ("Retry-After", "x-ogw-ratelimit-reset")
+# 访问令牌无效或已过期时返回的错误码
+INVALID_TOKEN_CODES = {99991663, 99991668, 99991677}
+
+_lock = threading.Lock()
+_session = None
+# 旧令牌 -> 新令牌（失败时返回None），由 feishu_auth 注册
+_token_refresher = None
+
+
+def set_token_refresher(refresher):
+    """注册令牌无效时使用的刷新函数"""
+    global _token_refresher
+    _token_refresher = refresher
+
+
+def get_session():
+    """返回共享的 requests.Session（第一次调用时创建）"""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_delay(response, attempt):
+    """重试前的等待时间：429时优先使用限流响应头，否则指数退避"""
+    if response is not None and response.status_code == 429:
+        for header in RATE_LIMIT_RESET_HEADERS:
+            value = response.headers.get(header)
+            if value:
+                try:
+                    return min(max(float(value), 0.0), BACKOFF_MAX)
+                except ValueError:
+                    pass
+    return min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+
+
+def _failed_before_sending(error):
+    """请求是否在建立连接时失败（连接超时、连接被拒绝、DNS解析失败），此时请求还没有发出"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests把urllib3的异常包装为 ConnectionError(MaxRetryError(reason=...))
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, NewConnectionError)
+
+
+def is_token_error(response):
+    """响应是否表示访问令牌无效：HTTP 401，或非200响应中令牌相关的错误码"""
+    if response.status_code == 401:
+        return True
+    if response.status_code == 200:
+        return False
+    try:
+        return response.json().get("code") in INVALID_TOKEN_CODES
+    except (ValueError, AttributeError):
+        return False
+
+
+def _bearer_token(headers):
+    authorization = (headers or {}).get("Authorization", "")
+    return authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+
+
+def request(method, url, idempotent=None, max_retries=MAX_RETRIES, **kwargs):
+    """发送请求，429 / 5xx 时退避重试，令牌无效时刷新令牌后重试一次
+
+    Args:
+        url: 完整URL，或以 "/" 开头的相对 BASE_URL 的路径
+        idempotent: 请求是否可以安全重复发送，None时按HTTP方法判断
+
+    Returns:
+        最后一次请求的 requests.Response；重试用尽仍然连接失败时抛出异常
+    """
+    method = method.upper()
+    if url.startswith("/"):
+        url = BASE_URL + url
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    response = _request_with_retries(method, url, idempotent, max_retries, kwargs)
+
+    token = _bearer_token(kwargs.get("headers"))
+    if token and _token_refresher is not None and is_token_error(response):
+        new_token = _token_refresher(token)
+        if new_token and new_token != token:
+            print(f"[飞书客户端] 访问令牌无效，刷新令牌后重试 (状态码: {response.status_code})")
+            kwargs["headers"] = dict(kwargs["headers"], Authorization=f"Bearer {new_token}")
+            response = _request_with_retries(method, url, idempotent, max_retries, kwargs)
+    return response
+
+
+def _request_with_retries(method, url, idempotent, max_retries, kwargs):
+    session = get_session()
+
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # 读取超时或连接中途断开时服务端可能已经处理了请求，非幂等请求只在请求发出之前失败时重试
+            retryable = idempotent or _failed_before_sending(e)
+            if attempt >= max_retries or not retryable:
+                raise
+            delay = _retry_delay(None, attempt)
+            print(f"[飞书客户端] 请求失败，{delay:.1f}秒后重试 ({attempt + 1}/{max_retries}): {e}")
+        else:
+            status = response.status_code
+            retryable = status == 429 or (status >= 500 and idempotent)
+            if attempt >= max_retries or not retryable:
+                return response
+            delay = _retry_delay(response, attempt)
+            print(f"[飞书客户端] 状态码 {status}，{delay:.1f}秒后重试 ({attempt + 1}/{max_retries})")
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
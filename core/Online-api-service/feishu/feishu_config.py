@@ -1,8 +1,36 @@
 import json
 import time
-import requests
 import os
 
+# 所有飞书节点共用的访问令牌缓存
+try:
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        feishu_auth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_auth.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", feishu_auth_path)
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
+
+# 所有飞书节点共用的表格元数据缓存
+try:
+    from . import feishu_sheet_meta
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_sheet_meta = sys.modules.get("afa_feishu_sheet_meta")
+    if feishu_sheet_meta is None:
+        feishu_sheet_meta_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_sheet_meta.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_sheet_meta", feishu_sheet_meta_path)
+        feishu_sheet_meta = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_sheet_meta)
+        sys.modules["afa_feishu_sheet_meta"] = feishu_sheet_meta
+
 # -------------------------------------------------------------------
 # 飞书数据配置节点
 # -------------------------------------------------------------------
@@ -140,24 +168,12 @@ class FeishuConfigNode:
             return None
     
     def _get_access_token(self, app_id, app_secret):
-        """获取飞书访问令牌"""
-        try:
-            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-            headers = {"Content-Type": "application/json; charset=utf-8"}
-            data = {
-                "app_id": app_id,
-                "app_secret": app_secret
-            }
-            
-            response = requests.post(url, headers=headers, json=data)
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("code") == 0:
-                    return result.get("tenant_access_token")
-            return None
-        except Exception as e:
-            print(f"[飞书配置] 获取访问令牌失败: {str(e)}")
+        """获取飞书访问令牌（使用共享缓存）"""
+        access_token = get_tenant_access_token(app_id, app_secret)
+        if access_token.startswith("Error:"):
+            print(f"[飞书配置] {access_token}")
             return None
+        return access_token
     
     def _get_first_sheet_id(self, app_id, app_secret, spreadsheet_token):
         """获取第一个工作表的ID"""
@@ -168,22 +184,11 @@ class FeishuConfigNode:
                 print("[飞书配置] 无法获取访问令牌，使用默认sheet_id")
                 return None
             
-            # 获取表格信息
-            url = f"https://open.feishu.cn/open-apis/sheets/v1/spreadsheets/{spreadsheet_token}/sheets/query"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json; charset=utf-8"
-            }
-            
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("code") == 0:
-                    sheets = result.get("data", {}).get("sheets", [])
-                    if sheets:
-                        first_sheet_id = sheets[0].get("sheet_id")
-                        print(f"[飞书配置] 自动获取的工作表ID: {first_sheet_id}")
-                        return first_sheet_id
+            # 通过共享的表格元数据缓存获取第一个工作表
+            first_sheet_id = feishu_sheet_meta.get_first_sheet_id(access_token, spreadsheet_token)
+            if first_sheet_id:
+                print(f"[飞书配置] 自动获取的工作表ID: {first_sheet_id}")
+                return first_sheet_id
             
             print("[飞书配置] 无法获取工作表信息，使用默认sheet_id")
             return None
@@ -1,6 +1,49 @@
+import os
 import json
 import time
-import requests
+
+# 所有飞书节点共用的HTTP连接池
+try:
+    from . import feishu_client
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+# 所有飞书节点共用的访问令牌缓存
+try:
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        feishu_auth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_auth.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", feishu_auth_path)
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
+
+# 所有飞书节点共用的表格元数据缓存
+try:
+    from . import feishu_sheet_meta
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_sheet_meta = sys.modules.get("afa_feishu_sheet_meta")
+    if feishu_sheet_meta is None:
+        feishu_sheet_meta_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_sheet_meta.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_sheet_meta", feishu_sheet_meta_path)
+        feishu_sheet_meta = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_sheet_meta)
+        sys.modules["afa_feishu_sheet_meta"] = feishu_sheet_meta
 
 # -------------------------------------------------------------------
 # 飞书读取表格数据差节点
@@ -130,7 +173,7 @@ class FeishuReadDiffNode:
             api_url = f"https://open.feishu.cn/open-apis/sheets/v2/spreadsheets/{spreadsheet_token}/values/{range_param}"
             print(f"[飞书数据差] API URL: {api_url}")
             
-            response = requests.get(api_url, headers=headers, timeout=30)
+            response = feishu_client.get(api_url, headers=headers)
             
             if response.status_code != 200:
                 print(f"[飞书数据差] 读取范围 {range_param} 失败 (状态码: {response.status_code})")
@@ -206,7 +249,7 @@ class FeishuReadDiffNode:
             print(f"[飞书数据差] 读取单元格 {cell_range} (行{row}, 列{column})")
             print(f"[飞书数据差] API URL: {api_url}")
             
-            response = requests.get(api_url, headers=headers, timeout=30)
+            response = feishu_client.get(api_url, headers=headers)
             
             if response.status_code != 200:
                 print(f"[飞书数据差] 读取单元格 {cell_range} 失败 (状态码: {response.status_code})")
@@ -247,29 +290,8 @@ class FeishuReadDiffNode:
             return ""
     
     def _get_access_token(self, app_id, app_secret):
-        """获取飞书访问令牌"""
-        try:
-            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "app_id": app_id,
-                "app_secret": app_secret
-            }
-            
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                return f"Error: 获取访问令牌失败 (状态码: {response.status_code})"
-            
-            result = response.json()
-            
-            if result.get("code") == 0:
-                return result.get("tenant_access_token")
-            else:
-                return f"Error: 获取访问令牌失败: {result.get('msg', '未知错误')}"
-                
-        except Exception as e:
-            return f"Error: 获取访问令牌异常: {str(e)}"
+        """获取飞书访问令牌（使用共享缓存，到期前才重新请求）"""
+        return get_tenant_access_token(app_id, app_secret)
     
     def _extract_spreadsheet_token(self, sheet_url, sheet_id):
         """从飞书表格URL或ID中提取spreadsheet_token"""
@@ -293,43 +315,14 @@ class FeishuReadDiffNode:
             return None
     
     def _get_sheet_list(self, access_token, spreadsheet_token):
-        """获取工作表列表 - 使用metainfo端点"""
-        try:
-            # 使用正确的metainfo端点
-            url = f"https://open.feishu.cn/open-apis/sheets/v2/spreadsheets/{spreadsheet_token}/metainfo"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            print(f"[飞书数据差] 正在获取工作表列表...")
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code != 200:
-                print(f"[飞书数据差] 获取工作表列表失败 (状态码: {response.status_code})")
-                return None
-            
-            result = response.json()
-            
-            if result.get("code") == 0 and "data" in result:
-                sheets = result["data"].get("sheets", [])
-                if sheets:
-                    # 使用第一个工作表的sheetId作为sheet名称（符合飞书API要求）
-                    first_sheet = sheets[0]
-                    sheet_id = first_sheet.get("sheetId", "")
-                    print(f"[飞书数据差] 使用第一个工作表的sheetId: {sheet_id}")
-                    return sheet_id
-                else:
-                    print(f"[飞书数据差] 未找到任何工作表")
-                    return None
-            else:
-                print(f"[飞书数据差] 获取工作表列表失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}")
-                return None
-                
-        except Exception as e:
-            print(f"[飞书数据差] 获取工作表列表异常: {str(e)}")
+        """获取第一个工作表的sheetId（使用共享的表格元数据缓存，有效期内不再请求metainfo端点）"""
+        sheet_id = feishu_sheet_meta.get_first_sheet_id(access_token, spreadsheet_token)
+        if sheet_id is None:
+            print(f"[飞书数据差] 未找到任何工作表")
             return None
+        # 使用第一个工作表的sheetId作为sheet名称（符合飞书API要求）
+        print(f"[飞书数据差] 使用第一个工作表的sheetId: {sheet_id}")
+        return sheet_id
     
     def _convert_to_a1_notation(self, row, column):
         """将行列号转换为A1:A1格式（飞书API要求的范围格式）"""
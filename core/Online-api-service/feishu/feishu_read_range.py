@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import time
+
+# 所有飞书节点共用的HTTP连接池
+try:
+    from . import feishu_client
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+# 所有飞书节点共用的访问令牌缓存
+try:
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        feishu_auth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_auth.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", feishu_auth_path)
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
+
+# 不强制刷新时读取结果的复用时间（秒）
+RANGE_CACHE_TTL = 60
+
+# 范围左上角的单元格，例如 "B3:F500" 中的 B3；整列范围（"A:C"）从第1行开始
+RANGE_START_PATTERN = re.compile(r"^([A-Za-z]*)(\d*)")
+
+
+def _column_letter_to_number(letters):
+    """列字母转换为列号（A -> 1）"""
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def cell_to_text(cell):
+    """把单元格的值转换为字符串：富文本/链接等分段的值拼接各段的text"""
+    if cell is None:
+        return ""
+    if isinstance(cell, list):
+        return "".join(cell_to_text(segment) for segment in cell)
+    if isinstance(cell, dict):
+        return str(cell.get("text", cell.get("link", "")))
+    return str(cell)
+
+
+# -------------------------------------------------------------------
+# 飞书读取范围节点
+# -------------------------------------------------------------------
+class FeishuReadRangeNode:
+    @classmethod
+    def IS_CHANGED(s, **kwargs):
+        # 不强制刷新时同一时间段内复用上次的结果，逐行处理的工作流只请求一次；
+        # 每隔 RANGE_CACHE_TTL 秒重新读取，表格被修改后不会一直返回旧数据
+        if kwargs.get("force_refresh", False):
+            return time.time()
+        return int(time.time() // RANGE_CACHE_TTL)
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "feishu_config": ("STRING", {"forceInput": True}),
+                "cell_range": ("STRING", {"default": "A1:F500", "multiline": False}),
+                "force_refresh": ("BOOLEAN", {"default": False, "tooltip": "每次执行都重新读取；关闭时同一分钟内复用上次的读取结果"}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "INT")
+    RETURN_NAMES = ("range_data", "row_count")
+    FUNCTION = "read_range"
+    CATEGORY = "AFA/飞书表格"
+
+    def read_range(self, feishu_config, cell_range, force_refresh):
+        """
+        一次请求读取飞书表格中的一整块单元格
+
+        Args:
+            feishu_config: 飞书配置字符串（JSON格式）
+            cell_range: 单元格范围（如 "A1:F500"，也可以带工作表ID："sheetId!A1:F500"）
+            force_refresh: 是否强制刷新
+
+        Returns:
+            (范围数据JSON字符串, 行数)；范围数据格式：
+            {"range": 实际范围, "start_row": 起始行号, "start_column": 起始列号, "values": [[...], ...]}
+        """
+        try:
+            # 解析配置
+            if feishu_config.startswith("Error:"):
+                return (feishu_config, 0)
+
+            config = json.loads(feishu_config)
+            app_id = config.get("app_id")
+            app_secret = config.get("app_secret")
+            sheet_id = config.get("sheet_id")
+            spreadsheet_token = config.get("spreadsheet_token")
+
+            if not all([app_id, app_secret, sheet_id, spreadsheet_token]):
+                return ("Error: 飞书配置信息不完整", 0)
+
+            cell_range = cell_range.strip()
+            if not cell_range:
+                return ("Error: 单元格范围不能为空", 0)
+
+            # 获取访问令牌
+            access_token = get_tenant_access_token(app_id, app_secret)
+            if access_token.startswith("Error:"):
+                return (access_token, 0)
+
+            range_param = cell_range if "!" in cell_range else f"{sheet_id}!{cell_range}"
+            api_url = f"/sheets/v2/spreadsheets/{spreadsheet_token}/values/{range_param}"
+            headers = {
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            }
+            params = {
+                "valueRenderOption": "ToString",
+                "dateTimeRenderOption": "FormattedString"
+            }
+
+            print(f"[飞书读取范围] 读取范围 {range_param}")
+            response = feishu_client.get(api_url, headers=headers, params=params)
+
+            if response.status_code != 200:
+                error_msg = f"Error: 飞书API请求失败 (状态码: {response.status_code})"
+                print(f"[飞书读取范围] {error_msg}")
+                return (error_msg, 0)
+
+            result = response.json()
+            if result.get("code") != 0:
+                error_msg = f"Error: 读取范围失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}"
+                print(f"[飞书读取范围] {error_msg}")
+                return (error_msg, 0)
+
+            value_range = result.get("data", {}).get("valueRange", {})
+            values = value_range.get("values") or []
+            actual_range = value_range.get("range", range_param)
+
+            # 记录范围左上角的行列号，按表格行号取行时使用
+            start = RANGE_START_PATTERN.match(actual_range.split("!")[-1])
+            start_column = _column_letter_to_number(start.group(1)) if start.group(1) else 1
+            start_row = int(start.group(2)) if start.group(2) else 1
+
+            range_data = {
+                "range": actual_range,
+                "start_row": start_row,
+                "start_column": start_column,
+                "values": values
+            }
+            print(f"[飞书读取范围] 成功读取 {len(values)} 行")
+            return (json.dumps(range_data, ensure_ascii=False), len(values))
+
+        except json.JSONDecodeError:
+            return ("Error: 飞书配置格式错误", 0)
+        except Exception as e:
+            error_msg = f"Error: 读取飞书范围失败: {str(e)}"
+            print(f"[飞书读取范围] {error_msg}")
+            return (error_msg, 0)
+
+
+# -------------------------------------------------------------------
+# 飞书范围取行节点
+# -------------------------------------------------------------------
+class FeishuRangeRowNode:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "range_data": ("STRING", {"forceInput": True}),
+                "row": ("INT", {"default": 1, "min": 1, "max": 100000}),
+                "column": ("INT", {"default": 0, "min": 0, "max": 1000}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("row_data", "cell_data")
+    FUNCTION = "get_row"
+    CATEGORY = "AFA/飞书表格"
+
+    def get_row(self, range_data, row, column):
+        """
+        从读取范围的结果中取出一行，不再请求飞书接口
+
+        Args:
+            range_data: 飞书读取范围节点输出的JSON字符串
+            row: 表格中的行号（从1开始，与飞书读取数据节点相同）
+            column: 表格中的列号（从1开始），0表示不取单元格
+
+        Returns:
+            (该行各单元格文本的JSON列表, 指定单元格的文本)
+        """
+        try:
+            if range_data.startswith("Error:"):
+                return (range_data, "")
+
+            data = json.loads(range_data)
+            values = data.get("values", [])
+            row_index = row - data.get("start_row", 1)
+            if row_index < 0 or row_index >= len(values):
+                print(f"[飞书范围取行] 第{row}行不在读取的范围内")
+                return ("[]", "")
+
+            row_values = [cell_to_text(cell) for cell in values[row_index] or []]
+            cell_value = ""
+            if column > 0:
+                column_index = column - data.get("start_column", 1)
+                if 0 <= column_index < len(row_values):
+                    cell_value = row_values[column_index]
+
+            return (json.dumps(row_values, ensure_ascii=False), cell_value)
+
+        except json.JSONDecodeError:
+            return ("Error: 范围数据格式错误", "")
+        except Exception as e:
+            error_msg = f"Error: 读取行数据失败: {str(e)}"
+            print(f"[飞书范围取行] {error_msg}")
+            return (error_msg, "")
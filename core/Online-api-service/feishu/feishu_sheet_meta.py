@@ -0,0 +1,133 @@
+"""
+飞书表格元数据缓存模块
+所有飞书节点共用的工作表信息缓存，按 spreadsheet_token 保存工作表ID、标题和行列数，进程内线程安全。
+
+URL中没有 sheet 参数时，节点通过本模块解析工作表，缓存有效期内不再请求 metainfo 接口；
+工作表被增删或改名后可以调用 invalidate_sheet_metadata 使缓存失效，读写失败时节点也会主动使其失效。
+
+按路径加载本模块时请以 "afa_feishu_sheet_meta" 注册到 sys.modules，使各节点共享同一份缓存。
+"""
+
+import os
+import sys
+import time
+import threading
+
+try:
+    from . import feishu_client
+except ImportError:
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+# 缓存有效期（秒）
+SHEET_META_TTL = 600
+
+_lock = threading.Lock()
+# spreadsheet_token -> {"title", "sheets": [{"sheet_id", "title", "index", "row_count", "column_count"}], "expires_at"}
+_metadata = {}
+# spreadsheet_token -> 刷新锁，同一个表格同时只有一个线程请求元数据
+_refresh_locks = {}
+
+
+def _request_metadata(access_token, spreadsheet_token):
+    """请求表格元数据（metainfo端点）
+
+    Returns:
+        (元数据, None) 或 (None, 错误信息)
+    """
+    try:
+        url = f"/sheets/v2/spreadsheets/{spreadsheet_token}/metainfo"
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        response = feishu_client.get(url, headers=headers)
+        if response.status_code != 200:
+            return None, f"Error: 获取工作表列表失败 (状态码: {response.status_code})"
+
+        result = response.json()
+        if result.get("code") != 0 or "data" not in result:
+            return None, f"Error: 获取工作表列表失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}"
+
+        data = result["data"]
+        sheets = [{
+            "sheet_id": sheet.get("sheetId", ""),
+            "title": sheet.get("title", ""),
+            "index": sheet.get("index", index),
+            "row_count": sheet.get("rowCount", 0),
+            "column_count": sheet.get("columnCount", 0)
+        } for index, sheet in enumerate(data.get("sheets", []))]
+        return {"title": (data.get("properties") or {}).get("title", ""), "sheets": sheets}, None
+    except Exception as e:
+        return None, f"Error: 获取工作表列表异常: {str(e)}"
+
+
+def get_sheet_metadata(access_token, spreadsheet_token, force_refresh=False):
+    """获取表格元数据，有效期内直接返回缓存
+
+    Returns:
+        {"title": 表格标题, "sheets": [{"sheet_id", "title", "index", "row_count", "column_count"}, ...]}；
+        失败时返回None（失败结果不缓存）
+    """
+    with _lock:
+        entry = _metadata.get(spreadsheet_token)
+        if not force_refresh and entry is not None and entry["expires_at"] > time.time():
+            return entry
+        refresh_lock = _refresh_locks.setdefault(spreadsheet_token, threading.Lock())
+
+    with refresh_lock:
+        # 等待期间其他线程可能已经刷新
+        with _lock:
+            entry = _metadata.get(spreadsheet_token)
+            if not force_refresh and entry is not None and entry["expires_at"] > time.time():
+                return entry
+
+        print(f"[飞书表格信息] 正在获取工作表列表，spreadsheet_token: {spreadsheet_token}")
+        metadata, error = _request_metadata(access_token, spreadsheet_token)
+        if metadata is None:
+            print(f"[飞书表格信息] {error}")
+            return None
+
+        metadata["expires_at"] = time.time() + SHEET_META_TTL
+        with _lock:
+            _metadata[spreadsheet_token] = metadata
+        print(f"[飞书表格信息] 获取到 {len(metadata['sheets'])} 个工作表")
+        return metadata
+
+
+def find_sheet(access_token, spreadsheet_token, sheet=None):
+    """按工作表ID或标题查找工作表，sheet为None时返回第一个工作表
+
+    Returns:
+        {"sheet_id", "title", "index", "row_count", "column_count"}，找不到时返回None
+    """
+    metadata = get_sheet_metadata(access_token, spreadsheet_token)
+    if metadata is None or not metadata["sheets"]:
+        return None
+    if sheet is None:
+        return metadata["sheets"][0]
+    for info in metadata["sheets"]:
+        if sheet in (info["sheet_id"], info["title"]):
+            return info
+    return None
+
+
+def get_first_sheet_id(access_token, spreadsheet_token):
+    """第一个工作表的ID，获取失败时返回None"""
+    info = find_sheet(access_token, spreadsheet_token)
+    return info["sheet_id"] if info else None
+
+
+def invalidate_sheet_metadata(spreadsheet_token=None):
+    """使缓存的表格元数据失效，spreadsheet_token为None时清空全部"""
+    with _lock:
+        if spreadsheet_token is None:
+            _metadata.clear()
+        else:
+            _metadata.pop(spreadsheet_token, None)
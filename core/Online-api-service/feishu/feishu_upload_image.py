@@ -1,10 +1,49 @@
+import os
+import sys
 import json
 import time
-import requests
 import base64
 import io
-from PIL import Image
-import numpy as np
+
+# 导出、预览和飞书上传共用的图像转换模块
+image_convert = sys.modules.get("afa_image_convert")
+if image_convert is None:
+    import importlib.util
+    image_convert_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "image_convert.py")
+    spec = importlib.util.spec_from_file_location("afa_image_convert", image_convert_path)
+    image_convert = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(image_convert)
+    sys.modules["afa_image_convert"] = image_convert
+tensor_to_pil = image_convert.tensor_to_pil
+
+# 所有飞书节点共用的HTTP连接池
+try:
+    from . import feishu_client
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+# 所有飞书节点共用的访问令牌缓存
+try:
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        feishu_auth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_auth.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", feishu_auth_path)
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
 
 # -------------------------------------------------------------------
 # 飞书上传图像节点
@@ -96,22 +135,8 @@ class FeishuUploadImageNode:
     def _convert_image_to_bytes(self, image):
         """将ComfyUI图像转换为字节数据"""
         try:
-            # 将tensor转换为PIL图像
-            if isinstance(image, np.ndarray):
-                # 如果是numpy数组
-                if image.ndim == 4:
-                    image = image[0]  # 取第一张图像
-                if image.dtype != np.uint8:
-                    image = (image * 255).astype(np.uint8)
-                pil_image = Image.fromarray(image)
-            else:
-                # 如果是tensor
-                image_np = image.cpu().numpy()
-                if image_np.ndim == 4:
-                    image_np = image_np[0]  # 取第一张图像
-                if image_np.dtype != np.uint8:
-                    image_np = (image_np * 255).astype(np.uint8)
-                pil_image = Image.fromarray(image_np)
+            # 将tensor或numpy数组转换为PIL图像（批次取第一张）
+            pil_image = tensor_to_pil(image)
             
             # 转换为字节数据
             img_buffer = io.BytesIO()
@@ -147,7 +172,7 @@ class FeishuUploadImageNode:
             
             print(f"[飞书上传图像] 正在上传图像到飞书...")
             
-            response = requests.post(url, headers=headers, files=files, data=data, timeout=60)
+            response = feishu_client.post(url, headers=headers, files=files, data=data, timeout=60)
             
             if response.status_code != 200:
                 error_msg = f"Error: 上传图像到飞书失败 (状态码: {response.status_code})"
@@ -196,7 +221,8 @@ class FeishuUploadImageNode:
             
             print(f"[飞书上传图像] 使用values_image API插入图像到单元格 {sheet_id}!{cell_range} (行{row}, 列{column})")
             
-            response = requests.post(api_url, headers=headers, json=write_data, timeout=30)
+            # 写入同一单元格，重复请求结果相同
+            response = feishu_client.post(api_url, headers=headers, json=write_data, idempotent=True)
             
             if response.status_code != 200:
                 error_msg = f"Error: 插入单元格内图像失败 (状态码: {response.status_code})"
@@ -249,7 +275,7 @@ class FeishuUploadImageNode:
             
             print(f"[飞书上传图像] 插入浮动图像到单元格 {sheet_id}!{cell_range} (行{row}, 列{column})")
             
-            response = requests.post(api_url, headers=headers, json=write_data, timeout=30)
+            response = feishu_client.post(api_url, headers=headers, json=write_data)
             
             if response.status_code != 200:
                 error_msg = f"Error: 插入浮动图像到表格失败 (状态码: {response.status_code})"
@@ -277,29 +303,8 @@ class FeishuUploadImageNode:
             return f"Error: 插入浮动图像异常: {str(e)}"
     
     def _get_access_token(self, app_id, app_secret):
-        """获取飞书访问令牌"""
-        try:
-            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "app_id": app_id,
-                "app_secret": app_secret
-            }
-            
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                return f"Error: 获取访问令牌失败 (状态码: {response.status_code})"
-            
-            result = response.json()
-            
-            if result.get("code") == 0:
-                return result.get("tenant_access_token")
-            else:
-                return f"Error: 获取访问令牌失败: {result.get('msg', '未知错误')}"
-                
-        except Exception as e:
-            return f"Error: 获取访问令牌异常: {str(e)}"
+        """获取飞书访问令牌（使用共享缓存，到期前才重新请求）"""
+        return get_tenant_access_token(app_id, app_secret)
     
     def _convert_to_a1_notation(self, row, column):
         """将行列号转换为A1格式"""
@@ -1,6 +1,49 @@
+import os
 import json
 import time
-import requests
+
+# 所有飞书节点共用的HTTP连接池
+try:
+    from . import feishu_client
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        feishu_client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_client.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", feishu_client_path)
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+
+# 所有飞书节点共用的访问令牌缓存
+try:
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        feishu_auth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_auth.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", feishu_auth_path)
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
+
+# 所有飞书节点共用的表格元数据缓存
+try:
+    from . import feishu_sheet_meta
+except ImportError:
+    import sys
+    import importlib.util
+    feishu_sheet_meta = sys.modules.get("afa_feishu_sheet_meta")
+    if feishu_sheet_meta is None:
+        feishu_sheet_meta_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feishu_sheet_meta.py")
+        spec = importlib.util.spec_from_file_location("afa_feishu_sheet_meta", feishu_sheet_meta_path)
+        feishu_sheet_meta = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_sheet_meta)
+        sys.modules["afa_feishu_sheet_meta"] = feishu_sheet_meta
 
 # -------------------------------------------------------------------
 # 飞书写入数据节点
@@ -67,6 +110,9 @@ class FeishuWriteNode:
                 "Content-Type": "application/json"
             }
             
+            # 工作表是否来自表格元数据缓存（请求失败时使缓存失效，工作表可能已被删除）
+            sheet_from_cache = False
+            
             # 检测表格类型并使用对应的API端点
             if "base" in sheet_url:
                 # 多维表格API (暂不支持)
@@ -80,11 +126,12 @@ class FeishuWriteNode:
                 
                 # 如果URL中没有sheet参数，通过API获取工作表列表
                 if sheet_name is None:
+                    sheet_from_cache = True
                     sheet_name = self._get_sheet_list(access_token, spreadsheet_token)
                     if sheet_name is None:
                         return ("Error: 无法获取工作表信息，请检查表格权限或提供包含sheet参数的完整URL",)
                 
-                api_url = f"https://open.feishu.cn/open-apis/sheets/v2/spreadsheets/{spreadsheet_token}/values"
+                api_url = f"/sheets/v2/spreadsheets/{spreadsheet_token}/values"
                 print(f"[飞书写入] 使用飞书表格API v2，spreadsheet_token: {spreadsheet_token}, sheet_name: {sheet_name}")
             
             # 构建请求体 - 使用工作表名称
@@ -97,11 +144,13 @@ class FeishuWriteNode:
             
             print(f"[飞书写入] 写入数据到单元格 {cell_range} (行{row}, 列{column}): {data}")
             
-            response = requests.put(api_url, headers=headers, json=write_data, timeout=30)
+            response = feishu_client.put(api_url, headers=headers, json=write_data)
             
             if response.status_code != 200:
                 error_msg = f"Error: 飞书API写入失败 (状态码: {response.status_code})"
                 print(f"[飞书写入] {error_msg}")
+                if sheet_from_cache:
+                    feishu_sheet_meta.invalidate_sheet_metadata(spreadsheet_token)
                 try:
                     error_detail = response.json()
                     print(f"[飞书写入] 错误详情: {error_detail}")
@@ -125,6 +174,8 @@ class FeishuWriteNode:
             else:
                 error_msg = f"Error: 写入失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}, 完整响应: {result}"
                 print(f"[飞书写入] {error_msg}")
+                if sheet_from_cache:
+                    feishu_sheet_meta.invalidate_sheet_metadata(spreadsheet_token)
                 return (error_msg,)
                 
         except json.JSONDecodeError:
@@ -135,40 +186,8 @@ class FeishuWriteNode:
             return (error_msg,)
     
     def _get_access_token(self, app_id, app_secret):
-        """获取飞书访问令牌"""
-        try:
-            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "app_id": app_id,
-                "app_secret": app_secret
-            }
-            
-            print(f"[飞书写入] 正在获取访问令牌，app_id: {app_id[:10]}...")
-            
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            
-            if response.status_code != 200:
-                error_msg = f"Error: 获取访问令牌失败 (状态码: {response.status_code}), 响应: {response.text}"
-                print(f"[飞书写入] {error_msg}")
-                return error_msg
-            
-            result = response.json()
-            print(f"[飞书写入] Token API响应: {result}")
-            
-            if result.get("code") == 0:
-                token = result.get("tenant_access_token")
-                print(f"[飞书写入] 访问令牌获取成功")
-                return token
-            else:
-                error_msg = f"Error: 获取访问令牌失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}"
-                print(f"[飞书写入] {error_msg}")
-                return error_msg
-                
-        except Exception as e:
-            error_msg = f"Error: 获取访问令牌异常: {str(e)}"
-            print(f"[飞书写入] {error_msg}")
-            return error_msg
+        """获取飞书访问令牌（使用共享缓存，到期前才重新请求）"""
+        return get_tenant_access_token(app_id, app_secret)
     
     def _convert_to_a1_notation(self, row, column):
         """将行列号转换为A1:A1格式（飞书API要求的范围格式）"""
@@ -220,43 +239,11 @@ class FeishuWriteNode:
             return None
     
     def _get_sheet_list(self, access_token, spreadsheet_token):
-        """获取工作表列表 - 使用metainfo端点"""
-        try:
-            # 使用正确的metainfo端点
-            url = f"https://open.feishu.cn/open-apis/sheets/v2/spreadsheets/{spreadsheet_token}/metainfo"
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            
-            print(f"[飞书写入] 正在获取工作表列表...")
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code != 200:
-                error_msg = f"Error: 获取工作表列表失败 (状态码: {response.status_code})"
-                print(f"[飞书写入] {error_msg}")
-                return None
-            
-            result = response.json()
-            
-            if result.get("code") == 0 and "data" in result:
-                sheets = result["data"].get("sheets", [])
-                if sheets:
-                    # 使用第一个工作表的sheetId作为sheet名称（符合飞书API要求）
-                    first_sheet = sheets[0]
-                    sheet_id = first_sheet.get("sheetId", "")
-                    print(f"[飞书写入] 使用第一个工作表的sheetId: {sheet_id}")
-                    return sheet_id
-                else:
-                    print(f"[飞书写入] 未找到任何工作表")
-                    return None
-            else:
-                error_msg = f"Error: 获取工作表列表失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}"
-                print(f"[飞书写入] {error_msg}")
-                return None
-                
-        except Exception as e:
-            error_msg = f"Error: 获取工作表列表异常: {str(e)}"
-            print(f"[飞书写入] {error_msg}")
-            return None
\ No newline at end of file
+        """获取第一个工作表的sheetId（使用共享的表格元数据缓存，有效期内不再请求metainfo端点）"""
+        sheet_id = feishu_sheet_meta.get_first_sheet_id(access_token, spreadsheet_token)
+        if sheet_id is None:
+            print(f"[飞书写入] 未找到任何工作表")
+            return None
+        # 使用第一个工作表的sheetId作为sheet名称（符合飞书API要求）
+        print(f"[飞书写入] 使用第一个工作表的sheetId: {sheet_id}")
+        return sheet_id
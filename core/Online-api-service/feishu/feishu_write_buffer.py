@@ -0,0 +1,387 @@
+"""
+飞书缓冲写入模块
+把多次节点执行的单元格写入按表格（spreadsheet_token）放入队列，相邻单元格合并为矩形范围后
+通过 values_batch_update 一次提交，写回几百行结果时不会触发飞书的应用级QPS限制。
+
+以下情况提交队列：
+    队列中的单元格数达到 FLUSH_SIZE
+    最早一次未提交的写入经过 FLUSH_INTERVAL 秒（后台定时器）
+    ComfyUI 执行完一个提示（可以导入 PromptServer 时）、飞书提交写入节点执行时、进程退出时
+
+提交失败时按错误类型处理：
+    429、5xx、连接失败和令牌错误是暂时性的，该批及之后的单元格留在队列中，按退避时间重新定时提交，
+    连续失败 MAX_FLUSH_ATTEMPTS 次后放弃
+    其他4xx和非0业务错误码不会因为重试而成功，多个范围的批次逐个范围重新提交，只放弃出错的范围并在结果中报告，
+    其余范围照常写入，一个错误的单元格不会阻塞整个表格的队列
+
+按路径加载本模块时请以 "afa_feishu_write_buffer" 注册到 sys.modules，使各节点共享同一组队列。
+"""
+
+import os
+import sys
+import atexit
+import itertools
+import threading
+from collections import deque
+
+try:
+    from . import feishu_client
+    from .feishu_auth import get_tenant_access_token
+except ImportError:
+    import importlib.util
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    feishu_client = sys.modules.get("afa_feishu_client")
+    if feishu_client is None:
+        spec = importlib.util.spec_from_file_location("afa_feishu_client", os.path.join(current_dir, "feishu_client.py"))
+        feishu_client = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_client)
+        sys.modules["afa_feishu_client"] = feishu_client
+    feishu_auth = sys.modules.get("afa_feishu_auth")
+    if feishu_auth is None:
+        spec = importlib.util.spec_from_file_location("afa_feishu_auth", os.path.join(current_dir, "feishu_auth.py"))
+        feishu_auth = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(feishu_auth)
+        sys.modules["afa_feishu_auth"] = feishu_auth
+    get_tenant_access_token = feishu_auth.get_tenant_access_token
+
+# 在ComfyUI中运行时用于检测提示执行结束
+try:
+    from server import PromptServer
+    PROMPT_SERVER_AVAILABLE = True
+except ImportError:
+    PROMPT_SERVER_AVAILABLE = False
+
+# 队列中的单元格数达到该值时立即提交
+FLUSH_SIZE = 500
+# 最早一次未提交的写入经过多少秒后提交
+FLUSH_INTERVAL = 5.0
+# 飞书单个写入范围最多5000行、100列
+MAX_RANGE_ROWS = 5000
+MAX_RANGE_COLUMNS = 100
+# 每次 values_batch_update 请求最多包含的单元格数
+MAX_CELLS_PER_REQUEST = 5000
+# 暂时性错误连续提交失败多少次后放弃队列中的单元格
+MAX_FLUSH_ATTEMPTS = 5
+# 提交失败后重新提交的最长等待时间（秒），从 FLUSH_INTERVAL 开始每次加倍
+FLUSH_RETRY_MAX_DELAY = 60.0
+# 飞书的频率限制业务错误码，重试可以成功
+RATE_LIMIT_CODES = {90217, 99991400}
+# 结果中最多列出的错误数
+MAX_REPORTED_ERRORS = 3
+# 提示执行结束时 PromptServer 发送的事件
+PROMPT_END_EVENTS = {"execution_success", "execution_error", "execution_interrupted"}
+
+_lock = threading.Lock()
+# spreadsheet_token -> {"app_id", "app_secret", "cells": {(sheet_id, row, column): value}, "timer", "failures"}
+_queues = {}
+# spreadsheet_token -> 提交锁，同一表格的写入按顺序提交
+_flush_locks = {}
+_prompt_hook_installed = False
+# 进程退出时不再启动重试定时器
+_exiting = False
+
+
+def column_letter(column):
+    """列号转换为列字母（1 -> A）"""
+    letters = ""
+    while column > 0:
+        column -= 1
+        letters = chr(65 + column % 26) + letters
+        column //= 26
+    return letters
+
+
+def coalesce_cells(cells):
+    """把 {(sheet_id, row, column): value} 合并为矩形范围
+
+    同一行中列号连续的单元格合并为一段，相邻行中列范围相同的段继续合并为一个矩形
+
+    Returns:
+        [(sheet_id, 起始行, 起始列, 结束行, 结束列, 二维值列表), ...]
+    """
+    rows = {}
+    for (sheet_id, row, column), value in cells.items():
+        rows.setdefault((sheet_id, row), {})[column] = value
+
+    rects = []
+    # (sheet_id, 起始列, 结束列) -> 最近一个以该列范围结束的矩形
+    open_rects = {}
+    for sheet_id, row in sorted(rows):
+        row_cells = rows[(sheet_id, row)]
+        columns = sorted(row_cells)
+        start = 0
+        for i in range(1, len(columns) + 1):
+            if i < len(columns) and columns[i] == columns[i - 1] + 1 and i - start < MAX_RANGE_COLUMNS:
+                continue
+            left, right = columns[start], columns[i - 1]
+            values = [row_cells[column] for column in columns[start:i]]
+            rect = open_rects.get((sheet_id, left, right))
+            if rect is not None and rect[3] == row - 1 and rect[3] - rect[1] + 1 < MAX_RANGE_ROWS:
+                rect[3] = row
+                rect[5].append(values)
+            else:
+                rect = [sheet_id, row, left, row, right, [values]]
+                open_rects[(sheet_id, left, right)] = rect
+                rects.append(rect)
+            start = i
+    return [tuple(rect) for rect in rects]
+
+
+def _rect_cells(rect):
+    """矩形范围展开为 {(sheet_id, row, column): value}"""
+    sheet_id, top, left, _, _, values = rect
+    return {(sheet_id, top + i, left + j): value
+            for i, row_values in enumerate(values) for j, value in enumerate(row_values)}
+
+
+def _range_name(rect):
+    sheet_id, top, left, bottom, right, _ = rect
+    return f"{sheet_id}!{column_letter(left)}{top}:{column_letter(right)}{bottom}"
+
+
+def _error_code(response):
+    """非200响应中的业务错误码，响应不是JSON时返回None"""
+    try:
+        return response.json().get("code")
+    except (ValueError, AttributeError):
+        return None
+
+
+def _post_ranges(url, headers, rects):
+    """提交一批矩形范围
+
+    Returns:
+        成功时为None，失败时为 (错误信息, 是否为暂时性错误)
+    """
+    try:
+        # 覆盖写入同样的值没有副作用，5xx时也可以重试
+        response = feishu_client.post(url, headers=headers, json={
+            "valueRanges": [{"range": _range_name(rect), "values": rect[5]} for rect in rects]
+        }, idempotent=True)
+        status = response.status_code
+        if status != 200:
+            transient = (status == 429 or status >= 500 or feishu_client.is_token_error(response)
+                         or _error_code(response) in RATE_LIMIT_CODES)
+            return f"Error: 飞书API批量写入失败 (状态码: {status})", transient
+        result = response.json()
+        if result.get("code") != 0:
+            error = f"Error: 批量写入失败: code={result.get('code')}, msg={result.get('msg', '未知错误')}"
+            return error, result.get("code") in RATE_LIMIT_CODES
+    except Exception as e:
+        return f"Error: 批量写入异常: {str(e)}", True
+    return None
+
+
+def _send(app_id, app_secret, spreadsheet_token, cells):
+    """合并单元格并通过 values_batch_update 提交
+
+    暂时性错误时停止提交，该批及之后的单元格需要重试；其他错误时逐个范围重新提交该批，
+    只放弃出错的范围。
+
+    Returns:
+        (写入的范围数, 错误信息列表, 需要重试的单元格, 放弃的单元格数)
+    """
+    access_token = get_tenant_access_token(app_id, app_secret)
+    if access_token.startswith("Error:"):
+        return 0, [access_token], cells, 0
+
+    batches = [[]]
+    batch_cells = 0
+    for rect in coalesce_cells(cells):
+        size = (rect[3] - rect[1] + 1) * (rect[4] - rect[2] + 1)
+        if batches[-1] and batch_cells + size > MAX_CELLS_PER_REQUEST:
+            batches.append([])
+            batch_cells = 0
+        batches[-1].append(rect)
+        batch_cells += size
+
+    url = f"/sheets/v2/spreadsheets/{spreadsheet_token}/values_batch_update"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    range_count, errors, dropped = 0, [], 0
+    pending = deque(batches)
+    while pending:
+        batch = pending.popleft()
+        failure = _post_ranges(url, headers, batch)
+        if failure is None:
+            range_count += len(batch)
+            continue
+        error, transient = failure
+        if transient:
+            retry = {}
+            for rect in itertools.chain(batch, *pending):
+                retry.update(_rect_cells(rect))
+            errors.append(error)
+            return range_count, errors, retry, dropped
+        if len(batch) > 1:
+            # 逐个范围重新提交，找出出错的范围
+            pending.extendleft([rect] for rect in reversed(batch))
+            continue
+        errors.append(f"{error}（范围 {_range_name(batch[0])}）")
+        dropped += len(_rect_cells(batch[0]))
+    return range_count, errors, {}, dropped
+
+
+def _start_timer(spreadsheet_token, queue, delay):
+    """（持有 _lock 时调用）启动或重新启动表格的提交定时器"""
+    if queue["timer"] is not None:
+        queue["timer"].cancel()
+    timer = threading.Timer(delay, _flush_on_timer, args=(spreadsheet_token,))
+    timer.daemon = True
+    queue["timer"] = timer
+    timer.start()
+
+
+def add_writes(app_id, app_secret, spreadsheet_token, writes):
+    """把写入放入表格的队列，同一单元格只保留最后一次写入的值
+
+    Args:
+        writes: [(sheet_id, row, column, value), ...]
+
+    Returns:
+        (队列中待提交的单元格数, 达到 FLUSH_SIZE 时的提交结果，否则为None)
+    """
+    _install_prompt_hook()
+    with _lock:
+        queue = _queues.get(spreadsheet_token)
+        if queue is None:
+            queue = _queues[spreadsheet_token] = {"cells": {}, "timer": None, "failures": 0}
+        queue["app_id"] = app_id
+        queue["app_secret"] = app_secret
+        for sheet_id, row, column, value in writes:
+            queue["cells"][(sheet_id, row, column)] = value
+        pending = len(queue["cells"])
+        if pending < FLUSH_SIZE and pending and queue["timer"] is None:
+            _start_timer(spreadsheet_token, queue, FLUSH_INTERVAL)
+
+    if pending >= FLUSH_SIZE:
+        return pending, flush(spreadsheet_token)
+    return pending, None
+
+
+def pending_count(spreadsheet_token=None):
+    """队列中待提交的单元格数，spreadsheet_token为None时统计全部表格"""
+    with _lock:
+        if spreadsheet_token is not None:
+            queue = _queues.get(spreadsheet_token)
+            return len(queue["cells"]) if queue else 0
+        return sum(len(queue["cells"]) for queue in _queues.values())
+
+
+def flush(spreadsheet_token):
+    """立即提交一个表格队列中的全部写入
+
+    暂时性错误时未写入的单元格放回队列并按退避时间重新定时提交，其他错误的范围被放弃
+
+    Returns:
+        结果字符串；有错误时以 "Error:" 开头
+    """
+    with _lock:
+        flush_lock = _flush_locks.setdefault(spreadsheet_token, threading.Lock())
+
+    with flush_lock:
+        with _lock:
+            queue = _queues.get(spreadsheet_token)
+            if queue is None or not queue["cells"]:
+                return "没有待提交的写入"
+            cells = queue["cells"]
+            queue["cells"] = {}
+            if queue["timer"] is not None:
+                queue["timer"].cancel()
+                queue["timer"] = None
+            app_id, app_secret = queue["app_id"], queue["app_secret"]
+
+        range_count, errors, retry, dropped = _send(app_id, app_secret, spreadsheet_token, cells)
+        written = len(cells) - len(retry) - dropped
+        with _lock:
+            if not retry:
+                queue["failures"] = 0
+            else:
+                queue["failures"] += 1
+                if queue["failures"] >= MAX_FLUSH_ATTEMPTS:
+                    errors.append(f"Error: 连续 {queue['failures']} 次提交失败，放弃未写入的单元格")
+                    dropped += len(retry)
+                    retry = {}
+                    queue["failures"] = 0
+                else:
+                    # 提交期间新放入队列的值比失败的值更新
+                    retry.update(queue["cells"])
+                    queue["cells"] = retry
+                    if not _exiting:
+                        delay = min(FLUSH_INTERVAL * 2 ** (queue["failures"] - 1), FLUSH_RETRY_MAX_DELAY)
+                        _start_timer(spreadsheet_token, queue, delay)
+
+        if errors:
+            error_msg = "；".join(errors[:MAX_REPORTED_ERRORS])
+            if len(errors) > MAX_REPORTED_ERRORS:
+                error_msg += f" 等 {len(errors)} 个错误"
+            error_msg += f"（已写入 {written} 个单元格"
+            if retry:
+                error_msg += f"，{len(retry)} 个单元格留在队列中等待重试"
+            if dropped:
+                error_msg += f"，放弃 {dropped} 个单元格"
+            error_msg += "）"
+            print(f"[飞书缓冲写入] {spreadsheet_token}: {error_msg}")
+            return error_msg
+
+        success_msg = f"成功提交 {written} 个单元格（{range_count} 个范围）"
+        print(f"[飞书缓冲写入] {spreadsheet_token}: {success_msg}")
+        return success_msg
+
+
+def flush_all():
+    """提交所有表格队列中的写入
+
+    Returns:
+        {spreadsheet_token: 结果字符串}
+    """
+    with _lock:
+        tokens = [token for token, queue in _queues.items() if queue["cells"]]
+    return {token: flush(token) for token in tokens}
+
+
+def _flush_on_timer(spreadsheet_token):
+    with _lock:
+        queue = _queues.get(spreadsheet_token)
+        if queue is not None:
+            queue["timer"] = None
+    flush(spreadsheet_token)
+
+
+def _install_prompt_hook():
+    """ComfyUI执行完一个提示时在后台提交全部写入（包装 PromptServer.send_sync）"""
+    global _prompt_hook_installed
+    if _prompt_hook_installed or not PROMPT_SERVER_AVAILABLE:
+        return
+    server = getattr(PromptServer, "instance", None)
+    if server is None:
+        return
+
+    with _lock:
+        if _prompt_hook_installed:
+            return
+        _prompt_hook_installed = True
+        send_sync = server.send_sync
+
+        def send_sync_and_flush(event, data, *args, **kwargs):
+            result = send_sync(event, data, *args, **kwargs)
+            # 提示执行结束时发送 executing(node=None)，新版本还会发送 execution_success 等事件
+            prompt_end = event in PROMPT_END_EVENTS or (
+                event == "executing" and isinstance(data, dict) and data.get("node") is None)
+            if prompt_end and pending_count():
+                threading.Thread(target=flush_all, daemon=True).start()
+            return result
+
+        server.send_sync = send_sync_and_flush
+
+
+def _flush_at_exit():
+    """进程退出时提交全部写入，失败的单元格不再重试"""
+    global _exiting
+    _exiting = True
+    flush_all()
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,100 @@
+"""
+图像格式转换模块
+张量（或numpy数组）到uint8数组 / PIL图像的向量化转换，供PSD导出、图层预览和飞书上传共用。
+
+像素的取值范围由数据类型和图层元数据决定，不再对每个图层做一次 max() 归约来猜测：
+    uint8 张量          0~255
+    浮点张量            0~1（ComfyUI图像和 pack_layer_pixels 的约定）
+    图层 metadata["pixel_format"]["value_range"] 记录像素的取值上限，由创建图层的节点写入（见 pixel_source.pixel_format）
+
+按路径加载本模块时请以 "afa_image_convert" 注册到 sys.modules。
+"""
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def layer_value_range(layer):
+    """图层元数据中记录的像素取值上限，没有记录时返回None（按数据类型决定）"""
+    metadata = layer.get("metadata") or {}
+    pixel_info = metadata.get("pixel_format") or {}
+    return pixel_info.get("value_range")
+
+
+def _is_uint8(image):
+    if isinstance(image, torch.Tensor):
+        return image.dtype == torch.uint8
+    return np.asarray(image).dtype == np.uint8
+
+
+def to_uint8_array(image, value_range=None):
+    """把 [B, H, W, C] / [H, W, C] 的张量或数组转换为 [H, W, C] 的uint8数组（批次取第一张）
+
+    Args:
+        value_range: 浮点像素的取值上限，None时按约定为1.0；uint8像素直接返回
+    """
+    if isinstance(image, torch.Tensor):
+        if image.dim() == 4:
+            image = image[0]
+        if image.dtype != torch.uint8:
+            scale = 255.0 / float(value_range or 1.0)
+            image = image.detach().float().mul(scale).round_().clamp_(0, 255).to(torch.uint8)
+        return image.cpu().numpy()
+
+    image = np.asarray(image)
+    if image.ndim == 4:
+        image = image[0]
+    if image.dtype != np.uint8:
+        scale = np.float32(255.0 / float(value_range or 1.0))
+        image = np.clip(np.rint(image.astype(np.float32) * scale), 0, 255).astype(np.uint8)
+    return image
+
+
+def to_rgba(array):
+    """把 [H, W, C]（C为1、3或4，也接受 [C, H, W]）的uint8数组转换为 [H, W, 4]，RGBA输入原样返回"""
+    if array.ndim == 2:
+        array = array[..., None]
+    elif array.ndim == 3 and array.shape[0] in (1, 3, 4) and array.shape[-1] not in (1, 3, 4):
+        array = np.transpose(array, (1, 2, 0))
+    channels = array.shape[-1]
+    if channels == 4:
+        return array
+    rgba = np.empty((*array.shape[:2], 4), dtype=np.uint8)
+    rgba[..., :3] = array[..., :3] if channels >= 3 else array[..., :1]
+    rgba[..., 3] = 255
+    return rgba
+
+
+def apply_opacity(rgba, opacity):
+    """把不透明度乘到RGBA数组的alpha通道上（原地修改）"""
+    if opacity < 1.0:
+        alpha = rgba[..., 3]
+        np.multiply(alpha, np.float32(max(opacity, 0.0)), out=alpha, casting="unsafe")
+    return rgba
+
+
+def tensor_to_pil(image, mode=None, value_range=None, opacity=1.0):
+    """把张量或数组转换为PIL图像
+
+    Args:
+        mode: "RGBA" 时补齐alpha通道并应用不透明度；None时按通道数（L / RGB / RGBA）
+    """
+    source = to_uint8_array(image, value_range)
+    array = source
+    if mode == "RGBA" or opacity < 1.0:
+        array = to_rgba(source)
+        if opacity < 1.0:
+            # uint8输入不经过转换，数组与输入的张量/数组共享内存，修改alpha前先复制
+            if _is_uint8(image) and np.may_share_memory(array, source):
+                array = array.copy()
+            apply_opacity(array, opacity)
+        return Image.fromarray(array, "RGBA")
+    if array.ndim == 3 and array.shape[-1] == 1:
+        array = array[..., 0]
+    return Image.fromarray(array)
+
+
+def layer_to_rgba(layer, image):
+    """按图层元数据把图层像素转换为 [H, W, 4] 的uint8数组"""
+    return to_rgba(to_uint8_array(image, layer_value_range(layer)))
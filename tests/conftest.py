@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import threading
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANIMATION_DIR = os.path.join(REPO_DIR, "core", "2d-animation-tools")
+FEISHU_DIR = os.path.join(REPO_DIR, "core", "Online-api-service", "feishu")
+
+
+def load_module(module_name, *path_parts):
+    """与根目录 __init__.py 相同的方式按路径加载模块（目录名含连字符，无法按包导入）"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(*path_parts))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_animation_module(module_name, subdir, file_name):
+    return load_module(module_name, ANIMATION_DIR, subdir, file_name)
+
+
+def load_feishu_module(file_name):
+    """飞书模块以 afa_* 名称注册，与节点之间共享同一份缓存和连接池"""
+    return load_module("afa_" + file_name[:-3], FEISHU_DIR, file_name)
+
+
+@pytest.fixture
+def tmp_psd(tmp_path):
+    return str(tmp_path / "test.psd")
+
+
+class FeishuTestServer:
+    """本地模拟的飞书接口
+
+    routes: {(方法, 路径前缀): handler(请求) -> (状态码, JSON响应[, 响应头])}，请求为
+    {"method", "path", "headers", "json"}；收到的请求按顺序记录在 requests 中。
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                request = {"method": self.command, "path": self.path, "headers": dict(self.headers),
+                           "json": json.loads(body) if body else None}
+                server.requests.append(request)
+                for (method, prefix), route in server.routes.items():
+                    if method == self.command and self.path.startswith(prefix):
+                        status, payload, *headers = route(request)
+                        break
+                else:
+                    status, payload, headers = 404, {"code": -1, "msg": "not found"}, []
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers[0] if headers else {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/open-apis"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def paths(self, prefix=""):
+        return [request["path"] for request in self.requests if request["path"].startswith(prefix)]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def feishu_server(monkeypatch):
+    """把飞书客户端的 BASE_URL 指向本地服务器，并清空令牌缓存"""
+    feishu_client = load_feishu_module("feishu_client.py")
+    feishu_auth = load_feishu_module("feishu_auth.py")
+    server = FeishuTestServer()
+    monkeypatch.setattr(feishu_client, "BASE_URL", server.base_url)
+    monkeypatch.setattr(feishu_client, "BACKOFF_BASE", 0.01)
+    feishu_auth.invalidate_token()
+    yield server
+    feishu_auth.invalidate_token()
+    server.close()
@@ -0,0 +1,87 @@
+import json
+import os
+
+import torch
+from psd_tools import PSDImage
+
+from conftest import load_animation_module
+
+batch_export_psd = load_animation_module("batch_export_psd", "LayerIO", "batch_export_psd.py")
+create_blank_document = load_animation_module("Create_blank_document", "LayerEdit", "Create_blank_document.py")
+create_layer = load_animation_module("Create_layer", "LayerEdit", "Create_layer.py")
+add_layer_to_document = load_animation_module("Add_layer_to_document", "LayerEdit", "Add_layer_to_document.py")
+
+
+def _build_document(x=0):
+    document = create_blank_document.CreateBlankDocumentNode().create_blank_document(宽度=32, 高度=24)[0]
+    image = torch.tensor((1.0, 0.0, 0.0, 1.0)).expand(1, 8, 8, 4).clone()
+    layer = create_layer.CreateLayerNode().create_layer(图像=image, 名称="图层", X坐标=x, Y坐标=2)[0]
+    return add_layer_to_document.AddLayerToDocumentNode().add_layer_to_document(文档=document, 图层=layer)[0]
+
+
+def _export(**kwargs):
+    """按ComfyUI的 INPUT_IS_LIST 方式调用：每个输入都是列表"""
+    inputs = {"并行方式": ["线程池"], "并行数": [2], "DPI": [72]}
+    inputs.update(kwargs)
+    return batch_export_psd.BatchExportPSDNode().batch_export_psd(**inputs)
+
+
+def test_node_receives_inputs_as_lists():
+    assert batch_export_psd.BatchExportPSDNode.INPUT_IS_LIST is True
+
+
+def test_document_list_exports_one_file_per_document(tmp_path):
+    pattern = str(tmp_path / "doc_{index}.psd")
+    paths, info = _export(文档=[_build_document(0), _build_document(5), _build_document(10)], 文件名模式=[pattern])
+    paths = paths.split("\n")
+    assert paths == [str(tmp_path / f"doc_{index}.psd") for index in range(3)], info
+    assert [list(PSDImage.open(path))[0].left for path in paths] == [0, 5, 10]
+
+
+def test_single_document_uses_frame_transforms(tmp_path):
+    pattern = str(tmp_path / "frame_{frame:02d}.psd")
+    document = _build_document()
+    layer_id = document["layers"][0]["layer_id"]
+    transforms = json.dumps([{str(layer_id): {"position": [x, 2]}} for x in (3, 6)])
+    paths, info = _export(文档=[document], 文件名模式=[pattern], 帧变换=[transforms], 起始帧号=[7])
+    paths = paths.split("\n")
+    assert paths == [str(tmp_path / "frame_07.psd"), str(tmp_path / "frame_08.psd")], info
+    assert [list(PSDImage.open(path))[0].left for path in paths] == [3, 6]
+
+
+def test_direct_call_with_single_document(tmp_path):
+    paths, info = batch_export_psd.BatchExportPSDNode().batch_export_psd(
+        文档=_build_document(), 文件名模式=str(tmp_path / "single.psd"), 并行数=1)
+    assert paths == str(tmp_path / "single.psd"), info
+    assert os.path.exists(paths)
+
+
+def test_thread_pool_is_the_default(tmp_path, monkeypatch):
+    inputs = batch_export_psd.BatchExportPSDNode.INPUT_TYPES()["optional"]["并行方式"]
+    assert inputs[1]["default"] == "线程池"
+
+    def no_processes(*args, **kwargs):
+        raise AssertionError("默认不应启动进程池")
+
+    monkeypatch.setattr(batch_export_psd, "ProcessPoolExecutor", no_processes)
+    paths, info = batch_export_psd.BatchExportPSDNode().batch_export_psd(
+        文档=[_build_document(0), _build_document(5)], 文件名模式=str(tmp_path / "doc_{index}.psd"), 并行数=2, DPI=72)
+    assert len(paths.split("\n")) == 2, info
+
+
+def test_process_pool_uses_spawn(tmp_path, monkeypatch):
+    contexts = []
+    process_pool = batch_export_psd.ProcessPoolExecutor
+
+    def recording_pool(*args, **kwargs):
+        contexts.append(kwargs.get("mp_context"))
+        return process_pool(*args, **kwargs)
+
+    monkeypatch.setattr(batch_export_psd, "ProcessPoolExecutor", recording_pool)
+    document = _build_document()
+    layer_id = document["layers"][0]["layer_id"]
+    transforms = json.dumps([{str(layer_id): {"position": [x, 2]}} for x in (3, 6)])
+    paths, info = _export(文档=[document], 文件名模式=[str(tmp_path / "frame_{frame}.psd")], 帧变换=[transforms],
+                          并行方式=["进程池"])
+    assert [context.get_start_method() for context in contexts] == ["spawn"]
+    assert [list(PSDImage.open(path))[0].left for path in paths.split("\n")] == [3, 6], info
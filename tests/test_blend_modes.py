@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import load_animation_module
+
+blend_modes = load_animation_module("blend_modes", "LayerUtils", "blend_modes.py")
+BlendModes = blend_modes.BlendModes
+
+MODES = [
+    "normal", "multiply", "screen", "overlay", "soft_light", "hard_light",
+    "color_dodge", "color_burn", "darken", "lighten", "difference", "exclusion",
+]
+
+
+def reference_blend(mode, b, o):
+    """逐模式的参考公式，与融合内核之前各混合模式方法中的 np.where 写法相同"""
+    if mode == "multiply":
+        return b * o
+    if mode == "screen":
+        return 1 - (1 - b) * (1 - o)
+    if mode == "overlay":
+        return np.where(b < 0.5, 2 * b * o, 1 - 2 * (1 - b) * (1 - o))
+    if mode == "soft_light":
+        return np.where(o < 0.5, b + (2 * o - 1) * b * (1 - b), b + (2 * o - 1) * (np.sqrt(b) - b))
+    if mode == "hard_light":
+        return np.where(o < 0.5, 2 * b * o, 1 - 2 * (1 - b) * (1 - o))
+    if mode == "color_dodge":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(o <= 0.0, 0.0, np.where(o >= 1.0, 1.0, np.minimum(b / (1 - o), 1.0)))
+    if mode == "color_burn":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(o <= 0.0, 0.0, np.where(o >= 1.0, b, np.maximum(1 - (1 - b) / o, 0.0)))
+    if mode == "darken":
+        return np.minimum(b, o)
+    if mode == "lighten":
+        return np.maximum(b, o)
+    if mode == "difference":
+        return np.abs(b - o)
+    if mode == "exclusion":
+        return b + o - 2 * b * o
+    return o
+
+
+def reference_composite(base, overlay, mode, opacity):
+    """straight alpha 的标准 source-over 合成（底层不透明时即为 base * (1 - fa) + B * fa）"""
+    b, ab = base[..., :3].astype(np.float64), base[..., 3:4].astype(np.float64)
+    o, fa = overlay[..., :3].astype(np.float64), overlay[..., 3:4].astype(np.float64) * opacity
+    blended = (1 - ab) * o + ab * reference_blend(mode, b, o)
+    alpha = fa + ab * (1 - fa)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        color = np.where(alpha > 0, (fa * blended + ab * (1 - fa) * b) / alpha, b)
+    return np.clip(np.concatenate([color, alpha], axis=-1), 0.0, 1.0)
+
+
+def _images(opaque_base, seed=0, height=19, width=13):
+    rng = np.random.default_rng(seed)
+    base = rng.random((height, width, 4), dtype=np.float32)
+    overlay = rng.random((height, width, 4), dtype=np.float32)
+    # 覆盖边界值：0、0.5、1
+    overlay[0, :, :3] = 0.0
+    overlay[1, :, :3] = 1.0
+    base[2, :, :3] = 0.5
+    if opaque_base:
+        base[..., 3] = 1.0
+    return base, overlay
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("opaque_base", [True, False])
+def test_composite_into_matches_reference(mode, opaque_base):
+    base, overlay = _images(opaque_base)
+    expected = reference_composite(base, overlay, mode, 0.7)
+    # 较小的分块行数同时覆盖分块边界
+    result = BlendModes.composite_into(base, overlay, mode, 0.7, tile_rows=4)
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_composite_into_in_place(mode):
+    base, overlay = _images(False, seed=1)
+    expected = BlendModes.composite_into(base, overlay, mode, 0.5)
+    out = base.copy()
+    BlendModes.composite_into(out, overlay, mode, 0.5, out=out, tile_rows=5)
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_torch_kernel_matches_numpy(mode):
+    base, overlay = _images(False, seed=2)
+    expected = BlendModes.composite_into(base, overlay, mode, 0.8)
+    result = BlendModes.composite_into_torch(torch.from_numpy(base), torch.from_numpy(overlay), mode, 0.8, tile_rows=6)
+    np.testing.assert_allclose(result.numpy(), expected, atol=1e-5)
+
+
+def _premultiply(image):
+    result = image.copy()
+    result[..., :3] *= result[..., 3:4]
+    return result
+
+
+def _unpremultiply(image):
+    result = image.copy()
+    alpha = result[..., 3:4]
+    np.divide(result[..., :3], alpha, out=result[..., :3], where=alpha > 1e-3)
+    return result
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("use_torch", [False, True])
+def test_premultiplied_kernel_matches_straight(mode, use_torch):
+    base, overlay = _images(False, seed=3)
+    # 反预乘在alpha很小时放大误差，只比较alpha足够大的像素
+    base[..., 3] = 0.2 + 0.8 * base[..., 3]
+    expected = BlendModes.composite_into(base, overlay, mode, 0.6)
+    if use_torch:
+        result = BlendModes.composite_premultiplied_into_torch(
+            torch.from_numpy(_premultiply(base)), torch.from_numpy(_premultiply(overlay)), mode, 0.6, tile_rows=7
+        ).numpy()
+    else:
+        result = BlendModes.composite_premultiplied_into(_premultiply(base), _premultiply(overlay), mode, 0.6, tile_rows=7)
+    np.testing.assert_allclose(_unpremultiply(result), expected, atol=1e-4)
+
+
+@pytest.mark.parametrize("mode_cn,mode", [("正常", "normal"), ("正片叠底", "multiply"), ("柔光", "soft_light")])
+def test_apply_blend_mode_backends(mode_cn, mode):
+    base, overlay = _images(True, seed=4)
+    expected = reference_composite(base, overlay, mode, 0.9)
+    np.testing.assert_allclose(BlendModes.apply_blend_mode(base, overlay, mode_cn, 0.9), expected, atol=1e-5)
+    result = BlendModes.apply_blend_mode(base, overlay, mode_cn, 0.9, backend="torch")
+    np.testing.assert_allclose(np.asarray(result).reshape(expected.shape), expected, atol=1e-5)
@@ -0,0 +1,131 @@
+import numpy as np
+import torch
+
+from conftest import load_animation_module
+
+create_blank_document = load_animation_module("Create_blank_document", "LayerEdit", "Create_blank_document.py")
+create_layer = load_animation_module("Create_layer", "LayerEdit", "Create_layer.py")
+add_layer_to_document = load_animation_module("Add_layer_to_document", "LayerEdit", "Add_layer_to_document.py")
+preview_document = load_animation_module("Preview_document", "LayerUtils", "Preview_document.py")
+composite_cache_module = load_animation_module("composite_cache", "LayerUtils", "composite_cache.py")
+
+
+def _build_document(width=64, height=48, colors=((1.0, 0.0, 0.0, 1.0), (0.0, 0.0, 1.0, 0.5))):
+    document = create_blank_document.CreateBlankDocumentNode().create_blank_document(宽度=width, 高度=height)[0]
+    for index, color in enumerate(colors):
+        image = torch.tensor(color, dtype=torch.float32).expand(1, 32, 32, 4).clone()
+        layer = create_layer.CreateLayerNode().create_layer(
+            图像=image, 名称=f"图层{index}", X坐标=8 * index, Y坐标=4 * index
+        )[0]
+        document = add_layer_to_document.AddLayerToDocumentNode().add_layer_to_document(文档=document, 图层=layer)[0]
+    return document
+
+
+def _preview(document, **kwargs):
+    # 合成缓存只用于浮点合成，默认关闭
+    options = {"合成精度": "float32", "合成缓存(MB)": 64}
+    options.update(kwargs)
+    return preview_document.PreviewDocumentNode().preview_document(文档=document, **options)[0]
+
+
+def test_preview_chain_under_inference_mode():
+    """ComfyUI在 torch.inference_mode() 中执行节点，开启合成缓存时不能读取张量的版本计数"""
+    preview_document.composite_cache.clear()
+    with torch.inference_mode():
+        document = _build_document()
+        cached = _preview(document)
+        cached_again = _preview(document)
+        uncached = _preview(document, **{"合成缓存(MB)": 0})
+    assert cached.shape == (1, 48, 64, 3)
+    assert torch.equal(cached, cached_again)
+    assert torch.allclose(cached, uncached, atol=1e-6)
+
+
+def test_fingerprint_cached_for_inference_tensor():
+    with torch.inference_mode():
+        image = torch.rand(1, 8, 8, 4)
+    assert image.is_inference()
+    fingerprint = composite_cache_module.image_fingerprint(image)
+    assert composite_cache_module.image_fingerprint(image) == fingerprint
+    with torch.inference_mode():
+        other = image.clone()
+        other[0, 0, 0, 0] += 1.0
+    assert composite_cache_module.image_fingerprint(other) != fingerprint
+
+
+def test_fingerprint_keys_on_object_identity():
+    image = torch.rand(1, 8, 8, 4)
+    fingerprint = composite_cache_module.image_fingerprint(image)
+    # 默认不读取像素：内容相同的另一个张量得到不同的指纹
+    assert composite_cache_module.image_fingerprint(image.clone()) != fingerprint
+    # 原地修改后版本变化
+    image[0, 0, 0, 0] += 1.0
+    modified = composite_cache_module.image_fingerprint(image)
+    assert modified != fingerprint
+    assert composite_cache_module.image_fingerprint(image) == modified
+    # 对象释放后id可能被复用，新对象不会沿用旧的指纹
+    del image
+    assert composite_cache_module.image_fingerprint(torch.rand(1, 8, 8, 4)) not in (fingerprint, modified)
+
+
+def test_fingerprint_hashes_contents_when_enabled(monkeypatch):
+    monkeypatch.setattr(composite_cache_module, "HASH_CONTENTS", True)
+    image = torch.rand(1, 8, 8, 4)
+    assert composite_cache_module.image_fingerprint(image.clone()) == composite_cache_module.image_fingerprint(image)
+    other = image.clone()
+    other[0, 0, 0, 0] += 1.0
+    assert composite_cache_module.image_fingerprint(other) != composite_cache_module.image_fingerprint(image)
+
+
+def test_cache_is_off_by_default():
+    node = preview_document.PreviewDocumentNode()
+    assert node.INPUT_TYPES()["optional"]["合成缓存(MB)"][1]["default"] == 0
+    cache = preview_document.composite_cache
+    _preview(_build_document())
+    assert cache.current_bytes > 0
+    # 关闭缓存时释放已缓存的快照
+    _preview(_build_document(), **{"合成缓存(MB)": 0})
+    assert cache.current_bytes == 0
+    node.preview_document(文档=_build_document(), 合成精度="float32")
+    assert cache.current_bytes == 0
+
+
+def test_cache_hit_and_miss_under_inference_mode():
+    # 预览文档节点按路径加载自己的合成缓存模块
+    cache = preview_document.composite_cache
+    cache.clear()
+    with torch.inference_mode():
+        document = _build_document()
+        _preview(document)
+        layers = sorted(document["layers"], key=lambda layer: layer["layer_id"])
+        # 输入不变：最终结果直接命中
+        start = _lookup_start(cache, layers)
+        assert start == len(layers)
+
+        # 修改最上层：下方图层的前缀仍然命中，最终结果不命中
+        layers[-1] = dict(layers[-1], opacity=0.25)
+        assert _lookup_start(cache, layers) < len(layers)
+
+
+def _lookup_start(cache, layers):
+    """按预览文档节点默认设置（float32、numpy、单线程合成）查找最长的已缓存前缀"""
+    compositor = preview_document.LayerCompositor(64, 48, dtype=np.dtype("float32"), backend="numpy")
+    context = (compositor.canvas_size, str(compositor.dtype), compositor.backend, compositor.premultiplied)
+    start, _ = cache.lookup(cache.prefix_keys(layers, context))
+    return start
+
+
+def test_stable_prefix_tracked_per_document():
+    """两个文档交替预览时，各自记录上一次渲染的键"""
+    cache = composite_cache_module.CompositeCache()
+    context = ("canvas",)
+    layers_a = [{"layer_id": 1, "opacity": 1.0}, {"layer_id": 2, "opacity": 1.0}]
+    layers_b = [{"layer_id": 1, "opacity": 0.5}]
+    keys_a = cache.prefix_keys(layers_a, context)
+    keys_b = cache.prefix_keys(layers_b, context)
+    cache.stable_prefix(keys_a, "doc-a")
+    cache.stable_prefix(keys_b, "doc-b")
+    # 文档A未修改：没有被修改的图层，返回最后一个前缀之前的位置
+    assert cache.stable_prefix(keys_a, "doc-a") == len(layers_a)
+    edited = [layers_a[0], dict(layers_a[1], opacity=0.5)]
+    assert cache.stable_prefix(cache.prefix_keys(edited, context), "doc-a") == 1
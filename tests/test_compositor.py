@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import load_animation_module
+
+compositor = load_animation_module("compositor", "LayerUtils", "compositor.py")
+BlendModes = compositor.BlendModes
+
+MODES = ["normal", "multiply", "screen", "overlay", "soft_light", "color_dodge", "difference"]
+
+
+def _layers(seed=0, uint8=False):
+    """不同混合模式、部分超出画布、半透明的图层；uint8为True时使用uint8存储"""
+    rng = np.random.default_rng(seed)
+    layers = []
+    for index, mode in enumerate(MODES):
+        height, width = 20 + index * 3, 26 + index * 2
+        pixels = rng.random((height, width, 4), dtype=np.float32)
+        if uint8:
+            image = torch.from_numpy((pixels * 255).round().astype(np.uint8))
+        else:
+            image = torch.from_numpy(pixels)
+        layers.append({
+            "layer_id": index + 1, "name": f"图层{index}", "image_data": image[None],
+            "position": [index * 7 - 6, index * 5 - 4], "anchor": [0.0, 0.0],
+            "opacity": 1.0 if index % 2 else 0.65, "blend_mode": mode, "visible": True,
+        })
+    return layers
+
+
+def _render(compositor_class, layers, **kwargs):
+    instance = compositor_class(64, 48, **kwargs)
+    instance.composite_layers(layers)
+    return instance.to_image_tensor()
+
+
+@pytest.mark.parametrize("premultiplied", [True, False])
+@pytest.mark.parametrize("uint8", [False, True])
+def test_torch_backend_matches_numpy(premultiplied, uint8):
+    layers = _layers(uint8=uint8)
+    expected = _render(compositor.LayerCompositor, layers, backend="numpy", premultiplied=premultiplied)
+    actual = _render(compositor.LayerCompositor, layers, backend="torch", premultiplied=premultiplied)
+    assert isinstance(actual, torch.Tensor) and actual.shape == (1, 48, 64, 3)
+    torch.testing.assert_close(actual, expected, atol=1e-5, rtol=0)
+
+
+def test_torch_backend_float16_buffer_matches_numpy():
+    layers = _layers()
+    expected = _render(compositor.LayerCompositor, layers, dtype=np.float16, backend="numpy")
+    actual = _render(compositor.LayerCompositor, layers, dtype=np.float16, backend="torch")
+    torch.testing.assert_close(actual, expected, atol=2e-3, rtol=0)
+
+
+def test_default_backend_can_be_switched():
+    rng = np.random.default_rng(3)
+    base = rng.random((5, 6, 4), dtype=np.float32)
+    overlay = rng.random((5, 6, 4), dtype=np.float32)
+    expected = BlendModes.apply_blend_mode(base, overlay, "multiply", 0.5, backend="numpy")
+    previous = BlendModes.backend
+    try:
+        BlendModes.set_backend("torch")
+        actual = BlendModes.apply_blend_mode(base, overlay, "multiply", 0.5)
+    finally:
+        BlendModes.set_backend(previous)
+    np.testing.assert_allclose(np.asarray(actual), expected, atol=1e-6)
+    with pytest.raises(ValueError):
+        BlendModes.set_backend("cuda")
+
+
+def _frame_layers(layers, transform):
+    return [dict(layer, **transform.get(str(layer["layer_id"]), {})) for layer in layers]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+def test_frame_batch_matches_single_frame_renders(backend):
+    layers = _layers(seed=5)[:4]
+    frames = [
+        {"1": {"position": [0, 0]}, "3": {"opacity": 0.3}},
+        {"1": {"position": [10, 4]}, "2": {"visible": False}},
+        # 与第1帧相同位置、不连续的帧合并为同一批次
+        {"1": {"position": [0, 0]}, "3": {"opacity": 0.0}},
+        {"4": {"position": [200, 200]}},
+    ]
+    batch = compositor.FrameBatchCompositor(64, 48, len(frames), backend=backend)
+    for layer in layers:
+        batch.composite_layer(layer, [frame.get(str(layer["layer_id"])) for frame in frames])
+    result = batch.to_image_tensor()
+    assert result.shape == (len(frames), 48, 64, 3)
+    for index, frame in enumerate(frames):
+        expected = _render(compositor.LayerCompositor, _frame_layers(layers, frame), backend=backend)
+        torch.testing.assert_close(result[index:index + 1], expected, atol=1e-5, rtol=0)
+
+
+@pytest.mark.parametrize("premultiplied", [True, False])
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+def test_tiled_compositor_matches_serial(premultiplied, backend):
+    """块边界穿过图层内部，多线程分块合成与逐图层合成逐像素一致"""
+    layers = _layers(seed=7)
+    expected = _render(compositor.LayerCompositor, layers, backend=backend, premultiplied=premultiplied)
+    actual = _render(compositor.TiledLayerCompositor, layers, backend=backend, premultiplied=premultiplied,
+                     tile_size=16, workers=4)
+    assert torch.equal(actual, expected)
+
+
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+@pytest.mark.parametrize("uint8", [False, True])
+def test_premultiplied_compositor_matches_straight(backend, uint8):
+    layers = _layers(seed=9, uint8=uint8)
+    # 完全透明的像素和不透明度为0的图层在预乘表示下颜色丢失，不能影响结果
+    layers[2]["image_data"][0, :5, :, 3] = 0
+    layers[4] = dict(layers[4], opacity=0.0)
+    straight = _render(compositor.LayerCompositor, layers, backend=backend, premultiplied=False)
+    premultiplied = _render(compositor.LayerCompositor, layers, backend=backend, premultiplied=True)
+    torch.testing.assert_close(premultiplied, straight, atol=1e-5, rtol=0)
@@ -0,0 +1,146 @@
+import torch
+
+from conftest import load_animation_module
+
+document_model = load_animation_module("document_model", "LayerEdit", "document_model.py")
+create_blank_document = load_animation_module("Create_blank_document", "LayerEdit", "Create_blank_document.py")
+create_layer = load_animation_module("Create_layer", "LayerEdit", "Create_layer.py")
+add_layer_to_document = load_animation_module("Add_layer_to_document", "LayerEdit", "Add_layer_to_document.py")
+delete_layer = load_animation_module("Delete_layer", "LayerEdit", "Delete_layer.py")
+update_layer = load_animation_module("Update_layer", "LayerEdit", "Update_layer.py")
+get_layer_from_document = load_animation_module("Get_layer_from_document", "LayerEdit", "Get_layer_from_document.py")
+
+
+def _add(document, image, target_layer_id=-1, **kwargs):
+    layer = create_layer.CreateLayerNode().create_layer(图像=image, 名称="图层", **kwargs)[0]
+    return add_layer_to_document.AddLayerToDocumentNode().add_layer_to_document(
+        文档=document, 图层=layer, 目标图层ID=target_layer_id
+    )[0]
+
+
+def _document(count=3):
+    document = create_blank_document.CreateBlankDocumentNode().create_blank_document(宽度=32, 高度=32)[0]
+    for index in range(count):
+        document = _add(document, torch.full((1, 8, 8, 4), index / 4.0), X坐标=index)
+    return document
+
+
+def _snapshot(document):
+    """文档中所有可变容器的内容，用于检查输入是否被修改"""
+    return repr([(key, value) for key, value in document.items() if key not in ("layers", "layer_index")]), [
+        (repr({key: value for key, value in layer.items() if key != "image_data"}), layer["image_data"].clone())
+        for layer in document["layers"]
+    ]
+
+
+def _assert_unchanged(document, snapshot):
+    meta, layers = _snapshot(document)
+    assert meta == snapshot[0]
+    assert [layer[0] for layer in layers] == [layer[0] for layer in snapshot[1]]
+    for (_, pixels), (_, expected) in zip(layers, snapshot[1]):
+        assert torch.equal(pixels, expected)
+
+
+def test_add_layer_shares_existing_layers():
+    document = _document()
+    snapshot = _snapshot(document)
+    updated = _add(document, torch.ones(1, 4, 4, 4))
+    _assert_unchanged(document, snapshot)
+    assert len(updated["layers"]) == len(document["layers"]) + 1
+    # 未修改的图层字典和像素张量在新旧文档之间共享
+    assert all(new is old for new, old in zip(updated["layers"], document["layers"]))
+    assert updated["layers"] is not document["layers"]
+
+
+def test_delete_layer_leaves_input_document_intact():
+    document = _document()
+    snapshot = _snapshot(document)
+    removed_id = document["layers"][1]["layer_id"]
+    updated = delete_layer.DeleteLayerNode().delete_layer(文档=document, 图层ID=removed_id)[0]
+    _assert_unchanged(document, snapshot)
+    assert [layer["layer_id"] for layer in updated["layers"]] == [
+        layer["layer_id"] for layer in document["layers"] if layer["layer_id"] != removed_id
+    ]
+    assert updated["layers"][0] is document["layers"][0]
+
+
+def test_update_layer_copies_layer_but_shares_pixels():
+    document = _document(1)
+    layer = document["layers"][0]
+    snapshot = _snapshot(document)
+    updated = update_layer.UpdateLayerNode().update_layer(图层=layer, 新X坐标=5, 新Y坐标=6, 新不透明度=0.5)[0]
+    _assert_unchanged(document, snapshot)
+    assert updated is not layer and updated["position"] == [5, 6] and updated["opacity"] == 0.5
+    assert updated["image_data"] is layer["image_data"]
+    assert updated["metadata"] is not layer["metadata"]
+
+    # 替换像素时不修改原图层的张量
+    replaced = update_layer.UpdateLayerNode().update_layer(图层=layer, 新图像=torch.zeros(1, 8, 8, 4))[0]
+    _assert_unchanged(document, snapshot)
+    assert replaced["image_data"] is not layer["image_data"]
+
+
+def test_copy_layer_copies_containers():
+    layer = {"layer_id": 1, "position": [1, 2], "metadata": {"tags": ["a"]}, "image_data": torch.zeros(1, 2, 2, 4)}
+    copied = document_model.copy_layer(layer)
+    copied["position"][0] = 9
+    copied["metadata"]["tags"].append("b")
+    assert layer["position"] == [1, 2] and layer["metadata"] == {"tags": ["a"]}
+    assert copied["image_data"] is layer["image_data"]
+
+
+def _layer(layer_id, name=None):
+    return {"layer_id": layer_id, "name": name or f"图层{layer_id}", "image_data": torch.zeros(1, 2, 2, 4)}
+
+
+def _get(document, layer_id):
+    return get_layer_from_document.GetLayerFromDocumentNode().get_layer_from_document(document, layer_id)[0]
+
+
+def test_add_delete_get_with_explicit_ids():
+    document = _document(0)
+    document = _add(document, torch.zeros(1, 4, 4, 4), target_layer_id=5)
+    document = _add(document, torch.zeros(1, 4, 4, 4), target_layer_id=5)
+    document = _add(document, torch.zeros(1, 4, 4, 4))
+    # 第二次指定的ID已被占用，改用最小的空闲ID
+    assert [layer["layer_id"] for layer in document["layers"]] == [5, 0, 1]
+    assert _get(document, 5) is document["layers"][0]
+
+    document = delete_layer.DeleteLayerNode().delete_layer(文档=document, 图层ID=0)[0]
+    assert _get(document, 0) is None and _get(document, 1) is document["layers"][1]
+    # 删除后空出的ID被重新分配
+    document = _add(document, torch.zeros(1, 4, 4, 4))
+    assert document["layers"][-1]["layer_id"] == 0 and _get(document, 0) is document["layers"][-1]
+
+
+def test_duplicate_ids_resolve_to_first_layer():
+    document = document_model.index_document({"canvas_size": [8, 8]}, [_layer(1, "a"), _layer(1, "b"), _layer(2)])
+    assert document_model.get_layer(document, 1)["name"] == "a"
+    assert document_model.get_next_layer_id(document) == 0
+    updated, removed = document_model.remove_layer(document, 1)
+    assert removed == 2 and [layer["layer_id"] for layer in updated["layers"]] == [2]
+    assert document_model.get_layer(updated, 1) is None
+    assert [layer["layer_id"] for layer in document["layers"]] == [1, 1, 2]
+
+
+def test_legacy_document_without_index():
+    document = {"canvas_size": [8, 8], "layers": [_layer(0), _layer(1), _layer(3)]}
+    assert _get(document, 3) is document["layers"][2]
+    updated, layer, assigned_id = document_model.add_layer(document, _layer(9))
+    assert assigned_id == 2 and "layer_index" not in document
+    assert document_model.get_layer(updated, 2) is layer
+    assert document_model.add_layer(updated, _layer(9))[2] == 4
+
+
+def test_stale_index_is_rebuilt():
+    document = document_model.index_document({"canvas_size": [8, 8]}, [_layer(0), _layer(1)])
+    # 其他代码替换了图层列表，长度相同但图层不同
+    document = dict(document, layers=[_layer(0, "新0"), _layer(1, "新1")])
+    assert document_model.get_layer(document, 1)["name"] == "新1"
+    assert document_model.add_layer(document, _layer(9))[2] == 2
+
+    # 原地修改了图层列表
+    document = document_model.index_document({"canvas_size": [8, 8]}, [_layer(0)])
+    document["layers"].append(_layer(1))
+    assert document_model.get_layer(document, 1) is document["layers"][1]
+    assert document_model.get_next_layer_id(document) == 2
@@ -0,0 +1,85 @@
+import json
+
+from conftest import load_feishu_module
+
+feishu_client = load_feishu_module("feishu_client.py")
+feishu_auth = load_feishu_module("feishu_auth.py")
+feishu_read_range = load_feishu_module("feishu_read_range.py")
+
+CONFIG = json.dumps({"app_id": "cli_test", "app_secret": "secret", "sheet_id": "s1", "spreadsheet_token": "sht"})
+TOKEN_PATH = "/open-apis/auth/v3/tenant_access_token/internal"
+
+
+def _serve_tokens(server, revoked=()):
+    """令牌接口依次发放 t1、t2 ...；revoked 中的令牌访问表格接口时返回令牌无效"""
+    issued = []
+
+    def token(request):
+        issued.append(f"t{len(issued) + 1}")
+        return 200, {"code": 0, "tenant_access_token": issued[-1], "expire": 7200}
+
+    def values(request):
+        if request["headers"]["Authorization"][len("Bearer "):] in revoked:
+            return 400, {"code": 99991663, "msg": "Invalid access token for authorization"}
+        return 200, {"code": 0, "data": {"valueRange": {"range": "s1!A1:B1", "values": [["a", "b"]]}}}
+
+    server.routes[("POST", TOKEN_PATH)] = token
+    server.routes[("GET", "/open-apis/sheets/v2/spreadsheets/sht/values/")] = values
+    return issued
+
+
+def _read_range():
+    return feishu_read_range.FeishuReadRangeNode().read_range(CONFIG, "A1:B1", False)
+
+
+def test_revoked_token_is_refreshed_and_request_retried_once(feishu_server):
+    issued = _serve_tokens(feishu_server, revoked={"t1"})
+    range_data, row_count = _read_range()
+    assert row_count == 1, range_data
+    assert json.loads(range_data)["values"] == [["a", "b"]]
+    assert issued == ["t1", "t2"]
+    authorizations = [request["headers"]["Authorization"] for request in feishu_server.requests
+                      if "/values/" in request["path"]]
+    assert authorizations == ["Bearer t1", "Bearer t2"]
+
+    # 之后的执行直接使用刷新后的令牌
+    assert _read_range()[1] == 1
+    assert issued == ["t1", "t2"]
+
+
+def test_refresh_is_attempted_only_once(feishu_server):
+    issued = _serve_tokens(feishu_server, revoked={"t1", "t2"})
+    range_data, row_count = _read_range()
+    assert row_count == 0
+    assert "状态码: 400" in range_data
+    assert issued == ["t1", "t2"]
+    assert len(feishu_server.paths("/open-apis/sheets/")) == 2
+
+
+def test_stale_token_from_another_request_reuses_new_token(feishu_server):
+    issued = _serve_tokens(feishu_server)
+    assert feishu_auth.get_tenant_access_token("cli_test", "secret") == "t1"
+    assert feishu_auth.refresh_stale_token("t1") == "t2"
+    # 另一个请求仍带着旧令牌返回令牌无效时不再重复请求令牌接口
+    assert feishu_auth.refresh_stale_token("t1") == "t2"
+    assert feishu_auth.refresh_stale_token("unknown") is None
+    assert issued == ["t1", "t2"]
+
+
+def test_is_token_error():
+    class Response:
+        def __init__(self, status_code, payload=None):
+            self.status_code = status_code
+            self.payload = payload
+
+        def json(self):
+            if self.payload is None:
+                raise ValueError("not json")
+            return self.payload
+
+    assert feishu_client.is_token_error(Response(401))
+    assert feishu_client.is_token_error(Response(400, {"code": 99991663}))
+    assert feishu_client.is_token_error(Response(400, {"code": 99991677}))
+    assert not feishu_client.is_token_error(Response(400, {"code": 90202}))
+    assert not feishu_client.is_token_error(Response(500))
+    assert not feishu_client.is_token_error(Response(200, {"code": 99991663}))
@@ -0,0 +1,129 @@
+import socket
+import struct
+import threading
+import types
+
+import pytest
+import requests
+
+from conftest import load_feishu_module
+
+feishu_client = load_feishu_module("feishu_client.py")
+
+
+class ResettingServer:
+    """读完整个请求（请求头和请求体）后重置连接的服务器，前 resets 个连接之后正常返回200"""
+
+    def __init__(self, resets):
+        self.resets = resets
+        self.connections = 0
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(8)
+        self.url = f"http://127.0.0.1:{self.socket.getsockname()[1]}/open-apis/test"
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            with connection:
+                self._read_request(connection)
+                self.connections += 1
+                if self.connections <= self.resets:
+                    # SO_LINGER为0时close()发送RST
+                    connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    continue
+                body = b'{"code": 0}'
+                connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                                   b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+
+    @staticmethod
+    def _read_request(connection):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            data += connection.recv(65536)
+        head, body = data.split(b"\r\n\r\n", 1)
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        while len(body) < length:
+            body += connection.recv(65536)
+
+    def close(self):
+        self.socket.close()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """记录重试前的等待时间而不真正等待"""
+    delays = []
+    monkeypatch.setattr(feishu_client, "time", types.SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def test_post_not_retried_after_request_was_read(no_sleep):
+    server = ResettingServer(resets=1)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            feishu_client.post(server.url, json={"image": "x" * 1000})
+        # 服务端已经收到完整的请求，重试可能重复上传
+        assert server.connections == 1
+        assert no_sleep == []
+    finally:
+        server.close()
+
+
+def test_get_retried_after_connection_reset(no_sleep):
+    server = ResettingServer(resets=1)
+    try:
+        response = feishu_client.get(server.url)
+        assert response.status_code == 200 and response.json() == {"code": 0}
+        assert server.connections == 2
+        assert len(no_sleep) == 1
+    finally:
+        server.close()
+
+
+def test_post_retried_when_connection_refused(no_sleep):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    with pytest.raises(requests.ConnectionError):
+        feishu_client.post(f"http://127.0.0.1:{port}/open-apis/test", json={}, max_retries=2)
+    # 连接被拒绝时请求还没有发出，非幂等请求也会重试
+    assert len(no_sleep) == 2
+
+
+def test_rate_limit_waits_for_retry_after(feishu_server, no_sleep):
+    responses = iter([
+        (429, {"code": 99991400}, {"Retry-After": "1.5"}),
+        (429, {"code": 99991400}, {"x-ogw-ratelimit-reset": "120"}),
+        (429, {"code": 99991400}),
+        (200, {"code": 0}),
+    ])
+    feishu_server.routes[("POST", "/open-apis/test")] = lambda request: next(responses)
+    response = feishu_client.post("/test", json={})
+    assert response.status_code == 200
+    # 429时POST同样重试；等待时间优先取响应头，超过上限时截断，没有响应头时指数退避
+    assert no_sleep == [1.5, feishu_client.BACKOFF_MAX, feishu_client.BACKOFF_BASE * 4]
+    assert len(feishu_server.paths("/open-apis/test")) == 4
+
+
+def test_server_error_retried_only_for_idempotent_requests(feishu_server, no_sleep):
+    feishu_server.routes[("POST", "/open-apis/test")] = lambda request: (500, {"code": -1})
+    feishu_server.routes[("GET", "/open-apis/test")] = lambda request: (503, {"code": -1})
+    assert feishu_client.post("/test", json={}).status_code == 500
+    assert len(feishu_server.paths("/open-apis/test")) == 1
+    assert no_sleep == []
+
+    assert feishu_client.get("/test", max_retries=2).status_code == 503
+    assert len(feishu_server.paths("/open-apis/test")) == 4
+    # 调用方可以声明POST请求是幂等的
+    assert feishu_client.post("/test", json={}, idempotent=True, max_retries=1).status_code == 500
+    assert len(feishu_server.paths("/open-apis/test")) == 6
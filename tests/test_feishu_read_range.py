@@ -0,0 +1,27 @@
+import json
+
+from conftest import load_feishu_module
+
+feishu_read_range = load_feishu_module("feishu_read_range.py")
+
+
+def test_is_changed_reuses_result_within_ttl(monkeypatch):
+    node = feishu_read_range.FeishuReadRangeNode
+    ttl = feishu_read_range.RANGE_CACHE_TTL
+    monkeypatch.setattr(feishu_read_range.time, "time", lambda: 10 * ttl + 1.0)
+    first = node.IS_CHANGED(feishu_config="{}", cell_range="A1:F500", force_refresh=False)
+    monkeypatch.setattr(feishu_read_range.time, "time", lambda: 11 * ttl - 1.0)
+    assert node.IS_CHANGED(feishu_config="{}", cell_range="A1:F500", force_refresh=False) == first
+    # 超过复用时间后重新读取
+    monkeypatch.setattr(feishu_read_range.time, "time", lambda: 11 * ttl + 1.0)
+    assert node.IS_CHANGED(feishu_config="{}", cell_range="A1:F500", force_refresh=False) != first
+    assert node.IS_CHANGED(feishu_config="{}", cell_range="A1:F500", force_refresh=True) == 11 * ttl + 1.0
+
+
+def test_get_row_uses_sheet_row_numbers():
+    range_data = json.dumps({"range": "s1!B3:D4", "start_row": 3, "start_column": 2,
+                             "values": [["a", None, 1], [[{"text": "x"}, {"text": "y"}], "b"]]})
+    node = feishu_read_range.FeishuRangeRowNode()
+    assert node.get_row(range_data, 3, 4) == (json.dumps(["a", "", "1"]), "1")
+    assert node.get_row(range_data, 4, 2) == (json.dumps(["xy", "b"]), "xy")
+    assert node.get_row(range_data, 5, 2) == ("[]", "")
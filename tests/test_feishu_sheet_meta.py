@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from conftest import load_feishu_module
+
+feishu_sheet_meta = load_feishu_module("feishu_sheet_meta.py")
+feishu_read = load_feishu_module("feishu_read.py")
+feishu_write = load_feishu_module("feishu_write.py")
+
+TOKEN_PATH = "/open-apis/auth/v3/tenant_access_token/internal"
+META_PATH = "/open-apis/sheets/v2/spreadsheets/sht/metainfo"
+VALUES_PATH = "/open-apis/sheets/v2/spreadsheets/sht/values"
+CONFIG = json.dumps({"app_id": "cli_test", "app_secret": "secret",
+                     "sheet_url": "https://example.feishu.cn/sheets/sht", "sheet_id": "sht"})
+
+
+@pytest.fixture
+def sheets(feishu_server):
+    """本地服务器上的表格；sheet_ids 控制 metainfo 返回的工作表，values_status 控制读写接口的响应"""
+    feishu_sheet_meta.invalidate_sheet_metadata()
+    state = {"sheet_ids": ["s1"], "values_status": 200, "server": feishu_server}
+
+    def token(request):
+        return 200, {"code": 0, "tenant_access_token": "t1", "expire": 7200}
+
+    def metainfo(request):
+        sheets = [{"sheetId": sheet_id, "title": f"工作表{index}", "index": index, "rowCount": 10, "columnCount": 5}
+                  for index, sheet_id in enumerate(state["sheet_ids"])]
+        return 200, {"code": 0, "data": {"properties": {"title": "表格"}, "sheets": sheets}}
+
+    def values(request):
+        if state["values_status"] != 200:
+            # 工作表已被删除
+            return state["values_status"], {"code": 90215, "msg": "sheet not found"}
+        return 200, {"code": 0, "data": {"valueRange": {"values": [["x"]]}}}
+
+    feishu_server.routes[("POST", TOKEN_PATH)] = token
+    feishu_server.routes[("GET", META_PATH)] = metainfo
+    feishu_server.routes[("GET", VALUES_PATH)] = values
+    feishu_server.routes[("PUT", VALUES_PATH)] = values
+    yield state
+    feishu_sheet_meta.invalidate_sheet_metadata()
+
+
+def _metainfo_requests(state):
+    return len(state["server"].paths(META_PATH))
+
+
+def test_metadata_cached_until_ttl_expires(sheets, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(feishu_sheet_meta.time, "time", lambda: now[0])
+    assert feishu_sheet_meta.get_first_sheet_id("t1", "sht") == "s1"
+    now[0] += feishu_sheet_meta.SHEET_META_TTL - 1
+    assert feishu_sheet_meta.get_first_sheet_id("t1", "sht") == "s1"
+    assert _metainfo_requests(sheets) == 1
+
+    # 过期后重新请求，得到新的工作表列表
+    sheets["sheet_ids"] = ["s2"]
+    now[0] += 2
+    assert feishu_sheet_meta.get_first_sheet_id("t1", "sht") == "s2"
+    assert _metainfo_requests(sheets) == 2
+    assert feishu_sheet_meta.find_sheet("t1", "sht", "工作表0")["sheet_id"] == "s2"
+    assert _metainfo_requests(sheets) == 2
+
+
+def test_failed_metadata_request_is_not_cached(sheets):
+    sheets["server"].routes[("GET", META_PATH)] = lambda request: (403, {"code": 91403, "msg": "forbidden"})
+    assert feishu_sheet_meta.get_sheet_metadata("t1", "sht") is None
+    assert feishu_sheet_meta.get_sheet_metadata("t1", "sht") is None
+    assert _metainfo_requests(sheets) == 2
+
+
+def test_read_invalidates_metadata_on_non_200_response(sheets):
+    node = feishu_read.FeishuReadNode()
+    assert node.read_cell(CONFIG, 1, 1, False) == ("x",)
+    assert node.read_cell(CONFIG, 1, 1, False) == ("x",)
+    assert _metainfo_requests(sheets) == 1
+    assert sheets["server"].paths(VALUES_PATH)[-1].endswith("/values/s1!A1:A1")
+
+    # 工作表被删除：读取失败时使缓存失效，下一次读取重新获取工作表列表
+    sheets["values_status"] = 400
+    assert node.read_cell(CONFIG, 1, 1, False)[0].startswith("Error:")
+    sheets["values_status"] = 200
+    sheets["sheet_ids"] = ["s2"]
+    assert node.read_cell(CONFIG, 1, 1, False) == ("x",)
+    assert _metainfo_requests(sheets) == 2
+    assert sheets["server"].paths(VALUES_PATH)[-1].endswith("/values/s2!A1:A1")
+
+
+def test_write_invalidates_metadata_on_non_200_response(sheets):
+    node = feishu_write.FeishuWriteNode()
+    assert not node.write_cell(CONFIG, 1, 1, "v")[0].startswith("Error:")
+    sheets["values_status"] = 400
+    assert node.write_cell(CONFIG, 1, 1, "v")[0].startswith("Error:")
+    assert _metainfo_requests(sheets) == 1
+    sheets["values_status"] = 200
+    assert not node.write_cell(CONFIG, 1, 1, "v")[0].startswith("Error:")
+    assert _metainfo_requests(sheets) == 2
+
+
+def test_read_with_sheet_in_url_keeps_cached_metadata(sheets):
+    feishu_sheet_meta.get_sheet_metadata("t1", "sht")
+    sheets["values_status"] = 400
+    config = json.dumps(dict(json.loads(CONFIG), sheet_url="https://example.feishu.cn/sheets/sht?sheet=s1"))
+    assert feishu_read.FeishuReadNode().read_cell(config, 1, 1, False)[0].startswith("Error:")
+    # 工作表来自URL而不是缓存，失败时不使缓存失效
+    feishu_sheet_meta.get_sheet_metadata("t1", "sht")
+    assert _metainfo_requests(sheets) == 1
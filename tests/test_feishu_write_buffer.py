@@ -0,0 +1,159 @@
+import time
+
+import pytest
+
+from conftest import load_feishu_module
+
+feishu_write_buffer = load_feishu_module("feishu_write_buffer.py")
+
+TOKEN_PATH = "/open-apis/auth/v3/tenant_access_token/internal"
+UPDATE_PATH = "/open-apis/sheets/v2/spreadsheets/sht/values_batch_update"
+
+
+@pytest.fixture
+def buffer(feishu_server, monkeypatch):
+    """本地服务器上的写入队列；written 记录服务器接受的范围，status 控制批量写入接口的响应"""
+    monkeypatch.setattr(feishu_write_buffer, "FLUSH_INTERVAL", 0.05)
+    state = {"written": [], "status": 200}
+
+    def token(request):
+        return 200, {"code": 0, "tenant_access_token": "t1", "expire": 7200}
+
+    def update(request):
+        value_ranges = request["json"]["valueRanges"]
+        if state["status"] != 200:
+            return state["status"], {"code": -1, "msg": "server error"}
+        # 写入工作表 bad 的范围时整批失败
+        if any(value_range["range"].startswith("bad!") for value_range in value_ranges):
+            return 400, {"code": 90202, "msg": "wrong range"}
+        state["written"].extend((value_range["range"], value_range["values"]) for value_range in value_ranges)
+        return 200, {"code": 0, "data": {}}
+
+    feishu_server.routes[("POST", TOKEN_PATH)] = token
+    feishu_server.routes[("POST", UPDATE_PATH)] = update
+    state["server"] = feishu_server
+    yield state
+    with feishu_write_buffer._lock:
+        for queue in feishu_write_buffer._queues.values():
+            if queue["timer"] is not None:
+                queue["timer"].cancel()
+        feishu_write_buffer._queues.clear()
+
+
+def _add(writes):
+    return feishu_write_buffer.add_writes("cli_test", "secret", "sht", writes)
+
+
+def _queue():
+    return feishu_write_buffer._queues["sht"]
+
+
+def test_coalesce_cells_merges_rectangles():
+    cells = {("s1", row, column): f"{row},{column}" for row in (1, 2) for column in (1, 2, 3)}
+    # 第3行列范围不同，另起一个矩形；第5列与前面不连续
+    cells.update({("s1", 3, 1): "3,1", ("s1", 1, 5): "1,5", ("s2", 1, 1): "x"})
+    assert sorted(feishu_write_buffer.coalesce_cells(cells)) == [
+        ("s1", 1, 1, 2, 3, [["1,1", "1,2", "1,3"], ["2,1", "2,2", "2,3"]]),
+        ("s1", 1, 5, 1, 5, [["1,5"]]),
+        ("s1", 3, 1, 3, 1, [["3,1"]]),
+        ("s2", 1, 1, 1, 1, [["x"]]),
+    ]
+
+
+def test_coalesce_cells_splits_at_range_limits(monkeypatch):
+    monkeypatch.setattr(feishu_write_buffer, "MAX_RANGE_COLUMNS", 2)
+    monkeypatch.setattr(feishu_write_buffer, "MAX_RANGE_ROWS", 2)
+    cells = {("s1", row, column): (row, column) for row in range(1, 4) for column in range(1, 4)}
+    rects = feishu_write_buffer.coalesce_cells(cells)
+    assert sorted(rect[:5] for rect in rects) == [
+        ("s1", 1, 1, 2, 2), ("s1", 1, 3, 2, 3), ("s1", 3, 1, 3, 2), ("s1", 3, 3, 3, 3),
+    ]
+    assert sum(len(row) for rect in rects for row in rect[5]) == len(cells)
+
+
+def test_flush_sends_last_value_of_each_cell(buffer):
+    _add([("s1", 1, 1, "old"), ("s1", 1, 2, "b")])
+    _add([("s1", 1, 1, "new")])
+    assert feishu_write_buffer.flush("sht") == "成功提交 2 个单元格（1 个范围）"
+    assert buffer["written"] == [("s1!A1:B1", [["new", "b"]])]
+    assert feishu_write_buffer.pending_count("sht") == 0
+
+
+def test_permanent_error_drops_only_the_bad_range(buffer):
+    _add([("s1", 1, 1, "a"), ("s1", 1, 2, "b"), ("bad", 1, 1, "x"), ("s2", 3, 3, "c")])
+    result = feishu_write_buffer.flush("sht")
+    assert result.startswith("Error:")
+    assert "bad!A1:A1" in result and "放弃 1 个单元格" in result
+    # 整批失败后逐个范围重新提交，其余范围照常写入
+    assert sorted(buffer["written"]) == [("s1!A1:B1", [["a", "b"]]), ("s2!C3:C3", [["c"]])]
+    assert feishu_write_buffer.pending_count("sht") == 0
+    assert _queue()["timer"] is None and _queue()["failures"] == 0
+
+
+def test_permanent_error_in_one_batch_does_not_block_later_batches(buffer, monkeypatch):
+    monkeypatch.setattr(feishu_write_buffer, "MAX_CELLS_PER_REQUEST", 1)
+    _add([("bad", 1, 1, "x"), ("s1", 1, 1, "a"), ("s1", 5, 5, "b")])
+    result = feishu_write_buffer.flush("sht")
+    assert "已写入 2 个单元格" in result and "放弃 1 个单元格" in result
+    assert sorted(buffer["written"]) == [("s1!A1:A1", [["a"]]), ("s1!E5:E5", [["b"]])]
+    assert feishu_write_buffer.pending_count("sht") == 0
+
+
+def test_server_error_requeues_and_rearms_timer(buffer):
+    buffer["status"] = 500
+    _add([("s1", 1, 1, "a"), ("s1", 2, 1, "b")])
+    result = feishu_write_buffer.flush("sht")
+    assert result.startswith("Error:") and "2 个单元格留在队列中等待重试" in result
+    assert feishu_write_buffer.pending_count("sht") == 2
+    assert _queue()["timer"] is not None and _queue()["failures"] == 1
+
+    # 定时器在服务恢复后重新提交
+    buffer["status"] = 200
+    deadline = time.time() + 5
+    while feishu_write_buffer.pending_count("sht") and time.time() < deadline:
+        time.sleep(0.02)
+    # 提交开始时单元格就已移出队列，等待正在进行的提交完成后再检查结果
+    with feishu_write_buffer._flush_locks["sht"]:
+        assert feishu_write_buffer.pending_count("sht") == 0
+        assert buffer["written"] == [("s1!A1:A2", [["a"], ["b"]])]
+        assert _queue()["failures"] == 0
+
+
+def test_rate_limit_requeues_remaining_batches(buffer, monkeypatch):
+    monkeypatch.setattr(feishu_write_buffer, "FLUSH_INTERVAL", 60)
+    monkeypatch.setattr(feishu_write_buffer, "MAX_CELLS_PER_REQUEST", 1)
+    update = buffer["server"].routes[("POST", UPDATE_PATH)]
+
+    def limited(request):
+        # 第二批一直被限流（客户端的退避重试用尽）
+        if request["json"]["valueRanges"][0]["range"] == "s1!A3:A3":
+            return 429, {"code": 99991400, "msg": "request trigger frequency limit"}
+        return update(request)
+
+    buffer["server"].routes[("POST", UPDATE_PATH)] = limited
+    _add([("s1", 1, 1, "a"), ("s1", 3, 1, "b"), ("s1", 5, 1, "c")])
+    result = feishu_write_buffer.flush("sht")
+    assert "已写入 1 个单元格" in result and "2 个单元格留在队列中" in result
+    assert buffer["written"] == [("s1!A1:A1", [["a"]])]
+    assert set(_queue()["cells"]) == {("s1", 3, 1), ("s1", 5, 1)}
+
+
+def test_rate_limit_code_with_http_400_is_transient(buffer, monkeypatch):
+    monkeypatch.setattr(feishu_write_buffer, "FLUSH_INTERVAL", 60)
+    buffer["server"].routes[("POST", UPDATE_PATH)] = lambda request: (
+        400, {"code": 99991400, "msg": "request trigger frequency limit"})
+    _add([("s1", 1, 1, "a")])
+    assert "1 个单元格留在队列中" in feishu_write_buffer.flush("sht")
+    assert feishu_write_buffer.pending_count("sht") == 1
+
+
+def test_transient_errors_give_up_after_max_attempts(buffer, monkeypatch):
+    monkeypatch.setattr(feishu_write_buffer, "MAX_FLUSH_ATTEMPTS", 2)
+    monkeypatch.setattr(feishu_write_buffer, "FLUSH_INTERVAL", 60)
+    buffer["status"] = 503
+    _add([("s1", 1, 1, "a")])
+    assert "留在队列中" in feishu_write_buffer.flush("sht")
+    result = feishu_write_buffer.flush("sht")
+    assert "连续 2 次提交失败" in result and "放弃 1 个单元格" in result
+    assert feishu_write_buffer.pending_count("sht") == 0
+    assert _queue()["failures"] == 0
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import REPO_DIR, load_module
+
+image_convert = load_module("afa_image_convert", REPO_DIR, "core", "image_convert.py")
+
+
+def test_to_uint8_array_value_ranges():
+    values = torch.arange(256, dtype=torch.float32).div(255.0).reshape(1, 16, 16, 1)
+    # 浮点像素四舍五入，与 pack_layer_pixels 一致
+    expected = np.arange(256, dtype=np.uint8).reshape(16, 16, 1)
+    np.testing.assert_array_equal(image_convert.to_uint8_array(values), expected)
+    np.testing.assert_array_equal(image_convert.to_uint8_array(values.numpy()), expected)
+    np.testing.assert_array_equal(image_convert.to_uint8_array(values * 255.0, value_range=255), expected)
+    # 超出范围的值被截断
+    np.testing.assert_array_equal(image_convert.to_uint8_array(np.array([[[-0.5, 1.5]]])), [[[0, 255]]])
+    uint8 = torch.from_numpy(expected)
+    assert image_convert.to_uint8_array(uint8).dtype == np.uint8
+    np.testing.assert_array_equal(image_convert.to_uint8_array(uint8), expected)
+
+
+def test_layer_value_range_from_metadata():
+    layer = {"metadata": {"pixel_format": {"dtype": "float32", "value_range": 255}}}
+    assert image_convert.layer_value_range(layer) == 255
+    assert image_convert.layer_value_range({}) is None
+    rgba = image_convert.layer_to_rgba(layer, torch.full((2, 3, 3), 128.0))
+    assert rgba.shape == (2, 3, 4)
+    np.testing.assert_array_equal(rgba[0, 0], [128, 128, 128, 255])
+
+
+@pytest.mark.parametrize("shape,first_pixel", [
+    ((2, 3), [7, 7, 7, 255]),
+    ((2, 3, 1), [7, 7, 7, 255]),
+    ((2, 3, 3), [7, 8, 9, 255]),
+    ((3, 2, 3), [7, 8, 9, 255]),
+    ((2, 3, 4), [7, 8, 9, 10]),
+])
+def test_to_rgba_channel_layouts(shape, first_pixel):
+    array = np.zeros(shape, dtype=np.uint8)
+    if len(shape) == 2:
+        array[0, 0] = 7
+    elif shape[0] == 3 and shape[-1] not in (1, 3, 4):
+        array[:, 0, 0] = [7, 8, 9]
+    else:
+        array[0, 0] = [7, 8, 9, 10][:shape[-1]]
+    rgba = image_convert.to_rgba(array)
+    assert rgba.shape[-1] == 4
+    np.testing.assert_array_equal(rgba[0, 0], first_pixel)
+
+
+def test_tensor_to_pil_opacity_does_not_modify_input():
+    array = np.full((4, 5, 4), 200, dtype=np.uint8)
+    tensor = torch.from_numpy(array.copy())
+    for image in (array, tensor):
+        pil_image = image_convert.tensor_to_pil(image, opacity=0.5)
+        assert pil_image.mode == "RGBA"
+        np.testing.assert_array_equal(np.asarray(pil_image)[0, 0], [200, 200, 200, 100])
+    assert (array == 200).all() and (tensor == 200).all()
+
+
+def test_tensor_to_pil_modes():
+    assert image_convert.tensor_to_pil(torch.rand(1, 4, 5, 3)).mode == "RGB"
+    assert image_convert.tensor_to_pil(torch.rand(4, 5, 1)).mode == "L"
+    rgba = image_convert.tensor_to_pil(torch.ones(4, 5, 3), mode="RGBA")
+    np.testing.assert_array_equal(np.asarray(rgba)[0, 0], [255, 255, 255, 255])
+    # uint8与float32存储的同一图层转换结果相同
+    pixels = torch.randint(0, 256, (4, 5, 4), dtype=torch.uint8)
+    assert np.array_equal(np.asarray(image_convert.tensor_to_pil(pixels, opacity=0.3)),
+                          np.asarray(image_convert.tensor_to_pil(pixels.float() / 255.0, opacity=0.3)))
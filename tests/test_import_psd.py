@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import PixelLayer
+
+from conftest import load_animation_module
+
+import_psd = load_animation_module("import_psd", "LayerIO", "import_psd.py")
+
+
+def _write_psd(path, layers, size=(16, 12)):
+    """layers: [(RGBA颜色, 不透明度0~255)]，每个图层错开一个像素"""
+    psd = PSDImage.new("RGBA", size)
+    for index, (color, opacity) in enumerate(layers):
+        image = Image.new("RGBA", (8, 6), color)
+        layer = PixelLayer.frompil(image, psd, f"layer{index}", index, index)
+        psd.append(layer)
+        layer.opacity = opacity
+    psd.save(path)
+    return path
+
+
+def _import(path, **kwargs):
+    options = {"PSD文件": path, "导入缓存(MB)": 0}
+    options.update(kwargs)
+    return import_psd.ImportPSDNode().import_psd(**options)
+
+
+class _Abort(BaseException):
+    """绕过节点内逐图层的 except Exception，模拟处理过程中途失败"""
+
+
+def test_parallel_decode_joined_before_reader_closed(tmp_psd, monkeypatch):
+    _write_psd(tmp_psd, [((255, 0, 0, 255), 255)] * 6)
+    events = []
+    lock = threading.Lock()
+    open_reader = import_psd.open_psd_reader
+
+    def tracking_reader(path):
+        reader = open_reader(path)
+        read_layer_rgba, close = reader.read_layer_rgba, reader.close
+
+        def slow_read(record, storage="float32"):
+            time.sleep(0.05)
+            with lock:
+                events.append("decode")
+            return read_layer_rgba(record, storage)
+
+        def tracked_close():
+            with lock:
+                events.append("close")
+            close()
+
+        reader.read_layer_rgba = slow_read
+        reader.close = tracked_close
+        return reader
+
+    def failing_trim(layer):
+        raise _Abort()
+
+    monkeypatch.setattr(import_psd, "open_psd_reader", tracking_reader)
+    monkeypatch.setattr(import_psd, "trim_layer", failing_trim)
+    with pytest.raises(_Abort):
+        _import(tmp_psd, 解码线程数=2, 裁剪透明边缘=True)
+    # 关闭内存映射之后不再有解码
+    assert events[-1] == "close"
+    assert events.count("close") == 1
+
+
+pixel_source = load_animation_module("afa_pixel_source", "LayerIO", "pixel_source.py")
+
+COLOR = (200, 100, 50, 200)
+
+
+def _layer_pixels(document):
+    return [np.asarray(layer["image_data"]).astype(np.int16) for layer in document["layers"]]
+
+
+@pytest.mark.parametrize("opacity", [255, 128, 51, 0])
+def test_reader_and_psd_tools_decode_agree(tmp_psd, monkeypatch, opacity):
+    """直接读取通道与psd-tools合成得到相同的像素，图层不透明度只保存在 opacity 中"""
+    _write_psd(tmp_psd, [(COLOR, opacity)])
+    reader_document, _ = _import(tmp_psd, 解码线程数=1)
+    monkeypatch.setattr(import_psd, "open_psd_reader", lambda path: None)
+    fallback_document, _ = _import(tmp_psd, 解码线程数=1)
+
+    reader_pixels, = _layer_pixels(reader_document)
+    fallback_pixels, = _layer_pixels(fallback_document)
+    assert reader_pixels.shape == fallback_pixels.shape == (6, 8, 4)
+    np.testing.assert_array_equal(reader_pixels[0, 0], COLOR)
+    # psd-tools以不透明度255合成，不透明度为0的图层同样保留像素
+    assert np.abs(reader_pixels - fallback_pixels).max() <= 1
+    assert reader_document["layers"][0]["opacity"] == fallback_document["layers"][0]["opacity"] == pytest.approx(opacity / 255)
+
+
+def test_lazy_decode_agrees_with_import(tmp_psd):
+    _write_psd(tmp_psd, [(COLOR, 128), ((10, 20, 30, 255), 255)])
+    document, _ = _import(tmp_psd, 解码线程数=1)
+    lazy_document, _ = _import(tmp_psd, 延迟加载像素=True)
+    for layer, lazy_layer in zip(document["layers"], lazy_document["layers"]):
+        lazy_pixels = pixel_source.load_pixel_source(lazy_layer["pixel_source"], cache=False)
+        np.testing.assert_array_equal(np.asarray(lazy_pixels), np.asarray(layer["image_data"]))
+
+
+def test_masked_layer_opacity_applied_once(tmp_psd):
+    """带蒙版的图层走psd-tools合成：alpha包含蒙版但不包含图层不透明度"""
+    psd = PSDImage.new("RGBA", (16, 12))
+    layer = PixelLayer.frompil(Image.new("RGBA", (8, 6), COLOR), psd, "masked", 0, 0)
+    psd.append(layer)
+    layer.opacity = 128
+    mask = np.full((6, 8), 255, dtype=np.uint8)
+    mask[:, :4] = 0
+    layer.create_mask(Image.fromarray(mask, "L"))
+    psd.save(tmp_psd)
+
+    document, _ = _import(tmp_psd, 解码线程数=1)
+    pixels, = _layer_pixels(document)
+    alpha = pixels[..., 3]
+    assert alpha[:, :4].max() == 0
+    assert np.abs(alpha[:, 4:] - COLOR[3]).max() <= 2
+    assert document["layers"][0]["opacity"] == pytest.approx(128 / 255)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = str(tmp_path / "import_cache")
+    monkeypatch.setattr(import_psd.import_cache, "get_cache_dir", lambda: directory)
+    return directory
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """记录PSD文件被psd-tools打开的次数（命中缓存时不打开）"""
+    paths = []
+    open_psd = PSDImage.open.__func__
+
+    def counting_open(cls, path, *args, **kwargs):
+        paths.append(path)
+        return open_psd(cls, path, *args, **kwargs)
+
+    monkeypatch.setattr(PSDImage, "open", classmethod(counting_open))
+    return paths
+
+
+def test_import_cache_hit(tmp_psd, cache_dir, opened):
+    _write_psd(tmp_psd, [(COLOR, 128), ((10, 20, 30, 255), 255)])
+    document, info = _import(tmp_psd, **{"导入缓存(MB)": 64})
+    cached_document, cached_info = _import(tmp_psd, **{"导入缓存(MB)": 64})
+    assert len(opened) == 1
+    assert cached_info == info
+    assert cached_document["document_id"] != document["document_id"]
+    for pixels, cached_pixels in zip(_layer_pixels(document), _layer_pixels(cached_document)):
+        np.testing.assert_array_equal(cached_pixels, pixels)
+    assert [layer["opacity"] for layer in cached_document["layers"]] == [layer["opacity"] for layer in document["layers"]]
+    # 从缓存读取的文档同样建立了图层索引
+    assert set(cached_document["layer_index"]) == {layer["layer_id"] for layer in cached_document["layers"]}
+
+    # 影响导入结果的选项不同时不共用缓存
+    _import(tmp_psd, **{"导入缓存(MB)": 64, "存储格式": "float32"})
+    assert len(opened) == 2
+
+
+def test_import_cache_invalidated_when_file_changes(tmp_psd, cache_dir, opened):
+    _write_psd(tmp_psd, [(COLOR, 255)])
+    signature = import_psd.ImportPSDNode.IS_CHANGED(PSD文件=tmp_psd)
+    _import(tmp_psd, **{"导入缓存(MB)": 64})
+    _write_psd(tmp_psd, [((10, 20, 30, 255), 255)])
+    stat = os.stat(tmp_psd)
+    os.utime(tmp_psd, (stat.st_atime, stat.st_mtime + 10))
+    assert import_psd.ImportPSDNode.IS_CHANGED(PSD文件=tmp_psd) != signature
+
+    document, _ = _import(tmp_psd, **{"导入缓存(MB)": 64})
+    assert len(opened) == 2
+    np.testing.assert_array_equal(_layer_pixels(document)[0][0, 0], (10, 20, 30, 255))
@@ -0,0 +1,164 @@
+import os
+import threading
+
+import numpy as np
+import torch
+import pytest
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import PixelLayer
+
+from conftest import load_animation_module
+
+pixel_source = load_animation_module("afa_pixel_source", "LayerIO", "pixel_source.py")
+import_psd = load_animation_module("import_psd", "LayerIO", "import_psd.py")
+
+
+def _write_psd(path, colors, size=(16, 12)):
+    psd = PSDImage.new("RGBA", size)
+    for index, color in enumerate(colors):
+        psd.append(PixelLayer.frompil(Image.new("RGBA", (8, 6), color), psd, f"layer{index}", index, index))
+    psd.save(path)
+    return path
+
+
+def _lazy_document(path, **kwargs):
+    options = {"PSD文件": path, "导入缓存(MB)": 0, "延迟加载像素": True}
+    options.update(kwargs)
+    return import_psd.ImportPSDNode().import_psd(**options)[0]
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    pixel_source.clear_pixel_cache()
+    yield
+    pixel_source.clear_pixel_cache()
+
+
+def test_lazy_layers_decode_on_first_use(tmp_psd):
+    _write_psd(tmp_psd, [(200, 100, 50, 255), (10, 20, 30, 128)])
+    document = _lazy_document(tmp_psd)
+    layer = document["layers"][1]
+    assert layer.get("image_data") is None and layer["pixel_source"]["leaf_index"] == 1
+    pixels = pixel_source.resolve_layer_pixels(layer)
+    assert tuple(pixels.shape) == (6, 8, 4)
+    np.testing.assert_array_equal(pixels[0, 0].numpy(), (10, 20, 30, 128))
+    # 同一来源返回缓存中的同一个张量；cache=False 不放入缓存
+    assert pixel_source.resolve_layer_pixels(layer) is pixels
+    first = document["layers"][0]
+    assert pixel_source.resolve_layer_pixels(first, cache=False) is not pixel_source.resolve_layer_pixels(first, cache=False)
+
+
+def test_modified_file_raises_instead_of_decoding(tmp_psd):
+    _write_psd(tmp_psd, [(200, 100, 50, 255)])
+    document = _lazy_document(tmp_psd)
+    # 文件被改写：图层位置和尺寸已与导入时不同
+    _write_psd(tmp_psd, [(1, 2, 3, 255), (4, 5, 6, 255)], size=(20, 20))
+    stat = os.stat(tmp_psd)
+    os.utime(tmp_psd, (stat.st_atime, stat.st_mtime + 10))
+    with pytest.raises(pixel_source.StalePixelSourceError):
+        pixel_source.resolve_layer_pixels(document["layers"][0])
+
+    # 修改时间不变但文件大小变化同样视为已修改
+    document = _lazy_document(tmp_psd)
+    mtime = os.stat(tmp_psd).st_mtime
+    with open(tmp_psd, "ab") as f:
+        f.write(b"\0" * 16)
+    os.utime(tmp_psd, (mtime, mtime))
+    with pytest.raises(pixel_source.StalePixelSourceError):
+        pixel_source.load_pixel_source(document["layers"][0]["pixel_source"])
+
+
+def test_decoding_runs_outside_the_lock(tmp_psd, monkeypatch):
+    _write_psd(tmp_psd, [(200, 100, 50, 255), (10, 20, 30, 255)])
+    document = _lazy_document(tmp_psd)
+    decode = pixel_source._DECODERS["psd"]
+    both_decoding = threading.Barrier(2, timeout=5)
+
+    def checked_decode(source):
+        # 锁只保护缓存记录；两个线程必须能同时进入解码
+        assert pixel_source._lock.acquire(blocking=False)
+        pixel_source._lock.release()
+        both_decoding.wait()
+        return decode(source)
+
+    monkeypatch.setitem(pixel_source._DECODERS, "psd", checked_decode)
+    results = [None, None]
+
+    def worker(index):
+        results[index] = pixel_source.resolve_layer_pixels(document["layers"][index])
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    np.testing.assert_array_equal(results[0][0, 0].numpy(), (200, 100, 50, 255))
+    np.testing.assert_array_equal(results[1][0, 0].numpy(), (10, 20, 30, 255))
+
+
+create_layer = load_animation_module("Create_layer", "LayerEdit", "Create_layer.py")
+unpack_layer = load_animation_module("Unpack_layer", "LayerEdit", "Unpack_layer.py")
+
+
+def test_uint8_storage_round_trip():
+    quantized = torch.arange(256, dtype=torch.float32).div(255.0).reshape(16, 16, 1).expand(16, 16, 4)
+    packed = pixel_source.pack_layer_pixels(quantized, "uint8")
+    assert packed.dtype == torch.uint8
+    assert torch.equal(packed[..., 0].flatten(), torch.arange(256, dtype=torch.uint8))
+    assert torch.equal(pixel_source.pixels_to_float(packed), quantized)
+    assert pixel_source.pack_layer_pixels(packed, "uint8") is packed
+    half = pixel_source.pack_layer_pixels(packed, "float16")
+    assert half.dtype == torch.float16 and torch.equal(pixel_source.pack_layer_pixels(half, "uint8"), packed)
+
+
+def test_uint8_layers_unpack_like_float32_layers():
+    image = torch.rand(1, 12, 10, 4, generator=torch.Generator().manual_seed(0))
+    layers = {
+        storage: create_layer.CreateLayerNode().create_layer(图像=image, 名称="图层", X坐标=0, Y坐标=0, 存储格式=storage)[0]
+        for storage in ("uint8", "float32")
+    }
+    assert layers["uint8"]["image_data"].dtype == torch.uint8
+    assert layers["uint8"]["metadata"]["pixel_format"] == {"dtype": "uint8", "value_range": 255}
+    # 每像素4字节，float32为16字节
+    assert layers["float32"]["image_data"].nbytes == 4 * layers["uint8"]["image_data"].nbytes
+    unpacked = {storage: unpack_layer.UnpackLayerNode().unpack_layer(图层=layer)[0] for storage, layer in layers.items()}
+    assert unpacked["uint8"].dtype == torch.float32
+    assert torch.equal(unpacked["uint8"], unpacked["float32"])
+
+
+preview_document = load_animation_module("Preview_document", "LayerUtils", "Preview_document.py")
+
+
+def test_trim_shifts_position_to_content_bbox():
+    image = torch.zeros(1, 20, 30, 4)
+    image[0, 5:12, 7:19] = torch.tensor([0.2, 0.4, 0.6, 1.0])
+    image[0, 15, 3] = torch.tensor([1.0, 1.0, 1.0, 0.5])
+    options = dict(图像=image, 名称="图层", X坐标=40, Y坐标=30, 锚点X=0.5, 锚点Y=0.25)
+    full = create_layer.CreateLayerNode().create_layer(**options)[0]
+    trimmed = create_layer.CreateLayerNode().create_layer(裁剪透明边缘=True, **options)[0]
+
+    # alpha包围盒为 x 3~18、y 5~15；原图层左上角为 (40 - 15, 30 - 5)
+    assert trimmed["size"] == [16, 11]
+    assert tuple(trimmed["image_data"].shape) == (11, 16, 4)
+    assert trimmed["position"] == [25 + 3, 25 + 5] and trimmed["anchor"] == [0.0, 0.0]
+    assert trimmed["metadata"]["trim"] == {"offset": [3, 5], "original_size": [30, 20]}
+    assert torch.equal(trimmed["image_data"], full["image_data"][5:16, 3:19])
+
+    # 裁剪不改变合成结果
+    node = preview_document.PreviewDocumentNode()
+    renders = [
+        node.preview_document(文档={"canvas_size": [80, 60], "layers": [dict(layer, layer_id=0)]}, 合成精度=precision)[0]
+        for layer in (full, trimmed) for precision in ("uint8", "float32")
+    ]
+    assert torch.equal(renders[0], renders[2]) and torch.equal(renders[1], renders[3])
+
+
+def test_trim_edge_cases():
+    opaque = torch.ones(4, 5, 4)
+    assert pixel_source.trim_transparent_pixels(opaque) == (opaque, (0, 0))
+    empty, offset = pixel_source.trim_transparent_pixels(torch.zeros(4, 5, 4))
+    assert tuple(empty.shape) == (1, 1, 4) and offset == (0, 0)
+    layer = {"image_data": opaque, "position": [3, 4], "anchor": [0.5, 0.5]}
+    # 没有透明边缘时图层保持不变
+    assert pixel_source.trim_layer(dict(layer)) == layer
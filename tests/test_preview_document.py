@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from conftest import load_animation_module
+
+preview_document = load_animation_module("Preview_document", "LayerUtils", "Preview_document.py")
+BlendModes = preview_document.BlendModes
+
+
+def _reference_render(canvas_size, layers):
+    """改为按图层范围合成之前的整画布渲染：每个图层先贴到与画布同样大小的临时图层上再混合"""
+    canvas = Image.new("RGBA", canvas_size, (255, 255, 255, 0))
+    for layer in sorted(layers, key=lambda layer: layer["layer_id"]):
+        image = layer["image_data"].squeeze(0).numpy()
+        layer_image = Image.fromarray((np.clip(image, 0, 1) * 255).astype(np.uint8), "RGBA")
+        x, y = layer["position"]
+        anchor_x, anchor_y = layer.get("anchor", [0.0, 0.0])
+        actual_x = int(x - layer_image.size[0] * anchor_x)
+        actual_y = int(y - layer_image.size[1] * anchor_y)
+        temp_layer = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+        temp_layer.paste(layer_image, (actual_x, actual_y), layer_image)
+        blend_mode = layer.get("blend_mode", "normal")
+        if blend_mode != "normal":
+            canvas_array = np.array(canvas).astype(np.float32) / 255.0
+            temp_array = np.array(temp_layer).astype(np.float32) / 255.0
+            blended = BlendModes.apply_blend_mode(canvas_array, temp_array, blend_mode, layer.get("opacity", 1.0))
+            canvas = Image.fromarray(np.clip(blended * 255, 0, 255).astype(np.uint8), "RGBA")
+        else:
+            canvas = Image.alpha_composite(canvas, temp_layer)
+    background = Image.new("RGB", canvas_size, (255, 255, 255))
+    background.paste(canvas, mask=canvas.split()[-1])
+    return np.asarray(background)
+
+
+def _layer(layer_id, size, position, seed, blend_mode="normal", opacity=1.0, anchor=(0.0, 0.0)):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(size[1], size[0], 4)).astype(np.float32) / 255.0
+    # 图层边缘完全不透明或完全透明（半透明边缘在旧实现中会被重复应用alpha）
+    pixels[..., 3] = (rng.random((size[1], size[0])) > 0.2).astype(np.float32)
+    return {
+        "layer_id": layer_id, "name": f"图层{layer_id}", "image_data": torch.from_numpy(pixels)[None],
+        "position": list(position), "anchor": list(anchor), "opacity": opacity,
+        "blend_mode": blend_mode, "visible": True,
+    }
+
+
+@pytest.mark.parametrize("blend_mode", ["multiply", "screen", "overlay", "difference"])
+def test_bounding_box_render_matches_full_canvas_render(blend_mode):
+    layers = [
+        _layer(1, (40, 30), (-5, -4), seed=1),
+        _layer(2, (30, 20), (20, 12), seed=2, anchor=(0.5, 0.5)),
+        # 部分超出画布右下角的混合图层
+        _layer(3, (24, 24), (44, 30), seed=3, blend_mode=blend_mode, opacity=0.6),
+        _layer(4, (16, 16), (100, 100), seed=4),
+    ]
+    document = {"canvas_size": [56, 40], "layers": layers}
+    result = preview_document.PreviewDocumentNode().preview_document(文档=document, 合成精度="uint8")[0]
+    actual = (result[0].numpy() * 255).round().astype(np.int16)
+    expected = _reference_render((56, 40), layers).astype(np.int16)
+    assert np.abs(actual - expected).max() <= 1
+
+
+def _opaque_document():
+    layers = [
+        _layer(1, (40, 30), (0, 0), seed=5),
+        _layer(2, (30, 20), (10, 8), seed=6, blend_mode="multiply", opacity=0.7),
+        _layer(3, (20, 20), (30, 15), seed=7, opacity=0.5),
+    ]
+    # 底层完全不透明：浮点合成与8位合成只差量化误差
+    layers[0]["image_data"][..., 3] = 1.0
+    return {"canvas_size": [48, 36], "layers": layers}
+
+
+def test_default_precision_is_uint8():
+    node = preview_document.PreviewDocumentNode()
+    assert node.INPUT_TYPES()["optional"]["合成精度"][1]["default"] == "uint8"
+    document = _opaque_document()
+    default = node.preview_document(文档=document)[0]
+    assert torch.equal(default, node.preview_document(文档=document, 合成精度="uint8")[0])
+
+
+def test_float_precision_is_opt_in_and_close_to_uint8():
+    node = preview_document.PreviewDocumentNode()
+    document = _opaque_document()
+    uint8 = node.preview_document(文档=document, 合成精度="uint8")[0]
+    float32 = node.preview_document(文档=document, 合成精度="float32", **{"合成缓存(MB)": 0})[0]
+    assert not torch.equal(uint8, float32)
+    assert (uint8 - float32).abs().max() <= 2.0 / 255.0
+
+
+def test_frame_transforms_render_one_image_per_frame():
+    document = _opaque_document()
+    frames = json.dumps([{"2": {"position": [x, 8]}} for x in (0, 6, 12)])
+    node = preview_document.PreviewDocumentNode()
+    result = node.preview_document(文档=document, 帧变换=frames)[0]
+    assert result.shape == (3, 36, 48, 3)
+    moved = dict(document, layers=[document["layers"][0], dict(document["layers"][1], position=[6, 8]),
+                                   document["layers"][2]])
+    single = node.preview_document(文档=moved, 合成精度="float32", **{"合成缓存(MB)": 0})[0]
+    torch.testing.assert_close(result[1:2], single, atol=1e-5, rtol=0)
+    with pytest.raises(ValueError):
+        node.preview_document(文档=document, 帧变换="{not json")
+
+
+def test_tiled_compositing_is_opt_in_and_never_used_with_torch(monkeypatch):
+    node = preview_document.PreviewDocumentNode()
+    assert node.INPUT_TYPES()["optional"]["线程数"][1]["default"] == 1
+    tiled = []
+
+    class RecordingTiledCompositor(preview_document.TiledLayerCompositor):
+        def __init__(self, *args, **kwargs):
+            tiled.append(kwargs.get("workers"))
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(preview_document, "TiledLayerCompositor", RecordingTiledCompositor)
+    document = _opaque_document()
+    serial = node.preview_document(文档=document, 合成精度="float32")[0]
+    assert tiled == []
+    torch_result = node.preview_document(文档=document, 合成精度="float32", 混合后端="torch", 线程数=0)[0]
+    assert tiled == []
+    parallel = node.preview_document(文档=document, 合成精度="float32", 线程数=4)[0]
+    assert tiled == [4]
+    assert torch.equal(parallel, serial)
+    torch.testing.assert_close(torch_result, serial, atol=1e-5, rtol=0)
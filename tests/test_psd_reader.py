@@ -0,0 +1,25 @@
+import numpy as np
+from PIL import Image
+from psd_tools import PSDImage
+from psd_tools.api.layers import PixelLayer
+
+from conftest import load_animation_module
+
+psd_reader = load_animation_module("afa_psd_reader", "LayerIO", "psd_reader.py")
+
+
+def test_read_layer_rgba_returns_copy_valid_after_close(tmp_psd):
+    psd = PSDImage.new("RGBA", (16, 12))
+    psd.append(PixelLayer.frompil(Image.new("RGBA", (8, 6), (200, 100, 50, 128)), psd, "layer", 2, 3))
+    psd.save(tmp_psd)
+
+    reader = psd_reader.open_psd_reader(tmp_psd)
+    record, = reader.leaf_layers()
+    assert (record.width, record.height) == (8, 6)
+    uint8 = reader.read_layer_rgba(record, "uint8")
+    float32 = reader.read_layer_rgba(record)
+    reader.close()
+    # 结果是独立的数组，关闭文件映射后仍然有效
+    assert uint8.flags.owndata and uint8.flags.writeable
+    np.testing.assert_array_equal(uint8[0, 0], (200, 100, 50, 128))
+    np.testing.assert_allclose(float32[5, 7], np.array((200, 100, 50, 128)) / 255.0, atol=1e-6)
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+import torch
+from psd_tools import PSDImage
+
+from conftest import load_animation_module
+
+psd_writer = load_animation_module("psd_writer", "LayerIO", "psd_writer.py")
+export_psd = load_animation_module("export_psd", "LayerIO", "export_psd.py")
+create_blank_document = load_animation_module("Create_blank_document", "LayerEdit", "Create_blank_document.py")
+create_layer = load_animation_module("Create_layer", "LayerEdit", "Create_layer.py")
+add_layer_to_document = load_animation_module("Add_layer_to_document", "LayerEdit", "Add_layer_to_document.py")
+preview_document = load_animation_module("Preview_document", "LayerUtils", "Preview_document.py")
+
+
+def _random_layers(count=4, seed=0):
+    rng = np.random.default_rng(seed)
+    layers = []
+    for index in range(count):
+        rgba = rng.integers(0, 256, size=(20 + index * 7, 24 + index * 3, 4), dtype=np.uint8)
+        # 整行相同的像素让RLE产生重复段
+        rgba[:5] = 7
+        rgba[..., 3] = np.where(rng.random(rgba.shape[:2]) > 0.3, 255, 0)
+        layers.append(rgba)
+    return layers
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("compression", ["raw", "rle", "zip"])
+def test_stream_writer_round_trip(tmp_psd, compression, workers):
+    layers = _random_layers()
+    records = [{
+        "name": f"图层{index} layer",
+        "opacity": 128 if index == 1 else 255,
+        "blend_mode": "multiply" if index == 2 else "normal",
+        "visible": index != 3,
+    } for index in range(len(layers) + 1)]
+    merged = np.random.default_rng(1).integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+
+    with psd_writer.PSDStreamWriter(tmp_psd, 80, 60, compression, dpi=300, workers=workers) as writer:
+        writer.write_layer_records(records)
+        for index, rgba in enumerate(layers):
+            writer.write_layer(rgba, 10 * index - 5, 8 * index)
+        # 空图层
+        writer.write_layer(None, 0, 0)
+        writer.close(merged)
+
+    psd = PSDImage.open(tmp_psd)
+    psd_layers = list(psd)
+    assert (psd.width, psd.height) == (80, 60)
+    assert [layer.name for layer in psd_layers] == [record["name"] for record in records]
+    for index, rgba in enumerate(layers):
+        layer = psd_layers[index]
+        assert (layer.left, layer.top, layer.width, layer.height) == (10 * index - 5, 8 * index, rgba.shape[1], rgba.shape[0])
+        np.testing.assert_array_equal(np.asarray(layer.topil()), rgba)
+    assert [layer.opacity for layer in psd_layers[:4]] == [255, 128, 255, 255]
+    assert psd_layers[2].blend_mode.name == "MULTIPLY"
+    assert [layer.visible for layer in psd_layers[:4]] == [True, True, True, False]
+    assert psd_layers[4].width == 0
+    np.testing.assert_array_equal(np.asarray(psd.topil().convert("RGB")), merged)
+
+
+def test_stream_writer_abort_keeps_existing_file(tmp_psd):
+    with open(tmp_psd, "wb") as f:
+        f.write(b"old")
+    with pytest.raises(RuntimeError):
+        with psd_writer.PSDStreamWriter(tmp_psd, 8, 8, "rle", workers=2) as writer:
+            writer.write_layer_records([{"name": "a"}, {"name": "b"}])
+            writer.write_layer(np.zeros((8, 8, 4), dtype=np.uint8), 0, 0)
+            writer.close()
+    with open(tmp_psd, "rb") as f:
+        assert f.read() == b"old"
+
+
+def _build_document():
+    document = create_blank_document.CreateBlankDocumentNode().create_blank_document(宽度=64, 高度=48)[0]
+    colors = ((1.0, 0.0, 0.0, 1.0), (0.0, 0.0, 1.0, 0.8), (0.0, 1.0, 0.0, 1.0))
+    for index, color in enumerate(colors):
+        image = torch.tensor(color, dtype=torch.float32).expand(1, 24, 32, 4).clone()
+        layer = create_layer.CreateLayerNode().create_layer(
+            图像=image, 名称=f"图层{index}", X坐标=10 * index, Y坐标=6 * index,
+            不透明度=0.5 if index == 1 else 1.0,
+        )[0]
+        document = add_layer_to_document.AddLayerToDocumentNode().add_layer_to_document(文档=document, 图层=layer)[0]
+    return document
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("compression_method", ["RLE", "ZIP", "无压缩"])
+def test_export_node_round_trip(tmp_psd, compression_method, workers):
+    document = _build_document()
+    path, info = export_psd.ExportPSDAdvancedNode().export_psd_advanced(
+        文档=document, 输出路径=tmp_psd, 压缩方式=compression_method, 压缩线程数=workers, DPI=72,
+    )
+    assert path == tmp_psd, info
+    assert "流式写入" in info
+
+    psd = PSDImage.open(path)
+    psd_layers = list(psd)
+    assert [layer.name for layer in psd_layers] == ["图层0", "图层1", "图层2"]
+    assert [layer.opacity for layer in psd_layers] == [255, 128, 255]
+    for index, layer in enumerate(psd_layers):
+        assert (layer.left, layer.top, layer.width, layer.height) == (10 * index, 6 * index, 32, 24)
+    # 图层像素不包含图层不透明度
+    np.testing.assert_array_equal(np.asarray(psd_layers[1].topil())[0, 0], [0, 0, 255, 204])
+
+    # 合并图像与预览的合成结果一致
+    preview = preview_document.PreviewDocumentNode().preview_document(文档=document, **{"合成缓存(MB)": 0})[0]
+    expected = preview[0].mul(255.0).round().clamp(0, 255).to(torch.uint8).numpy()
+    merged = np.asarray(psd.topil().convert("RGB")).astype(np.int16)
+    assert np.abs(merged - expected).max() <= 1
+
+
+def test_psd_tools_fallback_warns_that_compression_threads_are_ignored(tmp_psd, capsys):
+    path, info = export_psd.ExportPSDAdvancedNode().export_psd_advanced(
+        文档=_build_document(), 输出路径=tmp_psd, 位深度=16, 压缩线程数=4, DPI=72,
+    )
+    assert path == tmp_psd, info
+    assert "忽略压缩线程数（4）" in capsys.readouterr().out
+    assert len(list(PSDImage.open(path))) == 3
+
+    export_psd.ExportPSDAdvancedNode().export_psd_advanced(
+        文档=_build_document(), 输出路径=tmp_psd, 位深度=16, 压缩线程数=1, DPI=72,
+    )
+    assert "忽略压缩线程数" not in capsys.readouterr().out